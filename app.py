@@ -1,16 +1,48 @@
 import streamlit as st
 import numpy as np
-from PIL import Image, ImageDraw, ImageFont
-import io
-import base64
 import pandas as pd
-import json
 import os
-from datetime import datetime
+import sqlite3
+
+from PIL import Image, ImageDraw
+from streamlit.errors import StreamlitAPIException
+
+from bulk_placement import MAX_ITEMS, bulk_equipment, grid_positions, inside_floor, line_angle, line_positions
+from canvas_layout import MAX_OBJECTS, canvas_changes, canvas_objects, visible_items
+from clearance import DEFAULT_CLEARANCE, ClearanceAnalyzer
+from collision import CollisionState
+from conveyor import ConveyorNetwork
+from coverage import CoverageAnalyzer
+from equipment_index import EquipmentIndex, options, page_count, table_page
+from equipment_store import EquipmentStore
+from evaluation import DEFAULT_MIN_AISLE, evaluate_layouts
+from export import EXPORT_FORMATS, export_bytes
+from fleet import STATE_LABELS, paint_vehicles, simulate_fleet
+from flow import FlowAnalyzer
+from history import EditHistory
+from layout_core import (EQUIPMENT_DEFAULTS, MAX_SIZE, MIN_SIZE, clearance_thresholds,
+                         layout_statistics, throughput_rates, type_label)
+from layout_format import (FACTORY_SIZE_RANGE, LAYOUT_FORMATS, LayoutFormatError, check_factory_size,
+                           read_layout, write_layout)
+from layout_repository import LayoutRepository
+from optimizer import optimize_layout
+from shared_layout import SharedLayoutService, SharedLayoutSession
+from profiling import StageTimer
+from raster import hex_to_rgb, paint_rectangles
+from tiles import TileRenderer, fit_level, level_scale, view_around
+
+try:
+    from streamlit_drawable_canvas import st_canvas
+except (ImportError, StreamlitAPIException):
+    # キャンバスのフロントエンドが読み込めない環境では、座標を入力して選ぶ操作に戻す
+    st_canvas = None
 
 # アプリのタイトルとデザイン設定
 st.set_page_config(page_title="工場レイアウトシミュレーター", layout="wide")
 
+# 再実行 1 回分の段階ごとの処理時間
+timer = StageTimer()
+
 # CSSでアプリのスタイルを設定
 st.markdown("""
 <style>
@@ -52,11 +84,22 @@ st.markdown("""
 
 # セッション状態の初期化
 if 'equipment_list' not in st.session_state:
-    st.session_state.equipment_list = []
+    st.session_state.equipment_list = EquipmentStore()
+if 'collision_state' not in st.session_state:
+    st.session_state.collision_state = CollisionState.from_equipment(st.session_state.equipment_list)
+if 'tile_renderer' not in st.session_state:
+    st.session_state.tile_renderer = TileRenderer()
 if 'current_layout_name' not in st.session_state:
     st.session_state.current_layout_name = "新規レイアウト"
-if 'layouts' not in st.session_state:
-    st.session_state.layouts = {}
+if 'layout_repository' not in st.session_state:
+    st.session_state.layout_repository = LayoutRepository()
+# 工場エリアの初期値（エクスポートが工場エリアの設定より先に参照する）
+if 'factory_width' not in st.session_state:
+    st.session_state.factory_width = 20.0
+if 'factory_length' not in st.session_state:
+    st.session_state.factory_length = 25.0
+if 'floor_color' not in st.session_state:
+    st.session_state.floor_color = "#CCCCCC"
 if 'show_grid' not in st.session_state:
     st.session_state.show_grid = True
 if 'show_collision' not in st.session_state:
@@ -67,6 +110,40 @@ if 'selected_equipment' not in st.session_state:
     st.session_state.selected_equipment = None
 if 'drag_mode' not in st.session_state:
     st.session_state.drag_mode = False
+if 'show_timings' not in st.session_state:
+    st.session_state.show_timings = False
+if 'flows' not in st.session_state:
+    st.session_state.flows = []
+if 'flow_analyzer' not in st.session_state:
+    st.session_state.flow_analyzer = FlowAnalyzer()
+if 'clearance_analyzer' not in st.session_state:
+    st.session_state.clearance_analyzer = ClearanceAnalyzer()
+if 'conveyor_network' not in st.session_state:
+    st.session_state.conveyor_network = ConveyorNetwork()
+if 'coverage_analyzer' not in st.session_state:
+    st.session_state.coverage_analyzer = CoverageAnalyzer()
+if 'history' not in st.session_state:
+    st.session_state.history = EditHistory()
+if 'equipment_index' not in st.session_state:
+    st.session_state.equipment_index = EquipmentIndex()
+if 'shared_session' not in st.session_state:
+    st.session_state.shared_session = None
+
+# 共有レイアウトに参加しているときは、再実行のたびに変わった設備だけを送り、
+# 他のセッションの変更を受け取って衝突状態も変わった設備だけ更新する
+if st.session_state.shared_session is not None:
+    try:
+        shared_result = st.session_state.shared_session.sync(st.session_state.equipment_list,
+                                                             st.session_state.collision_state)
+    except sqlite3.OperationalError as e:
+        shared_result = {"error": str(e)}
+    else:
+        if shared_result["renumbered"]:
+            # 設備の番号がずれたので、番号で覚えている履歴と選択は使えない
+            st.session_state.history.clear()
+            st.session_state.selected_equipment = None
+            st.session_state.pop("editing_equipment", None)
+    st.session_state.shared_result = shared_result
 
 # アプリのタイトル
 st.title("工場レイアウトシミュレーター")
@@ -78,6 +155,8 @@ col1, col2 = st.columns([2, 1])
 # サイドバー（設定パネル）
 with col2:
     st.header("設定パネル")
+    # 処理時間は最後に書き込む
+    timing_panel = st.empty()
     
     # レイアウトの保存と読み込み
     with st.expander("レイアウトの保存/読み込み", expanded=True):
@@ -87,74 +166,179 @@ with col2:
         with col_save:
             if st.button("レイアウトを保存"):
                 if layout_name:
-                    # 現在の設定とレイアウトを保存
-                    st.session_state.layouts[layout_name] = {
-                        "equipment_list": st.session_state.equipment_list.copy(),
-                        "factory_width": st.session_state.factory_width,
-                        "factory_length": st.session_state.factory_length,
-                        "floor_color": st.session_state.floor_color,
-                        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M")
-                    }
+                    # 現在の設定とレイアウトを新しい版として保存（前の版との差分だけを書く）
+                    st.session_state.layout_repository.save(
+                        layout_name,
+                        st.session_state.equipment_list,
+                        st.session_state.factory_width,
+                        st.session_state.factory_length,
+                        st.session_state.floor_color,
+                    )
                     st.session_state.current_layout_name = layout_name
                     st.success(f"レイアウト '{layout_name}' を保存しました")
         
         with col_load:
-            if st.session_state.layouts:
-                layout_options = list(st.session_state.layouts.keys())
+            repository = st.session_state.layout_repository
+            saved_layouts = repository.names()
+            if saved_layouts:
+                layout_options = [name for name, _, _ in saved_layouts]
                 selected_layout = st.selectbox("保存済みレイアウト", layout_options)
                 
+                # 選んだレイアウトの版（新しい順）
+                versions = {version_id: f"{saved_at}（{count}台）"
+                            for version_id, saved_at, count in repository.versions(selected_layout)}
+                selected_version = st.selectbox("版", list(versions), format_func=versions.get)
+                
                 if st.button("読み込む"):
-                    # 選択したレイアウトを読み込む
-                    layout_data = st.session_state.layouts[selected_layout]
-                    st.session_state.equipment_list = layout_data["equipment_list"].copy()
-                    st.session_state.factory_width = layout_data["factory_width"]
-                    st.session_state.factory_length = layout_data["factory_length"]
-                    st.session_state.floor_color = layout_data["floor_color"]
-                    st.session_state.current_layout_name = selected_layout
-                    st.success(f"レイアウト '{selected_layout}' を読み込みました")
+                    # 選択した版だけを読み込む
+                    layout_data = repository.load(version_id=selected_version)
+                    try:
+                        check_factory_size(layout_data["factory_width"], layout_data["factory_length"])
+                    except LayoutFormatError as e:
+                        st.error(f"このレイアウトは読み込めません: {e}")
+                    else:
+                        st.session_state.equipment_list = st.session_state.history.replace(
+                            st.session_state.equipment_list, layout_data["equipment_list"], "読み込み")
+                        st.session_state.collision_state.rebuild(st.session_state.equipment_list)
+                        st.session_state.factory_width = float(layout_data["factory_width"])
+                        st.session_state.factory_length = float(layout_data["factory_length"])
+                        st.session_state.floor_color = layout_data["floor_color"]
+                        st.session_state.current_layout_name = selected_layout
+                        st.success(f"レイアウト '{selected_layout}' を読み込みました")
             else:
                 st.info("保存済みレイアウトはありません")
         
-        # JSONでエクスポート/インポート
-        if st.button("JSONでエクスポート"):
-            export_data = {
-                "layout_name": st.session_state.current_layout_name,
-                "equipment_list": st.session_state.equipment_list,
-                "factory_width": st.session_state.factory_width,
-                "factory_length": st.session_state.factory_length,
-                "floor_color": st.session_state.floor_color
-            }
-            json_str = json.dumps(export_data, indent=2)
-            b64 = base64.b64encode(json_str.encode()).decode()
-            href = f'<a href="data:file/json;base64,{b64}" download="{layout_name.replace(" ", "_")}_layout.json">JSONファイルをダウンロード</a>'
-            st.markdown(href, unsafe_allow_html=True)
+        # JSON / NPZ でエクスポート/インポート
+        col_file_format, col_file_export = st.columns(2)
+        with col_file_format:
+            file_format = st.selectbox("ファイル形式", list(LAYOUT_FORMATS), format_func=str.upper,
+                                       help="NPZ は大きなレイアウトを速く読み書きできるバイナリ形式です")
+        file_args = (
+            file_format,
+            st.session_state.equipment_list,
+            st.session_state.factory_width,
+            st.session_state.factory_length,
+            st.session_state.floor_color,
+            st.session_state.current_layout_name,
+        )
+        with col_file_export:
+            # ファイルはダウンロードボタンが押されたときだけ書き出す
+            st.download_button(
+                label=f"{file_format.upper()}でエクスポート",
+                data=lambda: write_layout(*file_args),
+                file_name=f"{layout_name.replace(' ', '_')}_layout.{file_format}",
+                mime=LAYOUT_FORMATS[file_format],
+            )
         
-        uploaded_file = st.file_uploader("JSONファイルをインポート", type=["json"])
-        if uploaded_file is not None:
+        uploaded_file = st.file_uploader("レイアウトファイルをインポート", type=list(LAYOUT_FORMATS))
+        # 同じファイルを再実行のたびに読み込み直すと編集が消えるので、新しいファイルだけ取り込む
+        if uploaded_file is not None and uploaded_file.file_id != st.session_state.get("imported_file_id"):
             try:
-                import_data = json.load(uploaded_file)
-                st.session_state.equipment_list = import_data["equipment_list"]
+                import_data = read_layout(uploaded_file, size_range=FACTORY_SIZE_RANGE)
+            except LayoutFormatError as e:
+                st.error(f"インポート中にエラーが発生しました: {e}")
+            else:
+                st.session_state.equipment_list = st.session_state.history.replace(
+                    st.session_state.equipment_list, import_data["equipment_list"], "インポート")
+                st.session_state.collision_state.rebuild(st.session_state.equipment_list)
                 st.session_state.factory_width = import_data["factory_width"]
                 st.session_state.factory_length = import_data["factory_length"]
                 st.session_state.floor_color = import_data["floor_color"]
                 st.session_state.current_layout_name = import_data["layout_name"]
+                st.session_state.imported_file_id = uploaded_file.file_id
                 st.success("レイアウトを正常にインポートしました")
-            except Exception as e:
-                st.error(f"インポート中にエラーが発生しました: {e}")
+
+    # 保存済みレイアウトの比較
+    with st.expander("レイアウトの比較", expanded=False):
+        repository = st.session_state.layout_repository
+        compare_names = st.multiselect("比較するレイアウト（最新版）", [name for name, _, _ in repository.names()])
+        compare_current = st.checkbox("現在のレイアウトも比較する", value=True)
+        min_aisle = st.number_input("通路幅の基準 (m)", 0.1, 10.0, DEFAULT_MIN_AISLE, 0.1)
+
+        if st.button("一括評価", disabled=not compare_names and not compare_current):
+            candidates = [repository.load(name) for name in compare_names]
+            if compare_current:
+                candidates.append({
+                    "name": f"{st.session_state.current_layout_name}（現在）",
+                    "equipment_list": st.session_state.equipment_list,
+                    "factory_width": st.session_state.factory_width,
+                    "factory_length": st.session_state.factory_length,
+                })
+            # レイアウトごとに別のプロセスで評価する（設備の配列は共有メモリで渡す）
+            with st.spinner("評価中..."):
+                scores = evaluate_layouts(candidates, min_aisle=min_aisle)
+            st.dataframe(pd.DataFrame({
+                "レイアウト": [score["name"] for score in scores],
+                "設備数": [score["items"] for score in scores],
+                "衝突ペア数": [score["collision_pairs"] for score in scores],
+                "衝突設備数": [score["colliding_items"] for score in scores],
+                "はみ出し設備数": [score["outside_items"] for score in scores],
+                "面積使用率 (%)": [round(score["area_usage"] * 100, 1) for score in scores],
+                "最小通路幅 (m)": [round(score["min_clearance"], 2) for score in scores],
+                "通路幅不足の設備数": [score["narrow_items"] for score in scores],
+            }), hide_index=True)
+
+    # 複数のセッションで同じレイアウトを編集する
+    with st.expander("共同編集", expanded=False):
+        if 'shared_service' not in st.session_state:
+            st.session_state.shared_service = SharedLayoutService()
+        service = st.session_state.shared_service
+        shared = st.session_state.shared_session
+        if shared is None:
+            shared_name = st.text_input("共有名", st.session_state.current_layout_name)
+            if st.button("このレイアウトを共有", disabled=not shared_name):
+                session = SharedLayoutSession(service, shared_name)
+                try:
+                    session.share(st.session_state.equipment_list, st.session_state.factory_width,
+                                  st.session_state.factory_length, st.session_state.floor_color)
+                except ValueError as e:
+                    st.error(str(e))
+                else:
+                    st.session_state.shared_session = session
+                    st.rerun()
+            shared_layouts = {name: f"{name}（{count}台、版 {version}）" for name, version, count in service.names()}
+            if shared_layouts:
+                join_name = st.selectbox("共有中のレイアウト", list(shared_layouts), format_func=shared_layouts.get)
+                if st.button("参加する"):
+                    session = SharedLayoutSession(service, join_name)
+                    # 参加するときだけ全体を読み、その後は差分だけをやり取りする
+                    layout_data = session.attach()
+                    st.session_state.equipment_list = layout_data["equipment_list"]
+                    # 参加前の状態に戻すと共有レイアウトを丸ごと書き換えてしまうので、履歴は消す
+                    st.session_state.history.clear()
+                    st.session_state.collision_state.rebuild(st.session_state.equipment_list)
+                    st.session_state.factory_width = layout_data["factory_width"]
+                    st.session_state.factory_length = layout_data["factory_length"]
+                    st.session_state.floor_color = layout_data["floor_color"]
+                    st.session_state.current_layout_name = join_name
+                    st.session_state.shared_session = session
+                    st.rerun()
+        else:
+            result = st.session_state.get("shared_result", {})
+            st.write(f"**共有中:** {shared.name}（版 {shared.version}）")
+            if "error" in result:
+                st.warning(f"同期できませんでした: {result['error']}")
+            elif result:
+                st.caption(f"前回の同期: 送信 {result['sent']} 件、受信 {result['received']} 件")
+                for item_id, fields in result["conflicts"]:
+                    reason = "他のセッションで削除されていました" if fields == "deleted" else \
+                        f"{', '.join(fields)} は他のセッションの変更が先でした"
+                    st.warning(f"設備 ID {item_id} の変更を反映できませんでした（{reason}）")
+            col_sync, col_leave = st.columns(2)
+            with col_sync:
+                # 再実行の最初に同期するので、ボタンは再実行するだけでよい
+                st.button("同期")
+            with col_leave:
+                if st.button("共有をやめる"):
+                    st.session_state.shared_session = None
+                    st.session_state.pop("shared_result", None)
+                    st.rerun()
 
     # 工場エリアの設定
     with st.expander("工場エリアの設定", expanded=True):
-        # 初期値の設定（セッション状態がない場合）
-        if 'factory_width' not in st.session_state:
-            st.session_state.factory_width = 20.0
-        if 'factory_length' not in st.session_state:
-            st.session_state.factory_length = 25.0
-        if 'floor_color' not in st.session_state:
-            st.session_state.floor_color = "#CCCCCC"
-        
         # 工場サイズの設定スライダー
-        factory_width = st.slider("工場の幅 (m)", 5.0, 30.0, st.session_state.factory_width, 1.0)
-        factory_length = st.slider("工場の奥行き (m)", 5.0, 30.0, st.session_state.factory_length, 1.0)
+        factory_width = st.slider("工場の幅 (m)", *FACTORY_SIZE_RANGE, st.session_state.factory_width, 1.0)
+        factory_length = st.slider("工場の奥行き (m)", *FACTORY_SIZE_RANGE, st.session_state.factory_length, 1.0)
         
         # 色の設定
         floor_color = st.color_picker("床の色", st.session_state.floor_color)
@@ -169,33 +353,25 @@ with col2:
         st.checkbox("衝突検出表示", value=st.session_state.show_collision, key="show_collision")
         st.checkbox("設備情報表示", value=st.session_state.show_equipment_info, key="show_equipment_info")
         st.checkbox("ドラッグモード", value=st.session_state.drag_mode, key="drag_mode", help="設備をクリックして移動できます")
+        st.checkbox("処理時間を表示", value=st.session_state.show_timings, key="show_timings",
+                    help="再実行ごとに、衝突検出・描画・統計などの各段階に掛かった時間を表示します")
 
     # 設備の追加設定
     with st.expander("設備の追加", expanded=True):
-        # 設備種類のデフォルトサイズマップ
-        equipment_defaults = {
-            "robot": {"width": 2.0, "length": 2.0, "color": "#FF9800", "label": "産業用ロボット"},
-            "machine": {"width": 3.0, "length": 5.0, "color": "#2196F3", "label": "加工機械"},
-            "conveyor": {"width": 1.0, "length": 10.0, "color": "#8BC34A", "label": "コンベヤー"},
-            "workstation": {"width": 2.0, "length": 3.0, "color": "#9C27B0", "label": "作業台"},
-            "storage": {"width": 5.0, "length": 8.0, "color": "#795548", "label": "倉庫/棚"},
-            "agv": {"width": 1.5, "length": 2.5, "color": "#FFEB3B", "label": "AGV/無人搬送車"},
-            "custom": {"width": 4.0, "length": 4.0, "color": "#607D8B", "label": "カスタム設備"}
-        }
         
         # 設備の種類選択
         equipment_type = st.selectbox(
             "設備の種類",
-            list(equipment_defaults.keys()),
-            format_func=lambda x: equipment_defaults[x]["label"]
+            list(EQUIPMENT_DEFAULTS.keys()),
+            format_func=type_label
         )
         
         # 選択された設備のデフォルト値
-        defaults = equipment_defaults[equipment_type]
+        defaults = EQUIPMENT_DEFAULTS[equipment_type]
         
         # 設備のサイズと色の設定
-        equipment_width = st.slider("幅 (m)", 0.5, 20.0, defaults["width"], 0.5)
-        equipment_length = st.slider("長さ (m)", 0.5, 20.0, defaults["length"], 0.5)
+        equipment_width = st.slider("幅 (m)", MIN_SIZE, MAX_SIZE, defaults["width"], 0.5)
+        equipment_length = st.slider("長さ (m)", MIN_SIZE, MAX_SIZE, defaults["length"], 0.5)
         equipment_color = st.color_picker("色", defaults["color"])
         
         # 回転角度
@@ -223,257 +399,525 @@ with col2:
                 "y": equipment_y,
                 "rotation": equipment_rotation,
                 "label": equipment_label,
-                "id": len(st.session_state.equipment_list)
+                # 削除した設備の id とも重ならない番号を振る
+                "id": int(st.session_state.equipment_list.new_ids()[0])
             }
             
-            st.session_state.equipment_list.append(new_equipment)
+            st.session_state.history.append(st.session_state.equipment_list, new_equipment)
+            st.session_state.collision_state.add(new_equipment)
             st.success(f"{equipment_label}を追加しました！")
             # アニメーション効果を追加
             st.balloons()
 
+    # 同じ設備を格子状・線に沿ってまとめて並べる
+    with st.expander("一括配置", expanded=False):
+        st.caption("「設備の追加」で選んだ種類・サイズ・色・回転・ラベルの設備をまとめて並べます")
+        bulk_pattern = st.radio("並べ方", ["格子", "線に沿って"], horizontal=True)
+        if bulk_pattern == "格子":
+            col_rows, col_columns = st.columns(2)
+            with col_rows:
+                bulk_rows = st.number_input("行数", 1, 1000, 5)
+                bulk_pitch_y = st.number_input("行の間隔 (m)", 0.1, 100.0, float(equipment_length) + 2.0, 0.5)
+                bulk_x = st.number_input("先頭の X (m)", 0.0, factory_width, min(float(equipment_width), factory_width), 0.5)
+            with col_columns:
+                bulk_columns = st.number_input("列数", 1, 1000, 5)
+                bulk_pitch_x = st.number_input("列の間隔 (m)", 0.1, 100.0, float(equipment_width) + 0.5, 0.5)
+                bulk_y = st.number_input("先頭の Y (m)", 0.0, factory_length, min(float(equipment_length), factory_length), 0.5)
+            bulk_angle = st.slider("格子の向き (度)", 0, 359, 0, 15)
+            bulk_xs, bulk_ys = grid_positions(bulk_x, bulk_y, bulk_rows, bulk_columns, bulk_pitch_x, bulk_pitch_y,
+                                              bulk_angle)
+            bulk_rotation = equipment_rotation + bulk_angle
+        else:
+            col_start, col_end = st.columns(2)
+            with col_start:
+                bulk_x0 = st.number_input("始点の X (m)", 0.0, factory_width, 0.0, 0.5)
+                bulk_y0 = st.number_input("始点の Y (m)", 0.0, factory_length, 0.0, 0.5)
+            with col_end:
+                bulk_x1 = st.number_input("終点の X (m)", 0.0, factory_width, factory_width, 0.5)
+                bulk_y1 = st.number_input("終点の Y (m)", 0.0, factory_length, 0.0, 0.5)
+            bulk_count = st.number_input("台数", 1, MAX_ITEMS, 10)
+            bulk_along = st.checkbox("線の向きに合わせて回転", value=False)
+            bulk_xs, bulk_ys = line_positions(bulk_x0, bulk_y0, bulk_x1, bulk_y1, bulk_count)
+            bulk_rotation = equipment_rotation + (line_angle(bulk_x0, bulk_y0, bulk_x1, bulk_y1) if bulk_along else 0)
+
+        # 中心が工場の外になる位置には置かない（位置の入力欄で扱えない設備を作らない）
+        inside = inside_floor(bulk_xs, bulk_ys, factory_width, factory_length)
+        bulk_xs, bulk_ys = bulk_xs[inside], bulk_ys[inside]
+        outside = int((~inside).sum())
+        too_many = len(bulk_xs) > MAX_ITEMS
+        st.write(f"{len(bulk_xs)} 台を配置します" + (f"（一度に配置できるのは {MAX_ITEMS} 台までです）" if too_many else ""))
+        if outside:
+            st.warning(f"{outside} 台は中心が工場の外になるので配置しません")
+        if st.button("一括配置", disabled=too_many or not len(bulk_xs)):
+            store = st.session_state.equipment_list
+            template = {"type": equipment_type, "width": equipment_width, "length": equipment_length,
+                        "color": equipment_color, "label": equipment_label}
+            added = bulk_equipment(store, template, bulk_xs, bulk_ys, bulk_rotation)
+            start = len(store)
+            # 列のまま一度に追加し（元に戻すときも 1 回）、衝突状態も追加した設備の分をまとめて更新する
+            st.session_state.history.extend(store, added)
+            st.session_state.collision_state.extend(store, start)
+            st.success(f"{len(added)} 台を配置しました")
+
+    # 自動配置
+    with st.expander("自動配置", expanded=False):
+        optimize_gap = st.number_input("設備間の間隔 (m)", 0.0, 10.0, 0.5, 0.5)
+        optimize_rotate = st.checkbox("90度回転を許可", value=True)
+        optimize_restarts = st.slider("探索の数", 1, 16, 4, help="複数のプロセスで並列に探索し、最もよい配置を使います")
+
+        if st.button("自動配置を実行", disabled=not st.session_state.equipment_list):
+            with st.spinner("配置を探索中..."):
+                result = optimize_layout(
+                    st.session_state.equipment_list,
+                    factory_width,
+                    factory_length,
+                    rotations=(0, 90) if optimize_rotate else (0,),
+                    gap=optimize_gap,
+                    restarts=optimize_restarts,
+                    time_limit=10.0,
+                )
+            st.session_state.equipment_list = st.session_state.history.replace(
+                st.session_state.equipment_list, result["equipment_list"], "自動配置")
+            st.session_state.collision_state.rebuild(st.session_state.equipment_list)
+            unplaced = int((~result["placed"]).sum())
+            if unplaced:
+                st.warning(f"{unplaced} 台の設備は工場に収まらなかったため元の位置のままです")
+            else:
+                st.success(f"すべての設備を重ならないように配置しました（無駄な面積: {result['cost']:.1f} m²）")
+
+    # 動線解析
+    with st.expander("動線解析", expanded=False):
+        store = st.session_state.equipment_list
+        if store:
+            # 設備は id で指定する（同じ id が複数あるときは先頭の設備）
+            equipment_names = {}
+            for equipment_id, label in zip(store.ids.tolist(), store.strings("label").tolist()):
+                equipment_names.setdefault(equipment_id, f"{label} (#{equipment_id})")
+            col_from, col_to = st.columns(2)
+            with col_from:
+                flow_from = st.selectbox("搬送元", list(equipment_names), format_func=equipment_names.get)
+            with col_to:
+                flow_to = st.selectbox("搬送先", list(equipment_names), format_func=equipment_names.get)
+            flow_rate = st.number_input("搬送回数 (回/時)", 0.0, 10000.0, 10.0, 1.0)
+            if st.button("動線を追加"):
+                st.session_state.flows.append({"from": flow_from, "to": flow_to, "rate": flow_rate})
+        
+        if st.session_state.flows:
+            # 障害物（設備）を避けた最短距離。距離場はレイアウトごとに覚えているので再計算は変わった分だけ
+            results = st.session_state.flow_analyzer.analyze(
+                store, factory_width, factory_length, st.session_state.flows)
+            names = {equipment_id: label for equipment_id, label
+                     in zip(store.ids.tolist(), store.strings("label").tolist())}
+            st.dataframe(pd.DataFrame({
+                "搬送元": [names.get(result["from"], f"#{result['from']}") for result in results],
+                "搬送先": [names.get(result["to"], f"#{result['to']}") for result in results],
+                "回数 (回/時)": [result["rate"] for result in results],
+                "距離 (m)": [round(result["distance"], 1) for result in results],
+                "加重距離 (m/時)": [round(result["weighted"], 1) for result in results],
+            }), hide_index=True)
+            reachable = [result["weighted"] for result in results if np.isfinite(result["distance"])]
+            st.write(f"**総搬送距離:** {sum(reachable):.1f} m/時")
+            if len(reachable) < len(results):
+                st.warning(f"{len(results) - len(reachable)} 件の動線は経路が見つかりません（設備が囲まれているか削除されています）")
+            st.checkbox("経路をレイアウト図に表示", value=True, key="show_flows")
+            if st.button("動線をすべて削除"):
+                st.session_state.flows = []
+                st.rerun()
+
+    # 安全距離の検査
+    clearance_result = None
+    with st.expander("安全距離の検査", expanded=False):
+        # 種類ごとの安全距離（既定値は設備の種類の設定）。表で直接変更できる
+        default_thresholds = clearance_thresholds()
+        threshold_table = st.data_editor(
+            pd.DataFrame({"種類": [type_label(t) for t in default_thresholds],
+                          "安全距離 (m)": list(default_thresholds.values())}),
+            disabled=["種類"],
+            hide_index=True,
+            column_config={"安全距離 (m)": st.column_config.NumberColumn(min_value=0.0, step=0.1)},
+            key="clearance_table",
+        )
+        thresholds = dict(zip(default_thresholds,
+                              threshold_table["安全距離 (m)"].fillna(DEFAULT_CLEARANCE).astype(float)))
+        store = st.session_state.equipment_list
+        if st.checkbox("安全距離を検査する", key="check_clearance") and store:
+            with timer.stage("安全距離"):
+                clearance_result = st.session_state.clearance_analyzer.analyze(
+                    store, factory_width, factory_length, thresholds)
+            violations = clearance_result["violations"]
+            if violations:
+                labels = store.strings("label")
+                st.warning(f"安全距離に満たない場所が {len(violations)} 件あります")
+                # 表示は狭い順に先頭 500 件まで
+                shown = violations[:500]
+                st.dataframe(pd.DataFrame({
+                    "設備": [labels[v["item"]] for v in shown],
+                    "相手": ["壁" if v["other"] is None else labels[v["other"]] for v in shown],
+                    "必要 (m)": [v["required"] for v in shown],
+                    "隙間 (m)": [round(v["clearance"], 2) for v in shown],
+                    "X (m)": [round(v["x"], 1) for v in shown],
+                    "Y (m)": [round(v["y"], 1) for v in shown],
+                    "面積 (m²)": [round(v["area"], 2) for v in shown],
+                }), hide_index=True)
+                st.checkbox("狭い場所をレイアウト図に表示", value=True, key="show_clearance")
+            else:
+                st.success("すべての設備の周りに安全距離が確保されています")
+
+    # コンベヤーラインの接続とスループット
+    line_result = None
+    with st.expander("コンベヤーライン", expanded=False):
+        # 種類ごとの処理能力（既定値は設備の種類の設定）。表で直接変更できる
+        default_rates = throughput_rates()
+        rate_table = st.data_editor(
+            pd.DataFrame({"種類": [type_label(t) for t in default_rates],
+                          "処理能力 (個/時)": list(default_rates.values())}),
+            disabled=["種類"],
+            hide_index=True,
+            column_config={"処理能力 (個/時)": st.column_config.NumberColumn(min_value=0.0, step=10.0)},
+            key="rate_table",
+        )
+        rates = dict(zip(default_rates, rate_table["処理能力 (個/時)"].fillna(0.0).astype(float)))
+        store = st.session_state.equipment_list
+        if st.checkbox("ラインを解析する", key="check_lines") and store:
+            # 接続と流量は変わった設備を含むラインだけ計算し直す
+            with timer.stage("ライン"):
+                line_result = st.session_state.conveyor_network.analyze(store, rates)
+            if line_result["lines"]:
+                labels = store.strings("label")
+                st.dataframe(pd.DataFrame({
+                    "ライン": list(range(1, len(line_result["lines"]) + 1)),
+                    "設備数": [len(line["items"]) for line in line_result["lines"]],
+                    "スループット (個/時)": [round(line["throughput"], 1) for line in line_result["lines"]],
+                    "ボトルネック": [", ".join(labels[i] for i in line["bottlenecks"]) for line in line_result["lines"]],
+                    "詰まり": [int(line_result["blocked"][line["items"]].sum()) for line in line_result["lines"]],
+                }), hide_index=True)
+                st.caption("詰まりはボトルネックより上流でバッファが満杯になる設備の数です")
+                st.checkbox("接続とボトルネックをレイアウト図に表示", value=True, key="show_lines")
+            else:
+                st.info("端点が接しているコンベヤーと設備がありません")
+
+    # AGV の走行シミュレーション
+    with st.expander("AGV シミュレーション", expanded=False):
+        store = st.session_state.equipment_list
+        if not st.session_state.flows:
+            st.info("動線解析で搬送を追加すると、その搬送を AGV で回したときの様子を調べられます")
+        else:
+            agv_count = int((store.strings("type") == "agv").sum()) if store else 0
+            col_fleet1, col_fleet2 = st.columns(2)
+            with col_fleet1:
+                fleet_size = st.number_input("AGV の台数", 1, 500, max(agv_count, 5), 1)
+                shift_hours = st.number_input("シフト (時間)", 0.5, 24.0, 8.0, 0.5)
+            with col_fleet2:
+                agv_speed = st.number_input("速度 (m/s)", 0.1, 5.0, 1.0, 0.1)
+                handling_time = st.number_input("荷役時間 (秒)", 0.0, 600.0, 30.0, 5.0)
+            st.caption(f"レイアウト上の AGV {agv_count} 台の位置から出発します（足りない分は搬送元から出発）")
+            if st.button("シミュレーションを実行"):
+                with timer.stage("AGV"):
+                    st.session_state.fleet_result = simulate_fleet(
+                        store, factory_width, factory_length, st.session_state.flows, vehicles=fleet_size,
+                        shift_hours=shift_hours, speed=agv_speed, handling_time=handling_time,
+                        analyzer=st.session_state.flow_analyzer)
+                st.session_state.fleet_frame = 0
+
+        fleet_result = st.session_state.get("fleet_result")
+        if fleet_result is not None:
+            st.write(f"**搬送完了:** {fleet_result['delivered']} / {fleet_result['requested']} 件"
+                     f"（{fleet_result['throughput']:.1f} 件/時）")
+            st.write(f"**干渉:** {fleet_result['conflicts']} 回（すれ違えずに通した回数 {fleet_result['overrides']}）")
+            if fleet_result["unreachable"]:
+                st.warning(f"経路が見つからず取りやめた搬送が {fleet_result['unreachable']} 件あります")
+            st.dataframe(pd.DataFrame({
+                "状態": list(fleet_result["utilization"]),
+                "割合 (%)": [round(share * 100, 1) for share in fleet_result["utilization"].values()],
+            }), hide_index=True)
+            if fleet_result["hot_spots"]:
+                st.write("**混雑箇所（待ち時間の長い順）**")
+                st.dataframe(pd.DataFrame({
+                    "X (m)": [round(spot["x"], 1) for spot in fleet_result["hot_spots"]],
+                    "Y (m)": [round(spot["y"], 1) for spot in fleet_result["hot_spots"]],
+                    "待ち時間 (秒)": [round(spot["wait"]) for spot in fleet_result["hot_spots"]],
+                }), hide_index=True)
+            frame_times = fleet_result["frames"]["time"]
+            if len(frame_times) > 1:
+                # 再生はフレームの番号で選ぶ。背景のレイアウト図はタイルの描画を覚えているので描き直さない
+                frame = st.slider("再生位置", 0, len(frame_times) - 1, key="fleet_frame")
+                st.caption(f"開始から {frame_times[frame] / 60:.1f} 分")
+                st.checkbox("AGV をレイアウト図に表示", value=True, key="show_fleet")
+                st.caption(" / ".join(STATE_LABELS))
+
     # 統計情報
     with st.expander("統計情報", expanded=True):
         if st.session_state.equipment_list:
-            total_area = sum(item["width"] * item["length"] for item in st.session_state.equipment_list)
-            factory_area = factory_width * factory_length
-            area_usage = (total_area / factory_area) * 100
+            with timer.stage("統計"):
+                statistics = layout_statistics(st.session_state.equipment_list, factory_width, factory_length,
+                                               analyzer=st.session_state.coverage_analyzer)
             
             st.markdown('<div class="stats-container">', unsafe_allow_html=True)
-            st.write(f"**設備の数:** {len(st.session_state.equipment_list)}")
-            st.write(f"**総設備面積:** {total_area:.1f} m²")
-            st.write(f"**工場総面積:** {factory_area:.1f} m²")
-            st.write(f"**面積使用率:** {area_usage:.1f}%")
+            st.write(f"**設備の数:** {statistics['items']}")
+            st.write(f"**総設備面積:** {statistics['total_area']:.1f} m²（幅 x 長さ の合計）")
+            st.write(f"**占有面積:** {statistics['covered_area']:.1f} m²（重なり {statistics['overlap_area']:.1f} m²）")
+            st.write(f"**空き面積:** {statistics['free_area']:.1f} m²")
+            st.write(f"**工場総面積:** {statistics['factory_area']:.1f} m²")
+            st.write(f"**面積使用率:** {statistics['area_usage']:.1f}%")
             
             # 設備タイプごとの統計
-            equipment_counts = {}
-            for item in st.session_state.equipment_list:
-                equipment_type = item["type"]
-                label = equipment_defaults[equipment_type]["label"]
-                if label in equipment_counts:
-                    equipment_counts[label] += 1
-                else:
-                    equipment_counts[label] = 1
-            
-            if equipment_counts:
+            if statistics["type_counts"]:
                 st.write("**設備タイプ別の数:**")
-                for label, count in equipment_counts.items():
-                    st.write(f"- {label}: {count}")
+                for label, count in statistics["type_counts"].items():
+                    st.write(f"- {label}: {count}（{statistics['type_areas'][label]:.1f} m²）")
             
             st.markdown('</div>', unsafe_allow_html=True)
+            
+            # 区画ごとの密度（白: 空き -> 赤: 埋まっている）
+            density = statistics["density"]
+            shade = (255 * (1 - density)).astype(np.uint8)
+            heatmap = np.dstack([np.full_like(shade, 255), shade, shade])
+            zoom = max(1, 240 // max(density.shape))
+            st.image(Image.fromarray(heatmap).resize((density.shape[1] * zoom, density.shape[0] * zoom),
+                                                     Image.NEAREST),
+                     caption=f"{statistics['zone_size']:g} m 四方の区画ごとの密度")
 
 # メイン表示エリア（レイアウト図）
 with col1:
     # 表示するレイアウトのサイズ計算と描画関数
     scale_factor = 20  # 1mあたりのピクセル数
     
-    # 設備の衝突検出関数
-    def detect_collisions(equipment_list):
-        collisions = []
-        for i, equip1 in enumerate(equipment_list):
-            for j, equip2 in enumerate(equipment_list[i+1:], i+1):
-                # 簡易的な衝突チェック（回転を考慮していない）
-                # より複雑なレイアウトでは回転を考慮した衝突検出が必要
-                x1_min = equip1["x"] - equip1["width"]/2
-                x1_max = equip1["x"] + equip1["width"]/2
-                y1_min = equip1["y"] - equip1["length"]/2
-                y1_max = equip1["y"] + equip1["length"]/2
-                
-                x2_min = equip2["x"] - equip2["width"]/2
-                x2_max = equip2["x"] + equip2["width"]/2
-                y2_min = equip2["y"] - equip2["length"]/2
-                y2_max = equip2["y"] + equip2["length"]/2
-                
-                # 重なりがあれば衝突
-                if (x1_min < x2_max and x1_max > x2_min and
-                    y1_min < y2_max and y1_max > y2_min):
-                    collisions.append((i, j))
-        return collisions
-    
-    # レイアウト図を描画する関数
-    def render_layout():
-        # 工場エリアのサイズを計算（ピクセル単位）
-        width_px = int(st.session_state.factory_width * scale_factor)
-        length_px = int(st.session_state.factory_length * scale_factor)
-        
-        # 新しい画像を作成
-        factory_image = Image.new('RGB', (width_px, length_px), color="#FFFFFF")
-        draw = ImageDraw.Draw(factory_image)
-        
-        # 床を描画
-        draw.rectangle([0, 0, width_px, length_px], fill=st.session_state.floor_color)
-        
-        # グリッドを描画（オプション）
-        if st.session_state.show_grid:
-            grid_color = "#AAAAAA"
-            # 縦線
-            for x in range(0, width_px + 1, scale_factor):
-                draw.line([(x, 0), (x, length_px)], fill=grid_color, width=1)
-            # 横線
-            for y in range(0, length_px + 1, scale_factor):
-                draw.line([(0, y), (width_px, y)], fill=grid_color, width=1)
-        
-        # 衝突検出
-        collisions = []
-        if st.session_state.show_collision:
-            collisions = detect_collisions(st.session_state.equipment_list)
-        
-        # フォントの設定
-        try:
-            # フォントサイズを取得するためのダミーフォント
-            font = ImageFont.load_default()
-            big_font = ImageFont.load_default()
-        except Exception:
-            font = ImageFont.load_default()
-            big_font = ImageFont.load_default()
-        
-        # 設備を描画
-        for i, equipment in enumerate(st.session_state.equipment_list):
-            # 設備のサイズと位置を計算
-            width_eq = int(equipment["width"] * scale_factor)
-            length_eq = int(equipment["length"] * scale_factor)
-            x_eq = int(equipment["x"] * scale_factor)
-            y_eq = int(equipment["y"] * scale_factor)
-            
-            # 衝突している設備かどうかをチェック
-            is_collision = any(i in collision for collision in collisions)
-            
-            # 回転を考慮した描画
-            angle_rad = np.radians(equipment["rotation"])
-            cos_theta = np.cos(angle_rad)
-            sin_theta = np.sin(angle_rad)
-            
-            # 回転した四角形の頂点を計算
-            half_width = width_eq / 2
-            half_length = length_eq / 2
-            
-            # 四つの頂点
-            points = [
-                (-half_width, -half_length),  # 左上
-                (half_width, -half_length),   # 右上
-                (half_width, half_length),    # 右下
-                (-half_width, half_length)    # 左下
-            ]
-            
-            # 回転を適用して中心に移動
-            rotated_points = []
-            for px, py in points:
-                rx = px * cos_theta - py * sin_theta + x_eq
-                ry = px * sin_theta + py * cos_theta + y_eq
-                rotated_points.append((rx, ry))
-            
-            # 多角形を描画（衝突していれば赤い縁取り）
-            fill_color = equipment["color"]
-            outline_color = "#FF0000" if is_collision else "#000000"
-            outline_width = 3 if is_collision else 1
-            
-            draw.polygon(rotated_points, fill=fill_color, outline=outline_color)
-            
-            # 設備情報の表示（オプション）
-            if st.session_state.show_equipment_info:
-                # 設備番号とラベル
-                label = f"{i+1}: {equipment['label']}"
-                
-                # テキストサイズの取得 (古いtextsizeメソッドを使わず、代わりに推定サイズを計算)
-                font_size = 12
-                text_width = len(label) * font_size * 0.6  # 文字あたりの幅を推定
-                text_height = font_size
-                
-                # テキストが設備内に収まるか確認
-                if text_width < width_eq - 10 and text_height < length_eq - 10:
-                    text_x = x_eq - text_width/2
-                    text_y = y_eq - text_height/2
-                    # テキスト背景を描画して読みやすくする
-                    text_bg = [(text_x-2, text_y-2), (text_x+text_width+2, text_y+text_height+2)]
-                    draw.rectangle(text_bg, fill="#FFFFFFAA")  # 半透明の白背景
-                    draw.text((text_x, text_y), label, fill="#000000")
-                else:
-                    # 収まらない場合は番号だけ
-                    draw.text((x_eq - 5, y_eq - 5), str(i+1), fill="#000000")
-        
-        # 枠線
-        draw.rectangle([0, 0, width_px-1, length_px-1], fill=None, outline="#000000", width=2)
-        
-        return factory_image
+    # 衝突している設備の番号
+    def colliding_equipment():
+        if not st.session_state.show_collision:
+            return set()
+        collision_state = st.session_state.collision_state
+        # 想定外の経路でリストが差し替えられていれば作り直す
+        if len(collision_state) != len(st.session_state.equipment_list):
+            collision_state.rebuild(st.session_state.equipment_list)
+        return collision_state.colliding()
+    
+    # 表示範囲のレイアウト図を描画する関数（掛かるタイルだけを描く）
+    def render_view(view, level, colliding):
+        return st.session_state.tile_renderer.render_view(
+            st.session_state.equipment_list,
+            st.session_state.factory_width,
+            st.session_state.factory_length,
+            st.session_state.floor_color,
+            view,
+            level,
+            colliding=colliding,
+            show_grid=st.session_state.show_grid,
+            show_equipment_info=st.session_state.show_equipment_info,
+        )
+    
+    # ドラッグ＆ドロップ用のキャンバス。ドラッグはブラウザの中で行い、マウスを離したときの
+    # 結果だけが届く。届いたときはページ全体ではなくこの部分だけを再実行する
+    @st.fragment
+    def layout_canvas(view, level):
+        store = st.session_state.equipment_list
+        scale = level_scale(level)
+        indices = visible_items(store, view, scale)
+        if len(indices) > MAX_OBJECTS:
+            st.warning(f"表示範囲に設備が {len(indices)} 台あります。{MAX_OBJECTS} 台以下になるまで拡大するとドラッグできます")
+            st.image(render_view(view, level, colliding_equipment()), width="stretch")
+            return
+        # 背景は床とグリッドだけを描き、設備はキャンバスの矩形として描く
+        background = st.session_state.tile_renderer.render_view(
+            EquipmentStore(), st.session_state.factory_width, st.session_state.factory_length,
+            st.session_state.floor_color, view, level, show_grid=st.session_state.show_grid,
+            show_equipment_info=False)
+        result = st_canvas(
+            background_image=background,
+            initial_drawing={"objects": canvas_objects(store, indices, view, scale, colliding_equipment())},
+            drawing_mode="rect",
+            update_streamlit=True,
+            width=background.width,
+            height=background.height,
+            key=f"layout_canvas_{view}",
+        )
+        changes = canvas_changes((result.json_data or {}).get("objects", []), store, indices, view, scale)
+        if changes is None:
+            st.warning("キャンバス上では設備を削除できません。削除は設備一覧から行ってください")
+        elif changes:
+            # 一度に届いた変更をまとめて反映し（元に戻すときも 1 回で戻る）、変わった設備だけ衝突状態を更新する
+            with st.session_state.history.step("ドラッグ"):
+                for index, geometry in changes.items():
+                    st.session_state.history.set_fields(store, index, geometry)
+                    st.session_state.collision_state.update(index, store[index])
+            st.rerun(scope="fragment")
+        st.caption("ツールバーの編集をオンにすると設備をドラッグで移動・回転できます。"
+                   "一覧や統計はページ全体が更新されたときに反映されます")
     
     # 設備のドラッグ＆ドロップ処理
-    def handle_click(x, y):
+    def handle_click(x_m, y_m):
         if not st.session_state.drag_mode:
             return
             
-        # クリック位置をメートル単位に変換
-        x_m = x / scale_factor
-        y_m = y / scale_factor
-        
-        # クリックされた設備を特定
-        for i, equip in enumerate(st.session_state.equipment_list):
-            # 設備の範囲を計算
-            half_width = equip["width"] / 2
-            half_length = equip["length"] / 2
-            
-            # 簡易的な判定（回転は考慮していません）
-            if (abs(x_m - equip["x"]) <= half_width and 
-                abs(y_m - equip["y"]) <= half_length):
-                st.session_state.selected_equipment = i
-                # リロードしてUIを更新
-                st.experimental_rerun()
-                return
+        # クリックされた設備を特定（衝突検出のグリッドで候補を絞り、回転を考慮して一番上の設備を選ぶ）
+        collision_state = st.session_state.collision_state
+        if len(collision_state) != len(st.session_state.equipment_list):
+            collision_state.rebuild(st.session_state.equipment_list)
+        hit = collision_state.hit_test(x_m, y_m)
+        if hit is not None:
+            st.session_state.selected_equipment = hit
+            # リロードしてUIを更新
+            st.rerun()
+            return
         
         # 何も選択されていない場合
         if st.session_state.selected_equipment is not None:
             # 選択中の設備を移動
             equip = st.session_state.equipment_list[st.session_state.selected_equipment]
-            equip["x"] = x_m
-            equip["y"] = y_m
+            st.session_state.history.set_fields(st.session_state.equipment_list, st.session_state.selected_equipment,
+                                                {"x": x_m, "y": y_m}, "移動")
+            st.session_state.collision_state.update(st.session_state.selected_equipment, equip)
             st.session_state.selected_equipment = None
             # リロードしてUIを更新
-            st.experimental_rerun()
+            st.rerun()
     
     # レイアウト図の表示
     st.subheader("工場レイアウト図")
     
+    # 元に戻す / やり直す
+    history = st.session_state.history
+    col_undo, col_redo = st.columns(2)
+    with col_undo:
+        undo = st.button(f"元に戻す（{history.undo_label()}）" if history.can_undo else "元に戻す",
+                         disabled=not history.can_undo)
+    with col_redo:
+        redo = st.button(f"やり直す（{history.redo_label()}）" if history.can_redo else "やり直す",
+                         disabled=not history.can_redo)
+    if undo or redo:
+        step = history.undo if undo else history.redo
+        # 衝突状態は戻した操作が触れた設備だけを更新する
+        st.session_state.equipment_list = step(st.session_state.equipment_list,
+                                               st.session_state.collision_state)
+        # 番号がずれるかもしれないので選択と編集中の設備は解除する
+        st.session_state.selected_equipment = None
+        st.session_state.pop("editing_equipment", None)
+        st.rerun()
+    
     # ドラッグモードの説明
-    if st.session_state.drag_mode:
-        st.info("ドラッグモードがオンです。設備をクリックして選択し、別の場所をクリックして移動できます。")
+    if st.session_state.drag_mode and st_canvas is not None:
+        st.info("ドラッグモードがオンです。設備をドラッグして移動できます。")
+    elif st.session_state.drag_mode:
+        st.info("ドラッグで動かすには streamlit-drawable-canvas が必要です。"
+                "代わりに座標 (m) を入力して設備を選択し、移動先の座標を入力して移動できます。")
         if st.session_state.selected_equipment is not None:
             selected_name = st.session_state.equipment_list[st.session_state.selected_equipment]["label"]
-            st.warning(f"選択中の設備: {selected_name} - 移動先をクリックしてください。")
+            st.warning(f"選択中の設備: {selected_name} - 移動先の座標を入力してください。")
+    
+    # 表示倍率と表示位置。全体が収まる倍率より拡大したときは表示範囲だけを描く
+    fit = fit_level(factory_width, factory_length)
+    col_zoom, col_center_x, col_center_y = st.columns(3)
+    with col_zoom:
+        zoom_level = st.select_slider("表示倍率", options=list(range(fit, -1, -1)), value=fit,
+                                      format_func=lambda level: f"{level_scale(level):g} px/m")
+    view_scale = level_scale(zoom_level)
+    if zoom_level == fit:
+        view = (0, 0, int(factory_width * view_scale), int(factory_length * view_scale))
+    else:
+        with col_center_x:
+            center_x = st.slider("表示中心 X (m)", 0.0, factory_width, factory_width / 2, 1.0)
+        with col_center_y:
+            center_y = st.slider("表示中心 Y (m)", 0.0, factory_length, factory_length / 2, 1.0)
+        view = view_around(center_x, center_y, zoom_level)
     
     # レイアウト画像を生成
-    layout_image = render_layout()
+    with timer.stage("衝突検出"):
+        colliding = colliding_equipment()
+    with timer.stage("描画"):
+        layout_image = render_view(view, zoom_level, colliding)
+    
+    # 動線の最短経路を重ねて描く
+    if st.session_state.flows and st.session_state.get("show_flows", True):
+        with timer.stage("動線"):
+            flow_draw = ImageDraw.Draw(layout_image)
+            for flow in st.session_state.flows:
+                path = st.session_state.flow_analyzer.path(
+                    st.session_state.equipment_list, factory_width, factory_length, flow["from"], flow["to"])
+                if len(path) > 1:
+                    points = path * view_scale - np.array(view[:2])
+                    flow_draw.line([tuple(point) for point in points.tolist()], fill="#E91E63", width=3)
+    
+    # 安全距離に満たないセルを重ねて塗る
+    if clearance_result is not None and len(clearance_result["x"]) and st.session_state.get("show_clearance", True):
+        with timer.stage("安全距離"):
+            pixels = np.array(layout_image)
+            cell_size = st.session_state.clearance_analyzer.resolution * view_scale
+            cell_x = clearance_result["x"] * view_scale - view[0]
+            cell_y = clearance_result["y"] * view_scale - view[1]
+            visible = ((cell_x > -cell_size) & (cell_x < pixels.shape[1] + cell_size)
+                       & (cell_y > -cell_size) & (cell_y < pixels.shape[0] + cell_size))
+            count = int(visible.sum())
+            narrow_rgb = hex_to_rgb(["#FF5722"])[0]
+            paint_rectangles(pixels, cell_x[visible], cell_y[visible], np.full(count, cell_size),
+                             np.full(count, cell_size), np.zeros(count), narrow_rgb, narrow_rgb)
+            layout_image = Image.fromarray(pixels)
     
-    # 画像のサイズを取得
-    img_width, img_height = layout_image.size
+    # コンベヤーラインの接続（中心どうしを結ぶ線）とボトルネックを重ねて描く
+    if line_result is not None and line_result["lines"] and st.session_state.get("show_lines", True):
+        with timer.stage("ライン"):
+            store = st.session_state.equipment_list
+            centers = np.column_stack([store.x, store.y]) * view_scale - np.array(view[:2])
+            line_draw = ImageDraw.Draw(layout_image)
+            for a, b in st.session_state.conveyor_network.edges(store).tolist():
+                line_draw.line([tuple(centers[a]), tuple(centers[b])], fill="#3F51B5", width=2)
+                line_draw.ellipse([centers[b][0] - 3, centers[b][1] - 3, centers[b][0] + 3, centers[b][1] + 3],
+                                  fill="#3F51B5")
+            for index in np.flatnonzero(line_result["bottleneck"]).tolist():
+                x, y = centers[index]
+                line_draw.ellipse([x - 8, y - 8, x + 8, y + 8], outline="#F44336", width=3)
+    
+    # AGV シミュレーションの再生フレームを重ねて描く
+    fleet_result = st.session_state.get("fleet_result")
+    if fleet_result is not None and len(fleet_result["frames"]["time"]) and st.session_state.get("show_fleet", True):
+        with timer.stage("AGV"):
+            pixels = np.array(layout_image)
+            frame = min(st.session_state.get("fleet_frame", 0), len(fleet_result["frames"]["time"]) - 1)
+            paint_vehicles(pixels, fleet_result, frame, view, view_scale)
+            layout_image = Image.fromarray(pixels)
     
     # ドラッグ＆ドロップ用のインタラクティブキャンバス
-    if st.session_state.drag_mode:
+    if st.session_state.drag_mode and st_canvas is not None:
+        layout_canvas(view, zoom_level)
+    elif st.session_state.drag_mode:
         # プレースホルダーを作成して画像を表示
         image_placeholder = st.empty()
-        image_placeholder.image(layout_image, use_column_width=True)
+        image_placeholder.image(layout_image, width="stretch")
         
-        # 画像上でのクリックイベントを処理
-        if st.button("画像をクリック"):
-            st.write("画面上の位置をクリックしてください")
-            
-            # クリックイベントを取得するために、画像上にクリック可能なエリアを重ねる
-            clicked = st.button("画像をクリックしてください")
-            if clicked:
-                # ここでクリック位置を取得 (簡易的な実装)
-                # 実際にはJavaScriptとの連携が必要
-                handle_click(img_width/2, img_height/2)
+        # 画像のクリック位置は取れないので、座標を入力してその位置をクリックしたものとして扱う
+        col_click_x, col_click_y, col_click = st.columns(3)
+        with col_click_x:
+            click_x = st.number_input("X 座標 (m)", 0.0, float(factory_width), float(factory_width) / 2, 0.5)
+        with col_click_y:
+            click_y = st.number_input("Y 座標 (m)", 0.0, float(factory_length), float(factory_length) / 2, 0.5)
+        with col_click:
+            if st.button("この位置を選択 / 移動"):
+                handle_click(click_x, click_y)
     else:
         # 通常表示（非ドラッグモード）
-        st.image(layout_image, use_column_width=True)
+        st.image(layout_image, width="stretch")
     
-    # ダウンロードボタン
-    layout_bytes = io.BytesIO()
-    layout_image.save(layout_bytes, format='PNG')
-    layout_bytes = layout_bytes.getvalue()
+    # ダウンロードボタン（押されたときだけ書き出す）
+    col_format, col_resolution = st.columns(2)
+    with col_format:
+        export_format = st.selectbox("ダウンロード形式", list(EXPORT_FORMATS), format_func=str.upper)
+    with col_resolution:
+        export_scale = st.select_slider("解像度 (px/m)", options=[5, 10, 20, 40, 80], value=scale_factor)
+    export_args = (
+        export_format,
+        st.session_state.equipment_list,
+        factory_width,
+        factory_length,
+        floor_color,
+        colliding,
+        st.session_state.show_grid,
+        st.session_state.show_equipment_info,
+        export_scale,
+    )
     
     st.download_button(
         label="レイアウト図をダウンロード",
-        data=layout_bytes,
-        file_name=f"{st.session_state.current_layout_name.replace(' ', '_')}.png",
-        mime="image/png",
+        data=lambda: export_bytes(*export_args),
+        file_name=f"{st.session_state.current_layout_name.replace(' ', '_')}.{export_format}",
+        mime=EXPORT_FORMATS[export_format],
     )
 
     # 配置済み設備リスト
@@ -481,48 +925,62 @@ with col1:
     if not st.session_state.equipment_list:
         st.info("設備がまだ配置されていません。サイドバーから設備を追加してください。")
     else:
-        # 設備一覧をデータフレームとして表示
-        equipment_data = []
-        for i, eq in enumerate(st.session_state.equipment_list):
-            equipment_data.append({
-                "ID": i + 1,
-                "設備名": eq["label"],
-                "タイプ": equipment_defaults[eq["type"]]["label"],
-                "幅 (m)": eq["width"],
-                "長さ (m)": eq["length"],
-                "X位置 (m)": eq["x"],
-                "Y位置 (m)": eq["y"],
-                "回転 (度)": eq["rotation"]
-            })
+        store = st.session_state.equipment_list
+        # 検索で絞り込み、表は見ているページの行だけを作る（選択肢も検索結果の先頭だけ）
+        col_search, col_type, col_region = st.columns([2, 1, 1])
+        with col_search:
+            search_text = st.text_input("設備を検索", placeholder="設備名の一部、または一覧の番号")
+        with col_type:
+            present_types = [t for t, count in zip(store.table("type"),
+                                                   np.bincount(store.codes("type"), minlength=len(store.table("type"))))
+                             if count]
+            search_type = st.selectbox("種類", [None] + present_types,
+                                       format_func=lambda t: "すべて" if t is None else type_label(t))
+        with col_region:
+            in_view = st.checkbox("表示範囲の設備だけ", help="レイアウト図に表示している範囲に掛かる設備だけを一覧にします")
+        region = None
+        if in_view:
+            region = (view[0] / view_scale, view[1] / view_scale,
+                      (view[0] + view[2]) / view_scale, (view[1] + view[3]) / view_scale)
         
-        df = pd.DataFrame(equipment_data)
-        st.dataframe(df)
+        with timer.stage("一覧表"):
+            matches = st.session_state.equipment_index.search(store, search_text, search_type, region)
+            pages = page_count(matches)
+            page = st.number_input(f"ページ（全 {pages} ページ、{len(matches)} 台）", 1, pages, 1) - 1 \
+                if pages > 1 else 0
+            df = table_page(store, matches, page)
+        st.dataframe(df, hide_index=True)
+        
+        choices = options(store, matches)
+        if len(matches) > len(choices):
+            st.caption(f"当てはまる設備が {len(matches)} 台あります。選択肢には先頭の {len(choices)} 台だけを表示するので、"
+                       "検索で絞り込んでください")
         
         # 設備の編集と削除
-        equipment_to_edit = st.selectbox("編集または削除する設備を選択", range(1, len(st.session_state.equipment_list) + 1), format_func=lambda x: f"{x}: {st.session_state.equipment_list[x-1]['label']}")
+        eq_index = st.selectbox("編集または削除する設備を選択", list(choices), format_func=choices.get)
         
-        if equipment_to_edit:
-            eq_index = equipment_to_edit - 1
-            selected_eq = st.session_state.equipment_list[eq_index]
+        if eq_index is not None:
+            selected_eq = store[eq_index]
             
             col_edit, col_delete, col_move = st.columns(3)
             
             with col_edit:
                 if st.button("選択した設備を編集"):
                     st.session_state.editing_equipment = eq_index
-                    st.experimental_rerun()
+                    st.rerun()
             
             with col_delete:
                 if st.button("選択した設備を削除"):
-                    st.session_state.equipment_list.pop(eq_index)
+                    st.session_state.history.pop(store, eq_index)
+                    st.session_state.collision_state.remove(eq_index)
                     st.success("設備を削除しました")
-                    st.experimental_rerun()
+                    st.rerun()
                     
             with col_move:
                 if st.button("位置を変更"):
                     st.session_state.selected_equipment = eq_index
                     st.session_state.drag_mode = True
-                    st.experimental_rerun()
+                    st.rerun()
 
         # ドラッグ操作の代わりになる位置調整
         if not st.session_state.drag_mode:
@@ -532,21 +990,18 @@ with col1:
             col_sel, col_x, col_y = st.columns(3)
             
             with col_sel:
-                selected_item = st.selectbox(
-                    "移動する設備", 
-                    range(len(st.session_state.equipment_list)), 
-                    format_func=lambda i: f"{i+1}: {st.session_state.equipment_list[i]['label']}"
-                )
+                selected_item = st.selectbox("移動する設備", list(choices), format_func=choices.get)
             
             if selected_item is not None:
-                eq = st.session_state.equipment_list[selected_item]
+                eq = store[selected_item]
                 
                 with col_x:
+                    # 工場の外にある設備（読み込んだレイアウトなど）は入力欄の範囲に収めて表示する
                     new_x = st.number_input(
                         "X位置 (m)", 
                         0.0, 
                         st.session_state.factory_width,
-                        eq["x"], 
+                        min(max(eq["x"], 0.0), st.session_state.factory_width), 
                         0.5
                     )
                 
@@ -555,15 +1010,15 @@ with col1:
                         "Y位置 (m)", 
                         0.0, 
                         st.session_state.factory_length,
-                        eq["y"], 
+                        min(max(eq["y"], 0.0), st.session_state.factory_length), 
                         0.5
                     )
                 
                 if st.button("位置を更新"):
-                    eq["x"] = new_x
-                    eq["y"] = new_y
+                    st.session_state.history.set_fields(store, selected_item, {"x": new_x, "y": new_y}, "移動")
+                    st.session_state.collision_state.update(selected_item, eq)
                     st.success("設備の位置を更新しました")
-                    st.experimental_rerun()
+                    st.rerun()
 
 # 設備編集モーダル（別途実装が必要）
 if 'editing_equipment' in st.session_state:
@@ -572,24 +1027,51 @@ if 'editing_equipment' in st.session_state:
     
     st.sidebar.header(f"設備の編集: {eq['label']}")
     
-    # 編集フォーム
-    eq["label"] = st.sidebar.text_input("設備名", eq["label"])
-    eq["width"] = st.sidebar.slider("幅 (m)", 0.5, 20.0, eq["width"], 0.5)
-    eq["length"] = st.sidebar.slider("長さ (m)", 0.5, 20.0, eq["length"], 0.5)
-    eq["color"] = st.sidebar.color_picker("色", eq["color"])
-    eq["rotation"] = st.sidebar.slider("回転 (度)", 0, 359, eq["rotation"], 15)
-    eq["x"] = st.sidebar.number_input("X位置 (m)", 0.0, st.session_state.factory_width, eq["x"], 0.5)
-    eq["y"] = st.sidebar.number_input("Y位置 (m)", 0.0, st.session_state.factory_length, eq["y"], 0.5)
+    # 編集フォーム（保存したときに、変えた項目だけを 1 段階として履歴に記録して反映する）。
+    # 入力欄の範囲の外にある値（工場の外の設備や線の向きに合わせた回転）は範囲に収めて表示し、
+    # 触らなかった項目は元の値のまま残す
+    shown = {
+        "label": eq["label"],
+        "width": min(max(eq["width"], MIN_SIZE), MAX_SIZE),
+        "length": min(max(eq["length"], MIN_SIZE), MAX_SIZE),
+        "color": eq["color"],
+        "rotation": int(round(eq["rotation"])) % 360,
+        "x": min(max(eq["x"], 0.0), st.session_state.factory_width),
+        "y": min(max(eq["y"], 0.0), st.session_state.factory_length),
+    }
+    edited = {
+        "label": st.sidebar.text_input("設備名", shown["label"]),
+        "width": st.sidebar.slider("幅 (m)", MIN_SIZE, MAX_SIZE, shown["width"], 0.5),
+        "length": st.sidebar.slider("長さ (m)", MIN_SIZE, MAX_SIZE, shown["length"], 0.5),
+        "color": st.sidebar.color_picker("色", shown["color"]),
+        "rotation": st.sidebar.slider("回転 (度)", 0, 359, shown["rotation"], 15),
+        "x": st.sidebar.number_input("X位置 (m)", 0.0, st.session_state.factory_width, shown["x"], 0.5),
+        "y": st.sidebar.number_input("Y位置 (m)", 0.0, st.session_state.factory_length, shown["y"], 0.5),
+    }
+    edited = {key: value for key, value in edited.items() if value != shown[key]}
     
     if st.sidebar.button("変更を保存"):
-        st.session_state.equipment_list[eq_index] = eq
+        if st.session_state.history.set_fields(st.session_state.equipment_list, eq_index, edited):
+            # 変更された設備の近傍だけ衝突状態を更新
+            st.session_state.collision_state.update(eq_index, eq)
         del st.session_state.editing_equipment
         st.sidebar.success("設備を更新しました")
-        st.experimental_rerun()
+        st.rerun()
     
     if st.sidebar.button("キャンセル"):
         del st.session_state.editing_equipment
-        st.experimental_rerun()
+        st.rerun()
+
+# 段階ごとの処理時間（設定パネルの先頭に表示）
+if st.session_state.show_timings:
+    timings = timer.summary()
+    with timing_panel.container():
+        st.caption(f"処理時間（設備 {len(st.session_state.equipment_list)} 台、"
+                   f"再実行全体 {timer.elapsed() * 1000:.1f} ms）")
+        st.dataframe(pd.DataFrame({
+            "段階": list(timings),
+            "時間 (ms)": [total["seconds"] * 1000 for total in timings.values()],
+        }), hide_index=True)
 
 # フッター
 st.markdown("""
@@ -623,21 +1105,39 @@ with st.expander("使い方ガイド"):
     
     4. **設備の移動**
        - 「位置を変更」ボタンをクリックして設備を選択します
-       - ドラッグモードがオンになるので、移動先をクリックします
+       - ドラッグモードがオンになるので、レイアウト図の上で設備をドラッグして移動・回転します（ツールバーの編集をオンにします）
        - または「設備の位置調整」セクションで座標を直接入力します
     
     5. **レイアウトの保存と読み込み**
        - レイアウト名を入力し「レイアウトを保存」をクリックします
        - 保存したレイアウトは「保存済みレイアウト」から選択して読み込めます
-       - レイアウトはJSONファイルとしてエクスポート/インポートもできます
+       - 保存するたびに新しい版として記録され、過去の版も選んで読み込めます（保存先は layouts.sqlite3）
+       - 「レイアウトの比較」で複数の保存済みレイアウトと現在のレイアウトを一括評価し、衝突・面積使用率・通路幅を表で比べられます
+       - レイアウトはJSONファイル、または大きなレイアウト向けのバイナリ形式 (NPZ) としてエクスポート/インポートもできます
+    
+    6. **自動配置**
+       - 「自動配置」の「自動配置を実行」で、設備が重ならず工場に収まる配置を探して並べ直します
+       - 設備間の間隔と 90 度回転の可否を指定できます
     
-    6. **レイアウト図の保存**
-       - 「レイアウト図をダウンロード」ボタンで現在のレイアウトを画像として保存できます
+    7. **動線解析**
+       - 「動線解析」で搬送元・搬送先の設備と搬送回数を指定して動線を追加します
+       - 設備を避けた最短経路の距離と、搬送回数を掛けた加重距離の合計を確認できます
+    
+    8. **レイアウト図の保存**
+       - 「レイアウト図をダウンロード」ボタンで現在のレイアウトを画像 (PNG) または図面 (SVG / PDF) として保存できます
     
     ### 追加機能
     
     - **衝突検出**: 設備が重なっている場合、赤い枠線で表示されます
-    - **統計情報**: 面積使用率や設備タイプ別の数などの情報を確認できます
+    - **統計情報**: 設備が実際に占める面積（重なりは二重に数えない）・空き面積・面積使用率、設備タイプ別の数と面積、区画ごとの密度を確認できます
+    - **安全距離の検査**: 設備の種類ごとの安全距離より狭い設備の間や壁際を一覧にし、レイアウト図に塗って表示します
+    - **コンベヤーライン**: 端点が接しているコンベヤーと設備をつないでラインとし、種類ごとの処理能力からラインのスループット・ボトルネック・詰まる設備を表示します。設備を動かしたときは変わったラインだけ計算し直します
+    - **AGV シミュレーション**: 動線解析の搬送を指定した台数の AGV でシフトの間回し、搬送件数・干渉の回数・混雑箇所を表示します。再生位置のスライダーで AGV の動きをレイアウト図上で確認できます
+    - **処理時間表示**: 「処理時間を表示」をオンにすると、衝突検出・描画などの段階ごとの処理時間が設定パネルの先頭に表示されます
+    - **共同編集**: 「このレイアウトを共有」で共有レイアウトを作り、他の人は「参加する」で同じレイアウトを開きます。画面が更新されるたびに変わった設備だけをやり取りし、同じ設備の同じ項目を同時に変えたときは先に保存された方が残ります（保存先は shared_layouts.sqlite3）
+    - **一括配置**: 「設備の追加」で選んだ設備を、行数・列数・間隔・向きを指定した格子や、始点と終点を結ぶ線に沿ってまとめて並べます（数千台の棚も 1 回で配置できます）
+    - **設備一覧の検索**: 設備一覧は設備名・一覧の番号・種類・レイアウト図の表示範囲で絞り込み、ページごとに表示します。編集・削除・位置調整で選ぶ設備も検索結果から選びます
+    - **元に戻す / やり直す**: レイアウト図の上のボタンで、追加・削除・移動・編集・読み込み・自動配置を 1 操作ずつ元に戻したりやり直したりできます（ドラッグでまとめて動かした設備は 1 回で戻ります）
     - **複数レイアウト管理**: 異なるレイアウトを保存・比較できます
     """)
 
@@ -648,12 +1148,19 @@ with st.expander("開発者ノート"):
     
     - 完全なドラッグ＆ドロップ機能の実装（JavaScriptとの連携が必要）
     - 3D表示オプション
-    - 動線解析ツール
     - 設備間の接続/関係性の定義
     - レイアウトテンプレート機能
     - 設備タイプのカスタマイズオプション
-    - 複数のレイアウト比較機能
-    
+
+    ### コマンドラインでの利用
+
+    エクスポートしたレイアウトファイルは、Streamlit を起動せずに検査・集計・書き出しができます。
+
+    - `python -m layout_cli check layouts/*.npz`（衝突やはみ出しがあれば終了コード 1）
+    - `python -m layout_cli stats layout.json`
+    - `python -m layout_cli lines layout.npz`（コンベヤーラインごとのスループットとボトルネック）
+    - `python -m layout_cli export layout.npz layout.pdf`
+
     ### フィードバック
     
     このアプリケーションは継続的に改善されています。ご要望やバグ報告をいただければ幸いです。
@@ -0,0 +1 @@
+"""レイアウト処理のベンチマーク群（リポジトリのルートから python -m で実行する）"""
@@ -0,0 +1,67 @@
+"""一括配置のベンチマーク: 棚の格子を 1 台ずつ追加する方法と、列でまとめて追加する方法
+
+合成レイアウトに --rows x --columns の棚の格子（半分ほどは既存の設備と重なる位置）を追加し、
+1 台ずつ append して衝突状態を add で更新する方法と、bulk_equipment で列を作って
+extend し、衝突状態を CollisionState.extend でまとめて更新する方法の時間を比べる。
+衝突している設備が作り直した衝突状態と一致し、id が重ならないことも確かめる。
+
+    python -m benchmarks.bench_bulk [--sizes 1000 20000] [--rows 40] [--columns 50]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import generate_layout
+from bulk_placement import bulk_equipment, grid_positions
+from collision import CollisionState
+from equipment_store import EquipmentStore
+
+RACK = {"type": "storage", "width": 1.0, "length": 2.0, "color": "#795548", "label": "ラック"}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 20000])
+    parser.add_argument("--rows", type=int, default=40)
+    parser.add_argument("--columns", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    print(f"{'items':>7} {'added':>6} {'one by one [ms]':>16} {'bulk [ms]':>10} {'colliding':>10} "
+          f"{'same':>5} {'unique ids':>10}")
+    for n in args.sizes:
+        records, factory_width, factory_length = generate_layout(n, seed=args.seed)
+        base = EquipmentStore.from_records(records)
+        # 途中の設備を消しても id が重ならないことを確かめるため、末尾の設備を消しておく
+        for _ in range(10):
+            base.pop()
+        xs, ys = grid_positions(factory_width / 4, factory_length / 4, args.rows, args.columns, 1.5, 3.0)
+
+        store = base.copy()
+        state = CollisionState.from_equipment(store)
+        start = time.perf_counter()
+        ids = store.new_ids(len(xs))
+        for k, (x, y) in enumerate(zip(xs.tolist(), ys.tolist())):
+            record = dict(RACK, x=x, y=y, rotation=0, id=int(ids[k]), label=f"ラック {k + 1}")
+            store.append(record)
+            state.add(record)
+        colliding_loop = state.colliding()
+        loop = (time.perf_counter() - start) * 1000
+
+        store = base.copy()
+        state = CollisionState.from_equipment(store)
+        start = time.perf_counter()
+        first = len(store)
+        store.extend(bulk_equipment(store, RACK, xs, ys))
+        state.extend(store, first)
+        colliding = state.colliding()
+        bulk = (time.perf_counter() - start) * 1000
+
+        same = colliding == colliding_loop == CollisionState.from_equipment(store).colliding()
+        unique = len(np.unique(store.ids)) == len(store)
+        print(f"{n:>7} {len(xs):>6} {loop:16.1f} {bulk:10.1f} {len(colliding):>10} {str(same):>5} {str(unique):>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""安全距離の検査のベンチマーク: 広い工場を細かいセルで検査する時間
+
+合成レイアウトの設備を指定した広さの工場に散らばせ、種類ごとの既定の安全距離で検査する。
+比較として、工場全体をセルに分けた場合のセル数も表示する。
+
+    python -m benchmarks.bench_clearance [--items 1000 2000 5000] [--floor 300 500] [--resolution 0.1]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import generate_layout
+from clearance import ClearanceAnalyzer
+from equipment_store import EquipmentStore
+from layout_core import clearance_thresholds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, nargs="+", default=[1000, 2000, 5000])
+    parser.add_argument("--floor", type=float, nargs=2, default=[300.0, 500.0],
+                        metavar=("WIDTH", "LENGTH"))
+    parser.add_argument("--resolution", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    factory_width, factory_length = args.floor
+    full_cells = int(factory_width / args.resolution) * int(factory_length / args.resolution)
+    print(f"floor {factory_width:g} x {factory_length:g} m at {args.resolution:g} m, "
+          f"{full_cells / 1e6:.1f} M cells for the whole floor")
+    print(f"{'items':>6} {'usage':>6} {'first [ms]':>11} {'cached [ms]':>12} {'violations':>11} {'cells':>9}")
+    thresholds = clearance_thresholds()
+    for n in args.items:
+        records, _, _ = generate_layout(n, seed=args.seed, rotations=(0, 45, 90))
+        store = EquipmentStore.from_records(records)
+        rng = np.random.default_rng(args.seed)
+        store.x[:] = rng.uniform(0, factory_width, n)
+        store.y[:] = rng.uniform(0, factory_length, n)
+        usage = float((store.width * store.length).sum()) / (factory_width * factory_length)
+
+        analyzer = ClearanceAnalyzer(resolution=args.resolution)
+        start = time.perf_counter()
+        result = analyzer.analyze(store, factory_width, factory_length, thresholds)
+        first = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        analyzer.analyze(store, factory_width, factory_length, thresholds)
+        cached = (time.perf_counter() - start) * 1000
+        print(f"{n:>6} {usage:>6.0%} {first:11.1f} {cached:12.2f} {len(result['violations']):>11} "
+              f"{len(result['x']):>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""衝突検出のベンチマーク: グリッド方式と従来の全ペア比較、SAT 狭域判定、差分更新
+
+    python -m benchmarks.bench_collisions [--sizes 100 1000 10000 50000] [--naive-limit 10000]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import generate_layout
+from collision import (CollisionState, detect_collisions, detect_collisions_naive,
+                       equipment_arrays, sat_overlap)
+
+
+def _time(func, *args, repeat=1):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000, 50000])
+    parser.add_argument("--naive-limit", type=int, default=10000,
+                        help="この件数を超えると従来実装の計測を省略する")
+    parser.add_argument("--sat-pairs", type=int, default=10000,
+                        help="SAT 狭域判定の計測に使う候補ペア数")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    print(f"{'items':>8} {'grid [ms]':>12} {'naive [ms]':>12} {'speedup':>9} {'pairs':>8}")
+    for n in args.sizes:
+        equipment_list, _, _ = generate_layout(n, seed=args.seed)
+        grid_time, grid_pairs = _time(detect_collisions, equipment_list, repeat=3)
+        if n <= args.naive_limit:
+            naive_time, naive_pairs = _time(detect_collisions_naive, equipment_list)
+            if naive_pairs != grid_pairs:
+                raise SystemExit(f"結果が一致しません (n={n})")
+            naive_col = f"{naive_time * 1000:12.1f}"
+            speedup = f"{naive_time / grid_time:8.1f}x"
+        else:
+            naive_col = f"{'skipped':>12}"
+            speedup = f"{'-':>9}"
+        print(f"{n:>8} {grid_time * 1000:12.1f} {naive_col} {speedup} {len(grid_pairs):>8}")
+
+    # 回転ありのレイアウトで SAT 狭域判定だけを計測
+    equipment_list, _, _ = generate_layout(args.sat_pairs, seed=args.seed,
+                                           rotations=range(0, 360, 15))
+    rng = np.random.default_rng(args.seed)
+    pairs = np.sort(rng.integers(0, len(equipment_list), (args.sat_pairs, 2)), axis=1)
+    arrays = equipment_arrays(equipment_list)
+    sat_time, hits = _time(sat_overlap, pairs, *arrays, repeat=5)
+    print(f"SAT narrow phase: {args.sat_pairs} pairs in {sat_time * 1000:.2f} ms "
+          f"({int(hits.sum())} overlapping)")
+
+    # 1 台ずつ動かしたときの差分更新
+    n = max(args.sizes)
+    equipment_list, _, _ = generate_layout(n, seed=args.seed)
+    build_time, state = _time(CollisionState.from_equipment, equipment_list)
+    moves = 1000
+    start = time.perf_counter()
+    for k in range(moves):
+        index = (k * 7919) % n
+        equipment_list[index] = dict(equipment_list[index], x=equipment_list[index]["x"] + 0.5)
+        state.update(index, equipment_list[index])
+    update_time = (time.perf_counter() - start) / moves
+    if state.pairs() != detect_collisions(equipment_list):
+        raise SystemExit("差分更新の結果が一括判定と一致しません")
+    print(f"Incremental: build {build_time * 1000:.1f} ms, "
+          f"{update_time * 1000:.3f} ms per single-item move ({n} items)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""コンベヤーラインの解析のベンチマーク: 最初の解析と、設備 1 台を動かした後の解析
+
+投入機械 -> コンベヤー数本 -> 加工機械 -> コンベヤー数本 -> 作業台 の直線のラインを
+並べ、途中に合流するラインも混ぜる。最初の解析・同じレイアウトでの再解析・コンベヤー
+1 本を少し動かした後の解析（そのラインだけ解き直す）の時間を表示し、動かした後の結果が
+何も覚えていない状態から解析した結果と一致することを確かめる。
+
+    python -m benchmarks.bench_conveyor [--segments 1000 10000] [--per-line 20]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from conveyor import ConveyorNetwork
+from equipment_store import EquipmentStore
+
+RATES = {"machine": 60.0, "conveyor": 1200.0, "workstation": 40.0}
+
+
+def generate_lines(segments, per_line, seed=0):
+    """縦に流れるラインを横に並べた設備リスト（コンベヤーの総数が segments）"""
+    rng = np.random.default_rng(seed)
+    records = []
+
+    def add(equipment_type, x, y, width, length, rotation=0):
+        records.append({"type": equipment_type, "x": x, "y": y, "width": width, "length": length,
+                        "rotation": rotation, "color": "#8BC34A", "label": equipment_type, "id": len(records)})
+
+    line = 0
+    while segments > 0:
+        x = line * 6.0
+        lengths = rng.uniform(2.0, 6.0, per_line)
+        y = 5.0
+        add("machine", x, y - 2.5, 3.0, 5.0)
+        for k, length in enumerate(lengths):
+            add("conveyor", x, y + length / 2, 1.0, length)
+            if k == 0 and line % 5 == 4:
+                # 右から 1 本目の側面に合流するコンベヤー（90 度回転で -x 向きに流れる）
+                add("conveyor", x + 1.5, y + length / 2, 1.0, 2.0, 90)
+            y += length
+            if k == per_line // 2:
+                add("machine", x, y + 2.5, 3.0, 5.0)
+                y += 5.0
+        add("workstation", x, y + 1.5, 2.0, 3.0)
+        segments -= per_line
+        line += 1
+    return records
+
+
+def _timed(function):
+    start = time.perf_counter()
+    result = function()
+    return (time.perf_counter() - start) * 1000, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--segments", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--per-line", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    print(f"{'segments':>8} {'items':>6} {'lines':>5} {'first [ms]':>11} {'again [ms]':>11} "
+          f"{'edit [ms]':>10} {'solved':>6} {'fresh [ms]':>11} {'same':>5}")
+    for segments in args.segments:
+        store = EquipmentStore.from_records(generate_lines(segments, args.per_line))
+        network = ConveyorNetwork()
+        first, result = _timed(lambda: network.analyze(store, RATES))
+        again, _ = _timed(lambda: network.analyze(store, RATES))
+        # 1 本目のラインのコンベヤーを少し動かす
+        store[3]["x"] = store[3]["x"] + 0.1
+        edit, result = _timed(lambda: network.analyze(store, RATES))
+        solved = network.evaluated
+        fresh, expected = _timed(lambda: ConveyorNetwork().analyze(store, RATES))
+        same = all(np.array_equal(result[key], expected[key], equal_nan=True)
+                   for key in ("throughput", "occupancy", "bottleneck", "blocked"))
+        print(f"{segments:>8} {len(store):>6} {len(result['lines']):>5} {first:11.1f} {again:11.1f} "
+              f"{edit:10.1f} {solved:>6} {fresh:11.1f} {str(same):>5}")
+
+
+if __name__ == "__main__":
+    main()
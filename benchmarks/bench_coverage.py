@@ -0,0 +1,73 @@
+"""占有面積の集計のベンチマーク: セルに塗って数える方法と、1 台ずつ判定する方法
+
+回転ありの合成レイアウトで、coverage_statistics（全設備のセルを一括で数える）の時間と、
+CoverageAnalyzer に同じレイアウトをもう一度渡したとき（覚えておいた結果を返す）の時間を表示する。
+--check を付けると、設備ごとにセルの中心が矩形の内側かを判定する素朴な方法と
+占有面積・重なり面積を比べる。辺がちょうどセルの中心を通るセルは計算の丸めでどちらにも
+なり得るので、矩形を少し縮めた結果と少し広げた結果の間に入っていれば一致とみなす
+（遅いので小さい設備数で使う）。
+
+    python -m benchmarks.bench_coverage [--sizes 1000 10000 50000] [--density 0.6] [--check]
+"""
+import argparse
+import math
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import generate_layout
+from coverage import CoverageAnalyzer
+from equipment_store import EquipmentStore
+
+
+def _naive(store, factory_width, factory_length, resolution, margin=0.0):
+    """1 台ずつセルの中心を判定して、占有セル数と重なりセル数を数える（margin はセル単位で広げる幅）"""
+    scale = 1.0 / resolution
+    rows = max(int(math.ceil(factory_length * scale - 0.5)), 1)
+    columns = max(int(math.ceil(factory_width * scale - 0.5)), 1)
+    row, column = np.mgrid[0:rows, 0:columns]
+    px, py = column.ravel() + 0.5, row.ravel() + 0.5
+    counts = np.zeros(rows * columns, dtype=np.int32)
+    for x, y, w, l, rot in zip(*(column * scale for column in store.arrays()[:4]), store.rotation):
+        angle = math.radians(rot)
+        dx, dy = px - x, py - y
+        counts += ((np.abs(dx * math.cos(angle) + dy * math.sin(angle)) <= w / 2 + margin)
+                   & (np.abs(-dx * math.sin(angle) + dy * math.cos(angle)) <= l / 2 + margin))
+    return int((counts > 0).sum()), int((counts > 1).sum())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--density", type=float, default=0.6)
+    parser.add_argument("--resolution", type=float, default=0.1)
+    parser.add_argument("--check", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    print(f"{'items':>7} {'cell [m]':>8} {'first [ms]':>11} {'cached [ms]':>12} {'nominal':>10} "
+          f"{'covered':>10} {'overlap':>9} {'same':>5}")
+    for n in args.sizes:
+        records, factory_width, factory_length = generate_layout(
+            n, seed=args.seed, density=args.density, rotations=tuple(range(0, 360, 15)))
+        store = EquipmentStore.from_records(records)
+        analyzer = CoverageAnalyzer(resolution=args.resolution)
+        start = time.perf_counter()
+        result = analyzer.analyze(store, factory_width, factory_length)
+        first = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        analyzer.analyze(store, factory_width, factory_length)
+        cached = (time.perf_counter() - start) * 1000
+        same = ""
+        if args.check:
+            cell_area = result["resolution"] ** 2
+            inner = _naive(store, factory_width, factory_length, result["resolution"], -1e-6)
+            outer = _naive(store, factory_width, factory_length, result["resolution"], 1e-6)
+            counts = (round(result["covered_area"] / cell_area), round(result["overlap_area"] / cell_area))
+            same = str(all(low <= count <= high for low, count, high in zip(inner, counts, outer)))
+        print(f"{n:>7} {result['resolution']:8.3f} {first:11.1f} {cached:12.2f} {result['nominal_area']:10.0f} "
+              f"{result['covered_area']:10.0f} {result['overlap_area']:9.0f} {same:>5}")
+
+
+if __name__ == "__main__":
+    main()
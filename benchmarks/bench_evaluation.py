@@ -0,0 +1,52 @@
+"""レイアウト一括評価のベンチマーク: 1 プロセスとプール（共有メモリ）での評価時間
+
+少しずつ違う合成レイアウトを多数作り、まとめて評価する時間を比べる。
+どちらでも結果が一致することと、タスクごとに送るのがレイアウトの番号だけであることを確かめる
+（参考に、配列を毎回 pickle した場合に送るバイト数も表示する）。
+
+    python -m benchmarks.bench_evaluation [--layouts 24] [--items 3000] [--processes 4]
+"""
+import argparse
+import pickle
+import time
+
+from benchmarks.synthetic import generate_layout
+from equipment_store import EquipmentStore
+from evaluation import evaluate_layouts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--layouts", type=int, default=24)
+    parser.add_argument("--items", type=int, default=3000)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    layouts = []
+    for index in range(args.layouts):
+        records, factory_width, factory_length = generate_layout(
+            args.items, seed=args.seed + index, rotations=(0, 45, 90))
+        layouts.append({"name": f"案 {index + 1}", "equipment_list": EquipmentStore.from_records(records),
+                        "factory_width": factory_width, "factory_length": factory_length})
+    pickled = sum(len(pickle.dumps(layout["equipment_list"].arrays())) for layout in layouts)
+    print(f"{args.layouts} layouts x {args.items} items, "
+          f"arrays pickled per task would be {pickled / 2**20:.1f} MiB in total")
+
+    start = time.perf_counter()
+    serial = evaluate_layouts(layouts, processes=1)
+    serial_time = time.perf_counter() - start
+    start = time.perf_counter()
+    parallel = evaluate_layouts(layouts, processes=args.processes)
+    parallel_time = time.perf_counter() - start
+    if serial != parallel:
+        raise AssertionError("1 プロセスとプールの評価結果が違います")
+    print(f"serial: {serial_time:.2f} s, pool of {args.processes}: {parallel_time:.2f} s "
+          f"({serial_time / parallel_time:.1f}x)")
+    best = min(serial, key=lambda score: (score["collision_pairs"], score["narrow_items"]))
+    print(f"fewest collisions: {best['name']} ({best['collision_pairs']} pairs, "
+          f"{best['narrow_items']} narrow items)")
+
+
+if __name__ == "__main__":
+    main()
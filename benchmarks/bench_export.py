@@ -0,0 +1,53 @@
+"""エクスポートのベンチマーク: 形式ごとの書き出し時間・ファイルサイズ・ピークメモリ
+
+ピークメモリは tracemalloc で測る（PIL の画像の画素は含まない）。
+比較として、従来どおり全体を 1 枚の画像に描いて PNG に保存する場合の画像サイズも表示する。
+
+    python -m benchmarks.bench_export [--items 5000] [--floor 300 500] [--scale 20]
+"""
+import argparse
+import time
+import tracemalloc
+
+from benchmarks.synthetic import generate_layout
+from collision import CollisionState
+from equipment_store import EquipmentStore
+from export import EXPORT_FORMATS, export_layout
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--floor", type=float, nargs=2, default=[300.0, 500.0],
+                        metavar=("WIDTH", "LENGTH"))
+    parser.add_argument("--scale", type=int, default=20, help="1 m あたりのピクセル数")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    factory_width, factory_length = args.floor
+    records, width, length = generate_layout(args.items, seed=args.seed,
+                                             rotations=range(0, 360, 15))
+    store = EquipmentStore.from_records(records)
+    store.x[:] *= factory_width / width
+    store.y[:] *= factory_length / length
+    colliding = CollisionState.from_equipment(store).colliding()
+    raster_bytes = int(factory_width * args.scale) * int(factory_length * args.scale) * 3
+    print(f"floor {factory_width:g} x {factory_length:g} m at {args.scale} px/m, "
+          f"{args.items} items, full raster: {raster_bytes / 2**20:.0f} MiB")
+
+    print(f"{'format':>7} {'time [s]':>9} {'size [MiB]':>11} {'peak [MiB]':>11}")
+    for fmt in EXPORT_FORMATS:
+        tracemalloc.start()
+        start = time.perf_counter()
+        output = export_layout(fmt, store, factory_width, factory_length, "#CCCCCC",
+                               colliding, scale_factor=args.scale)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        size = output.seek(0, 2)
+        output.close()
+        print(f"{fmt:>7} {elapsed:9.2f} {size / 2**20:11.2f} {peak / 2**20:11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""AGV シミュレーションのベンチマーク: 台数ごとのシフト 1 回分の実行時間と結果の要約
+
+合成レイアウトの設備から搬送元・搬送先を選んで搬送を張り、指定した台数の AGV で
+シフトの間シミュレーションする。経路を探す時間（距離場）と走行の時間を分けて表示する。
+
+    python -m benchmarks.bench_fleet [--vehicles 50 200] [--hours 8] [--items 500] [--flows 20]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import generate_layout
+from equipment_store import EquipmentStore
+from fleet import simulate_fleet
+from flow import FlowAnalyzer
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--vehicles", type=int, nargs="+", default=[50, 200])
+    parser.add_argument("--hours", type=float, default=8.0)
+    parser.add_argument("--items", type=int, default=500)
+    parser.add_argument("--flows", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=30.0, help="搬送 1 本あたりの依頼数 (回/時)")
+    parser.add_argument("--resolution", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    records, factory_width, factory_length = generate_layout(args.items, seed=args.seed,
+                                                             density=0.2, rotations=(0, 90))
+    store = EquipmentStore.from_records(records)
+    rng = np.random.default_rng(args.seed)
+    stations = rng.choice(args.items, size=(args.flows, 2), replace=True)
+    flows = [{"from": int(a), "to": int(b), "rate": args.rate} for a, b in stations if a != b]
+    print(f"floor {factory_width:g}x{factory_length:g} m, {args.items} items, {len(flows)} flows")
+
+    print(f"{'agv':>5} {'routes [s]':>10} {'run [s]':>8} {'requested':>9} {'delivered':>9} "
+          f"{'per hour':>8} {'conflicts':>9} {'overrides':>9} {'frames':>6}")
+    for vehicles in args.vehicles:
+        analyzer = FlowAnalyzer(resolution=args.resolution)
+        start = time.perf_counter()
+        for flow in flows:
+            analyzer.distance_field(store, factory_width, factory_length, flow["from"])
+            analyzer.distance_field(store, factory_width, factory_length, flow["to"])
+        routes = time.perf_counter() - start
+        start = time.perf_counter()
+        result = simulate_fleet(store, factory_width, factory_length, flows, vehicles=vehicles,
+                                shift_hours=args.hours, seed=args.seed, analyzer=analyzer)
+        run = time.perf_counter() - start
+        print(f"{vehicles:>5} {routes:10.2f} {run:8.2f} {result['requested']:>9} {result['delivered']:>9} "
+              f"{result['throughput']:8.1f} {result['conflicts']:>9} {result['overrides']:>9} "
+              f"{len(result['frames']['time']):>6}")
+
+
+if __name__ == "__main__":
+    main()
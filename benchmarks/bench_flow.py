@@ -0,0 +1,67 @@
+"""動線解析のベンチマーク: 距離場の計算、覚えた距離場の再利用、設備を動かした後の再計算
+
+合成レイアウトに搬送先の違う動線を張り、最初の解析・同じレイアウトでの再解析・
+設備 1 台を動かした後の解析（前の距離場から続きを計算）の時間を表示する。
+動かした後の結果は、何も覚えていない状態から計算した結果と一致することを確かめる。
+
+    python -m benchmarks.bench_flow [--items 500 2000] [--flows 20] [--resolution 0.5]
+"""
+import argparse
+import math
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import generate_layout
+from equipment_store import EquipmentStore
+from flow import FlowAnalyzer
+
+
+def _timed(function):
+    start = time.perf_counter()
+    result = function()
+    return (time.perf_counter() - start) * 1000, result
+
+
+def _same(results, expected):
+    for result, other in zip(results, expected):
+        if math.isinf(result["distance"]) != math.isinf(other["distance"]):
+            return False
+        if math.isfinite(result["distance"]) and abs(result["distance"] - other["distance"]) > 1e-6:
+            return False
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, nargs="+", default=[500, 2000])
+    parser.add_argument("--flows", type=int, default=20)
+    parser.add_argument("--resolution", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    print(f"{'items':>6} {'grid':>11} {'first [ms]':>11} {'cached [ms]':>12} {'edit [ms]':>10} "
+          f"{'fresh [ms]':>11} {'fields [MiB]':>13} {'same':>5}")
+    for n in args.items:
+        records, factory_width, factory_length = generate_layout(n, seed=args.seed,
+                                                                 rotations=(0, 30, 90))
+        store = EquipmentStore.from_records(records)
+        rng = np.random.default_rng(args.seed)
+        flows = [{"from": int(a), "to": int(b), "rate": 1.0}
+                 for a, b in rng.integers(n, size=(args.flows, 2))]
+
+        analyzer = FlowAnalyzer(resolution=args.resolution)
+        first, _ = _timed(lambda: analyzer.analyze(store, factory_width, factory_length, flows))
+        cached, _ = _timed(lambda: analyzer.analyze(store, factory_width, factory_length, flows))
+        # 1 台を少し動かす
+        store[0]["x"] = store[0]["x"] + 1.0
+        edit, results = _timed(lambda: analyzer.analyze(store, factory_width, factory_length, flows))
+        fresh, expected = _timed(lambda: FlowAnalyzer(resolution=args.resolution).analyze(
+            store, factory_width, factory_length, flows))
+        shape = analyzer.grid(store, factory_width, factory_length).shape
+        print(f"{n:>6} {shape[1]:>5}x{shape[0]:<5} {first:11.1f} {cached:12.2f} {edit:10.1f} "
+              f"{fresh:11.1f} {analyzer.nbytes() / 2**20:13.1f} {str(_same(results, expected)):>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""レイアウトファイルのベンチマーク: 従来の JSON・検査付き JSON・NPZ の書き出しと読み込み
+
+従来の JSON は to_records() + json.dumps(indent=2) + base64（データ URI のリンク）で書き、
+json.load() + from_records() で読んでいた。設備数ごとに各方式の時間とファイルの大きさを表示し、
+読み込み直した内容が元と一致するか（往復）も確かめる。
+
+    python -m benchmarks.bench_format [--items 1000 10000 100000]
+"""
+import argparse
+import base64
+import io
+import json
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import generate_layout
+from equipment_store import NUMERIC_FIELDS, STRING_FIELDS, EquipmentStore
+from layout_format import FACTORY_SIZE_RANGE, LayoutFormatError, read_layout, write_layout
+
+
+def _timed(function):
+    start = time.perf_counter()
+    result = function()
+    return (time.perf_counter() - start) * 1000, result
+
+
+def _legacy_write(store, meta):
+    data = dict(meta, equipment_list=store.to_records())
+    return base64.b64encode(json.dumps(data, indent=2).encode())
+
+
+def _legacy_read(payload):
+    data = json.load(io.BytesIO(base64.b64decode(payload)))
+    return EquipmentStore.from_records(data["equipment_list"])
+
+
+def _same(store, other):
+    if len(store) != len(other) or not np.array_equal(store.ids, other.ids):
+        return False
+    for field in NUMERIC_FIELDS:
+        if not np.array_equal(getattr(store, field), getattr(other, field)):
+            return False
+    return all(np.array_equal(store.strings(field), other.strings(field))
+               for field in STRING_FIELDS)
+
+
+def _check_rejects():
+    """壊れたファイルとアプリの範囲外の工場サイズが LayoutFormatError になることを確かめる"""
+    broken = {
+        "json": [b"{", b"[]", b'{"layout_name": "a"}',
+                 b'{"layout_name":"a","factory_width":10,"factory_length":10,'
+                 b'"floor_color":"#fff","equipment_list":[{"x":"1"}]}',
+                 b'{"layout_name":"a","factory_width":3,"factory_length":10,'
+                 b'"floor_color":"#fff","equipment_list":[]}'],
+        "npz": [b"", b"not a zip", b"PK\x03\x04broken"],
+    }
+    store = EquipmentStore.from_records(generate_layout(10)[0])
+    npz = write_layout("npz", store, 10, 10, "#CCCCCC", "test")
+    broken["npz"].append(npz[:len(npz) // 2])
+    broken["npz"].append(write_layout("npz", store, 600, 10, "#CCCCCC", "test"))
+    for fmt, payloads in broken.items():
+        for payload in payloads:
+            try:
+                read_layout(io.BytesIO(payload), fmt, size_range=FACTORY_SIZE_RANGE)
+            except LayoutFormatError:
+                continue
+            raise AssertionError(f"{fmt} の不正なファイルを読み込めてしまいました: {payload[:40]!r}")
+    # 整数で書かれた工場サイズは float にそろえて読む
+    layout = read_layout(io.BytesIO(write_layout("json", store, 10, 12, "#CCCCCC", "test")), "json",
+                         size_range=FACTORY_SIZE_RANGE)
+    if not all(isinstance(layout[key], float) for key in ("factory_width", "factory_length")):
+        raise AssertionError("工場サイズが float になっていません")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    _check_rejects()
+    print(f"{'items':>7} {'format':>11} {'write [ms]':>11} {'read [ms]':>10} {'size [KiB]':>11} "
+          f"{'round-trip':>11}")
+    for n in args.items:
+        records, factory_width, factory_length = generate_layout(n, seed=args.seed)
+        store = EquipmentStore.from_records(records)
+        meta = {"layout_name": "bench", "factory_width": factory_width,
+                "factory_length": factory_length, "floor_color": "#CCCCCC"}
+
+        write, payload = _timed(lambda: _legacy_write(store, meta))
+        read, loaded = _timed(lambda: _legacy_read(payload))
+        print(f"{n:>7} {'legacy json':>11} {write:11.1f} {read:10.1f} "
+              f"{len(payload) / 1024:11.1f} {str(_same(store, loaded)):>11}")
+        for fmt in ("json", "npz"):
+            write, payload = _timed(lambda: write_layout(
+                fmt, store, factory_width, factory_length, "#CCCCCC", "bench"))
+            read, loaded = _timed(lambda: read_layout(io.BytesIO(payload), fmt))
+            same = _same(store, loaded["equipment_list"])
+            print(f"{n:>7} {fmt:>11} {write:11.1f} {read:10.1f} "
+                  f"{len(payload) / 1024:11.1f} {str(same):>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""編集履歴のベンチマーク: 大きなレイアウトで何千回も編集したときのメモリと時間
+
+合成レイアウトに、移動・サイズ変更・追加・削除・複数台の同時移動をランダムに --steps 回
+EditHistory を通して行い、履歴が増やしたメモリ（tracemalloc）を 1 段階あたりで表示する。
+比較として、段階ごとにストアを丸ごとコピーして持つ方法で見込まれるメモリも表示する。
+最後にすべて元に戻して最初のレイアウトと、すべてやり直して最後のレイアウトと一致することを確かめる。
+
+    python -m benchmarks.bench_history [--sizes 1000 20000] [--steps 5000]
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.synthetic import generate_layout
+from equipment_store import EquipmentStore
+from history import EditHistory
+
+
+def _same(a, b):
+    columns_a, columns_b = a.to_columns(), b.to_columns()
+    return len(a) == len(b) and all(np.array_equal(columns_a[key], columns_b[key]) for key in columns_a)
+
+
+def _edit(history, store, rng):
+    """ランダムな編集を 1 段階行う"""
+    kind = rng.integers(5)
+    index = int(rng.integers(len(store)))
+    if kind == 0:
+        history.set_fields(store, index, {"x": float(rng.uniform(0, 100)), "y": float(rng.uniform(0, 100))},
+                           label="移動")
+    elif kind == 1:
+        history.set_fields(store, index, {"width": float(rng.uniform(1, 5)), "rotation": int(rng.integers(24)) * 15},
+                           label="編集")
+    elif kind == 2:
+        record = store[index].to_dict()
+        record["x"] += 1.0
+        history.append(store, record)
+    elif kind == 3:
+        history.pop(store, index)
+    else:
+        with history.step("ドラッグ"):
+            for other in rng.integers(len(store), size=8).tolist():
+                history.set_fields(store, other, {"x": store.get_field(other, "x") + 0.5})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 20000])
+    parser.add_argument("--steps", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    print(f"{'items':>7} {'steps':>6} {'edit [us]':>10} {'history [KB]':>13} {'per step [B]':>13} "
+          f"{'copies [MB]':>12} {'undo [ms]':>10} {'redo [ms]':>10} {'same':>5}")
+    for n in args.sizes:
+        records, _, _ = generate_layout(n, seed=args.seed)
+        store = EquipmentStore.from_records(records)
+        original = store.copy()
+        history = EditHistory(max_steps=args.steps)
+        rng = np.random.default_rng(args.seed)
+
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        for _ in range(args.steps):
+            _edit(history, store, rng)
+        edit = (time.perf_counter() - start) / args.steps
+        # ストアの列の伸び縮み（追加・削除）の分は除いて数える
+        used = tracemalloc.get_traced_memory()[0] - before - (store.nbytes() - original.nbytes())
+        tracemalloc.stop()
+        final = store.copy()
+
+        start = time.perf_counter()
+        while history.can_undo:
+            store = history.undo(store)
+        undo = (time.perf_counter() - start) * 1000
+        same = _same(store, original)
+        start = time.perf_counter()
+        while history.can_redo:
+            store = history.redo(store)
+        redo = (time.perf_counter() - start) * 1000
+        same = same and _same(store, final)
+        copies = original.nbytes() * args.steps / 1e6
+        print(f"{n:>7} {args.steps:>6} {edit * 1e6:10.1f} {used / 1e3:13.1f} {used / args.steps:13.0f} "
+              f"{copies:12.1f} {undo:10.1f} {redo:10.1f} {str(same):>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""クリック位置の設備の特定（ヒットテスト）のベンチマーク
+
+回転ありの合成レイアウトで、衝突検出のグリッドを使う CollisionState.hit_test と、
+全設備を回転矩形で判定して一番上（index が最大）を選ぶ方法の 1 クリックあたりの時間を比べ、
+選ばれた設備が一致することを確かめる。
+
+    python -m benchmarks.bench_hit_test [--sizes 1000 20000] [--density 0.6] [--clicks 2000]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import generate_layout
+from collision import CollisionState
+from equipment_store import EquipmentStore
+from geometry import contains_point
+
+
+def _linear(arrays, x, y):
+    hits = np.flatnonzero(contains_point(*arrays, x, y))
+    return int(hits[-1]) if len(hits) else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 20000])
+    parser.add_argument("--density", type=float, default=0.6)
+    parser.add_argument("--clicks", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    print(f"{'items':>7} {'grid [us]':>10} {'linear [us]':>12} {'hits':>6} {'same':>5}")
+    for n in args.sizes:
+        records, factory_width, factory_length = generate_layout(
+            n, seed=args.seed, density=args.density, rotations=tuple(range(0, 360, 15)))
+        store = EquipmentStore.from_records(records)
+        state = CollisionState.from_equipment(store)
+        arrays = store.arrays()
+        rng = np.random.default_rng(args.seed)
+        clicks = rng.uniform(0, 1, (args.clicks, 2)) * (factory_width, factory_length)
+
+        start = time.perf_counter()
+        grid = [state.hit_test(x, y) for x, y in clicks.tolist()]
+        grid_time = (time.perf_counter() - start) / len(clicks)
+        start = time.perf_counter()
+        linear = [_linear(arrays, x, y) for x, y in clicks.tolist()]
+        linear_time = (time.perf_counter() - start) / len(clicks)
+        hits = sum(hit is not None for hit in grid)
+        print(f"{n:>7} {grid_time * 1e6:10.1f} {linear_time * 1e6:12.1f} {hits:>6} {str(grid == linear):>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""自動配置のベンチマーク: 合成レイアウトを詰め直す時間と配置の質
+
+設備数ごとに、1 プロセスとプールでの実行時間、置けた台数、外接矩形の充填率を表示し、
+結果に重なりや工場からのはみ出しがないことを確かめる。
+
+    python -m benchmarks.bench_optimizer [--items 100 300 500] [--restarts 4]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import generate_layout
+from collision import collision_pairs
+from geometry import rotated_bounds
+from optimizer import optimize_layout
+
+
+def _check(store, placed, factory_width, factory_length):
+    x, y, w, l, rot = (column[placed] for column in store.arrays())
+    if len(collision_pairs(x, y, w, l, rot)):
+        raise AssertionError("配置後の設備が重なっています")
+    xmin, ymin, xmax, ymax = rotated_bounds(x, y, w, l, rot)
+    if (xmin < -1e-9).any() or (ymin < -1e-9).any() or \
+            (xmax > factory_width + 1e-9).any() or (ymax > factory_length + 1e-9).any():
+        raise AssertionError("配置後の設備が工場からはみ出しています")
+    box = (xmax.max() - xmin.min()) * (ymax.max() - ymin.min())
+    return float((w * l).sum() / box)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, nargs="+", default=[100, 300, 500])
+    parser.add_argument("--restarts", type=int, default=4)
+    parser.add_argument("--iterations", type=int, default=300)
+    parser.add_argument("--gap", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    print(f"{'items':>6} {'processes':>10} {'time [s]':>9} {'placed':>7} {'fill':>6} "
+          f"{'wasted [m2]':>12}")
+    for n in args.items:
+        records, factory_width, factory_length = generate_layout(n, seed=args.seed)
+        for processes in (1, args.restarts):
+            start = time.perf_counter()
+            result = optimize_layout(records, factory_width, factory_length, gap=args.gap,
+                                     restarts=args.restarts, iterations=args.iterations,
+                                     processes=processes, seed=args.seed)
+            elapsed = time.perf_counter() - start
+            placed = result["placed"]
+            fill = _check(result["equipment_list"], placed, factory_width, factory_length)
+            print(f"{n:>6} {processes:>10} {elapsed:9.2f} {int(np.sum(placed)):>7} "
+                  f"{fill:6.1%} {result['cost']:12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""レイアウトリポジトリのベンチマーク: 少しずつ変えた版を多数保存したときの容量と時間
+
+版ごとに数台を動かす・追加する・削除する変更を加えて保存し、
+全体を毎回保存した場合との容量の比と、保存・読み込みの時間を表示する。
+
+    python -m benchmarks.bench_repository [--items 5000] [--versions 200]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import generate_layout
+from equipment_store import EquipmentStore
+from layout_repository import LayoutRepository, _pack
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--versions", type=int, default=200)
+    parser.add_argument("--edits", type=int, default=5, help="版ごとに変える設備の数")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    records, factory_width, factory_length = generate_layout(args.items, seed=args.seed)
+    store = EquipmentStore.from_records(records)
+    rng = np.random.default_rng(args.seed)
+    full_bytes = 0
+    version_ids = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "layouts.sqlite3")
+        repository = LayoutRepository(path)
+        start = time.perf_counter()
+        for version in range(args.versions):
+            for _ in range(args.edits):
+                index = int(rng.integers(len(store)))
+                store[index]["x"] = float(rng.uniform(0, factory_width))
+            store.append(records[version % len(records)])
+            store.pop(int(rng.integers(len(store))))
+            version_ids.append(repository.save("plant", store, factory_width, factory_length,
+                                               "#CCCCCC", saved_at=f"2026-01-01 {version:08d}"))
+            full_bytes += len(_pack(store.to_columns()))
+        save_time = (time.perf_counter() - start) / args.versions
+        stored_bytes = repository.storage_bytes()
+        repository.close()
+
+        # キャッシュのない新しい接続で読み込む
+        repository = LayoutRepository(path)
+        timings = []
+        for version_id in (version_ids[-1], version_ids[len(version_ids) // 2], version_ids[0]):
+            start = time.perf_counter()
+            repository.load(version_id=version_id)
+            timings.append((time.perf_counter() - start) * 1000)
+        repository.close()
+
+    print(f"{args.versions} versions of {args.items} items, {args.edits} moves + 1 add + 1 delete each")
+    print(f"stored: {stored_bytes / 2**20:.2f} MiB, full copies: {full_bytes / 2**20:.2f} MiB "
+          f"({full_bytes / stored_bytes:.1f}x smaller)")
+    print(f"save: {save_time * 1000:.1f} ms/version, load latest / middle / first: "
+          + " / ".join(f"{t:.1f}" for t in timings) + " ms")
+
+
+if __name__ == "__main__":
+    main()
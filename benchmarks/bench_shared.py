@@ -0,0 +1,108 @@
+"""共有レイアウトの同期のベンチマーク: 複数のセッションが同時に編集したときの同期の量と時間
+
+一時ファイルの SQLite に合成レイアウトを共有し、--clients 個のセッションが参加する。
+各ラウンドで各セッションが移動・サイズ変更・追加・削除をランダムに --edits 回行って同期する
+（同じ設備を別のセッションが同時に変えることもある）。1 回の同期でやり取りした JSON の大きさを
+設備リスト全体の JSON の大きさと比べ、同期の時間を表示する。最後に全セッションが同期し直して、
+どのセッションの設備リストも共有レイアウトと一致し、衝突状態も作り直したものと一致することを確かめる。
+
+    python -m benchmarks.bench_shared [--sizes 1000 20000] [--clients 4] [--rounds 20] [--edits 10]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import generate_layout
+from collision import CollisionState
+from equipment_store import EquipmentStore
+from shared_layout import SharedLayoutService, SharedLayoutSession
+
+
+def _same(a, b):
+    columns_a, columns_b = a.to_columns(), b.to_columns()
+    return len(a) == len(b) and all(np.array_equal(columns_a[key], columns_b[key]) for key in columns_a)
+
+
+def _edit(store, rng):
+    kind = rng.integers(6)
+    index = int(rng.integers(len(store)))
+    if kind < 3:
+        store[index].update({"x": float(rng.uniform(0, 100)), "y": float(rng.uniform(0, 100))})
+    elif kind == 3:
+        store[index]["width"] = float(rng.uniform(1, 5))
+    elif kind == 4:
+        store.append(dict(store[index].to_dict(), x=float(rng.uniform(0, 100))))
+    else:
+        store.pop(index)
+
+
+class _Counting(SharedLayoutService):
+    """やり取りした変更の JSON の大きさを数える"""
+
+    payload = 0
+
+    def exchange(self, name, client, base_version, changes):
+        result = super().exchange(name, client, base_version, changes)
+        self.payload += len(json.dumps(changes)) + len(json.dumps(result["incoming"]))
+        return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 20000])
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--edits", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    print(f"{'items':>7} {'syncs':>6} {'sync [ms]':>10} {'payload [B]':>12} {'full [B]':>10} "
+          f"{'conflicts':>9} {'same':>5}")
+    for n in args.sizes:
+        records, factory_width, factory_length = generate_layout(n, seed=args.seed)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "shared.sqlite3")
+            owner = SharedLayoutSession(_Counting(path), "bench")
+            store = EquipmentStore.from_records(records)
+            owner.share(store, factory_width, factory_length, "#CCCCCC")
+            full = len(json.dumps(store.to_records()))
+            clients = [(owner, store, CollisionState.from_equipment(store))]
+            for _ in range(args.clients - 1):
+                session = SharedLayoutSession(_Counting(path), "bench")
+                joined = session.attach()["equipment_list"]
+                clients.append((session, joined, CollisionState.from_equipment(joined)))
+
+            rng = np.random.default_rng(args.seed)
+            conflicts = 0
+            elapsed = 0.0
+            syncs = 0
+            for _ in range(args.rounds):
+                for k, (session, store, collision_state) in enumerate(clients):
+                    for _ in range(args.edits):
+                        _edit(store, rng)
+                    # ローカルの編集の分は作り直してから、同期で届いた分だけを差分で更新する
+                    collision_state.rebuild(store)
+                    start = time.perf_counter()
+                    result = session.sync(store, collision_state)
+                    elapsed += time.perf_counter() - start
+                    syncs += 1
+                    conflicts += len(result["conflicts"])
+            for session, store, collision_state in clients:
+                session.sync(store, collision_state)
+            expected = owner.service.snapshot("bench")["equipment_list"]
+            same = all(_same(store, expected) and collision_state.colliding()
+                       == CollisionState.from_equipment(store).colliding()
+                       for _, store, collision_state in clients)
+            payload = sum(session.service.payload for session, _, _ in clients) / syncs
+            for session, _, _ in clients:
+                session.service.close()
+        print(f"{n:>7} {syncs:>6} {elapsed / syncs * 1000:10.2f} {payload:12.0f} {full:10d} "
+              f"{conflicts:>9} {str(same):>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""設備ストアのベンチマーク: 辞書のリストと列指向ストアのメモリ・集計時間
+
+    python -m benchmarks.bench_store [--sizes 1000 10000 50000]
+"""
+import argparse
+import time
+import tracemalloc
+
+from benchmarks.synthetic import generate_layout
+from equipment_store import EquipmentStore
+
+
+def _measure(build):
+    tracemalloc.start()
+    result = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    print(f"{'items':>8} {'list B/item':>12} {'store B/item':>13} {'ratio':>7} "
+          f"{'list sum [ms]':>14} {'store sum [ms]':>15}")
+    for n in args.sizes:
+        records, _, _ = generate_layout(n, seed=args.seed)
+        records = [dict(record, label=f"{record['type']}-{i % 100}")
+                   for i, record in enumerate(records)]
+        equipment_list, list_bytes = _measure(lambda: [dict(record) for record in records])
+        store, store_bytes = _measure(lambda: EquipmentStore.from_records(records))
+
+        start = time.perf_counter()
+        list_area = sum(item["width"] * item["length"] for item in equipment_list)
+        list_time = time.perf_counter() - start
+        start = time.perf_counter()
+        store_area = float((store.width * store.length).sum())
+        store_time = time.perf_counter() - start
+        if abs(list_area - store_area) > 1e-6 * max(list_area, 1.0):
+            raise SystemExit(f"集計結果が一致しません (n={n})")
+
+        print(f"{n:>8} {list_bytes / n:12.0f} {store_bytes / n:13.0f} "
+              f"{list_bytes / store_bytes:6.1f}x {list_time * 1000:14.2f} {store_time * 1000:15.3f}")
+
+
+if __name__ == "__main__":
+    main()
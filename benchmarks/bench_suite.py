@@ -0,0 +1,133 @@
+"""アプリの再実行で通る処理をまとめて測るベンチマーク（段階ごとの時間とピークメモリ）
+
+設備数・密度・回転の組み合わせごとに合成レイアウトを作り、アプリと同じ順に
+取り込み (from_records)・衝突検出・描画（全体表示）・統計・設備一覧の表 を実行する。
+時間は --repeat 回のうち最短、ピークメモリは tracemalloc を有効にした別の 1 回で測る。
+
+--save で結果を JSON に保存し、--compare で保存した結果と比べる。時間が許容幅を超えて
+遅くなった段階があれば一覧を表示して終了コード 1 を返す（ピークメモリも同じ基準で比べる）。
+benchmarks/baselines/reference.json は既定の組み合わせで保存した基準（マシン情報つき）で、
+別のマシンでは先にそのマシンで --save した結果と比べる。
+
+    python -m benchmarks.bench_suite [--sizes 10 100 1000 10000 100000] [--densities 0.3]
+        [--rotations axis any] [--repeat 3] [--save benchmarks/baselines/reference.json]
+        [--compare benchmarks/baselines/reference.json] [--tolerance 0.3]
+"""
+import argparse
+import json
+import platform
+import sys
+
+import numpy as np
+
+from benchmarks.synthetic import generate_layout
+from collision import CollisionState
+from equipment_store import EquipmentStore
+from layout_core import equipment_table, layout_statistics
+from profiling import StageTimer
+from tiles import TileRenderer, fit_level, level_scale
+
+# 回転の組み合わせ
+ROTATIONS = {"axis": (0, 90), "any": tuple(range(0, 360, 15))}
+STAGES = ["取り込み", "衝突検出", "描画", "統計", "一覧表"]
+# これより短い段階は誤差が大きいので遅くなったとは判定しない
+MIN_SECONDS = 1e-3
+MIN_BYTES = 1 << 20
+
+
+def run_stages(records, factory_width, factory_length, timer):
+    """アプリの再実行と同じ順に各段階を実行して timer に記録する"""
+    with timer.stage("取り込み"):
+        store = EquipmentStore.from_records(records)
+    with timer.stage("衝突検出"):
+        colliding = CollisionState.from_equipment(store).colliding()
+    with timer.stage("描画"):
+        level = fit_level(factory_width, factory_length)
+        view = (0, 0, int(factory_width * level_scale(level)), int(factory_length * level_scale(level)))
+        TileRenderer().render_view(store, factory_width, factory_length, "#CCCCCC", view, level,
+                                   colliding=colliding)
+    with timer.stage("統計"):
+        layout_statistics(store, factory_width, factory_length)
+    with timer.stage("一覧表"):
+        equipment_table(store)
+
+
+def measure(n, density, rotations, seed, repeat):
+    """1 つの組み合わせの段階ごとの {"seconds", "peak_bytes"}"""
+    records, factory_width, factory_length = generate_layout(
+        n, seed=seed, density=density, rotations=ROTATIONS[rotations])
+    results = {stage: {"seconds": float("inf")} for stage in STAGES}
+    for _ in range(repeat):
+        timer = StageTimer()
+        run_stages(records, factory_width, factory_length, timer)
+        for stage, total in timer.summary().items():
+            results[stage]["seconds"] = min(results[stage]["seconds"], total["seconds"])
+    timer = StageTimer(trace_memory=True)
+    run_stages(records, factory_width, factory_length, timer)
+    for stage, total in timer.summary().items():
+        results[stage]["peak_bytes"] = total["peak_bytes"]
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """baseline より tolerance（割合）を超えて遅い・大きい段階の説明のリスト"""
+    regressions = []
+    for case, stages in results.items():
+        for stage, result in stages.items():
+            expected = baseline.get(case, {}).get(stage)
+            if expected is None:
+                continue
+            for key, floor, unit in (("seconds", MIN_SECONDS, 1000), ("peak_bytes", MIN_BYTES, 2**-20)):
+                limit = max(expected[key] * (1 + tolerance), floor)
+                if result[key] > limit:
+                    regressions.append(f"{case} {stage} {key}: {expected[key] * unit:.2f} -> "
+                                       f"{result[key] * unit:.2f}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000, 100000])
+    parser.add_argument("--densities", type=float, nargs="+", default=[0.3])
+    parser.add_argument("--rotations", nargs="+", choices=sorted(ROTATIONS), default=["axis", "any"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="結果を保存する JSON ファイル")
+    parser.add_argument("--compare", help="比べる基準の JSON ファイル")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="許容する悪化の割合")
+    args = parser.parse_args(argv)
+
+    print(f"{'items':>7} {'density':>7} {'rot':>4} "
+          + " ".join(f"{stage + ' [ms]':>12}" for stage in STAGES) + f" {'peak [MiB]':>10}")
+    results = {}
+    for n in args.sizes:
+        for density in args.densities:
+            for rotations in args.rotations:
+                stages = measure(n, density, rotations, args.seed, args.repeat)
+                results[f"{n}/{density:g}/{rotations}"] = stages
+                peak = max(result["peak_bytes"] for result in stages.values())
+                print(f"{n:>7} {density:>7g} {rotations:>4} "
+                      + " ".join(f"{stages[stage]['seconds'] * 1000:>12.2f}" for stage in STAGES)
+                      + f" {peak / 2**20:>10.1f}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump({"machine": {"python": platform.python_version(), "numpy": np.__version__,
+                                   "platform": platform.platform()},
+                       "results": results}, file, ensure_ascii=False, indent=1)
+        print(f"saved to {args.save}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline["results"], args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regressions against {args.compare}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"no regressions against {args.compare} (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+"""設備一覧のベンチマーク: 全台の表と選択肢を毎回作る方法と、検索してページの行だけを作る方法
+
+合成レイアウトについて、再実行のたびに全台の表（equipment_table）と全台の選択肢の文字列を
+作る従来の方法と、EquipmentIndex で検索してページの行と先頭の選択肢だけを作る方法の時間を比べる。
+検索は「何も入力しない」「ラベルの一部」「種類」「範囲」の 4 通りを順に測る。
+ページの表が全台の表の同じ行と一致することも確かめる。
+
+    python -m benchmarks.bench_table [--sizes 1000 50000]
+"""
+import argparse
+import time
+
+from benchmarks.synthetic import generate_layout
+from equipment_index import EquipmentIndex, options, table_page
+from equipment_store import EquipmentStore
+from layout_core import equipment_table
+
+
+def _full(store):
+    df = equipment_table(store)
+    choices = [f"{eq['label']} ({i + 1})" for i, eq in enumerate(store)]
+    return df, choices
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 50000])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    # pandas の読み込みを測らないように 1 回作っておく
+    equipment_table(EquipmentStore())
+    print(f"{'items':>7} {'search':>8} {'matches':>8} {'full [ms]':>10} {'page [ms]':>10} {'rows':>5} {'same':>5}")
+    for n in args.sizes:
+        records, factory_width, factory_length = generate_layout(n, seed=args.seed)
+        store = EquipmentStore.from_records(records)
+        index = EquipmentIndex()
+        # 索引は最初の検索で作られるので、先に 1 回作っておく（再実行のたびに作り直さないことを測る）
+        index.search(store, "x")
+
+        start = time.perf_counter()
+        full, _ = _full(store)
+        full_ms = (time.perf_counter() - start) * 1000
+
+        label = store.get_field(n // 2, "label")
+        searches = {
+            "none": {},
+            "label": {"text": label[:max(len(label) - 1, 1)]},
+            "type": {"equipment_type": store.get_field(0, "type")},
+            "region": {"region": (0.0, 0.0, factory_width / 4, factory_length / 4)},
+        }
+        for name, query in searches.items():
+            start = time.perf_counter()
+            matches = index.search(store, **query)
+            page = table_page(store, matches, 0)
+            options(store, matches)
+            page_ms = (time.perf_counter() - start) * 1000
+            expected = full.iloc[matches[:len(page)]].reset_index(drop=True)
+            same = page.equals(expected) and (page.dtypes == expected.dtypes).all()
+            print(f"{n:>7} {name:>8} {len(matches):>8} {full_ms:10.1f} {page_ms:10.2f} {len(page):>5} {str(same):>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""タイル描画のベンチマーク: 広い工場 (既定 300 m x 500 m) の表示範囲の描画時間とメモリ
+
+ズームレベルごとに、初回描画・再描画・半タイル分のパン・設備 1 台の変更の時間と、
+tracemalloc で測ったピークメモリ（PIL の画像の画素は含まない）と、
+キャッシュ中のタイルのバイト数を表示する。
+
+    python -m benchmarks.bench_tiles [--items 5000] [--floor 300 500]
+"""
+import argparse
+import time
+import tracemalloc
+
+from benchmarks.synthetic import generate_layout
+from collision import CollisionState
+from equipment_store import EquipmentStore
+from tiles import TILE_SIZE, TileRenderer, fit_level, level_scale, view_around
+
+
+def _timed(render):
+    start = time.perf_counter()
+    render()
+    return (time.perf_counter() - start) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--floor", type=float, nargs=2, default=[300.0, 500.0],
+                        metavar=("WIDTH", "LENGTH"))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    factory_width, factory_length = args.floor
+    records, width, length = generate_layout(args.items, seed=args.seed,
+                                             rotations=range(0, 360, 15))
+    store = EquipmentStore.from_records(records)
+    store.x[:] *= factory_width / width
+    store.y[:] *= factory_length / length
+    state = CollisionState.from_equipment(store)
+    full_pixels = factory_width * factory_length * level_scale(0) ** 2
+    print(f"floor {factory_width:g} x {factory_length:g} m, {args.items} items, "
+          f"full image at level 0: {full_pixels * 3 / 2**20:.0f} MiB")
+
+    print(f"{'level':>6} {'px/m':>6} {'first [ms]':>11} {'rerun [ms]':>11} {'pan [ms]':>9} "
+          f"{'edit [ms]':>10} {'peak [MiB]':>11} {'tiles [MiB]':>12}")
+    for level in range(fit_level(factory_width, factory_length) + 1):
+        renderer = TileRenderer()
+        center = [factory_width / 2, factory_length / 2]
+
+        def render():
+            view = view_around(center[0], center[1], level)
+            return renderer.render_view(store, factory_width, factory_length, "#CCCCCC",
+                                        view, level, colliding=state.colliding())
+
+        tracemalloc.start()
+        first = _timed(render)
+        rerun = _timed(render)
+        center[0] += TILE_SIZE / 2 / level_scale(level)
+        pan = _timed(render)
+        # 表示中心に 1 台動かす（掛かるタイルだけ描き直される）
+        store[0]["x"] = center[0]
+        store[0]["y"] = center[1]
+        state.update(0, store[0])
+        edit = _timed(render)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{level:>6} {level_scale(level):>6g} {first:11.1f} {rerun:11.1f} {pan:9.1f} "
+              f"{edit:10.1f} {peak / 2**20:11.1f} {renderer.nbytes() / 2**20:12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""ベンチマーク用の合成レイアウト生成"""
+import numpy as np
+
+# 設備タイプごとの代表サイズ (幅, 長さ)
+SYNTHETIC_TYPES = {
+    "robot": (2.0, 2.0),
+    "machine": (3.0, 5.0),
+    "conveyor": (1.0, 10.0),
+    "workstation": (2.0, 3.0),
+    "storage": (5.0, 8.0),
+    "agv": (1.5, 2.5),
+}
+
+
+def generate_layout(n, seed=0, density=0.3, rotations=(0,)):
+    """n 個の設備をランダムに配置した設備リストと工場サイズを返す
+
+    density は設備の総面積 / 工場面積の目安。rotations から回転角を選ぶ。
+    """
+    rng = np.random.default_rng(seed)
+    types = list(SYNTHETIC_TYPES)
+    type_idx = rng.integers(0, len(types), n)
+    sizes = np.array([SYNTHETIC_TYPES[t] for t in types])[type_idx]
+    total_area = float((sizes[:, 0] * sizes[:, 1]).sum()) if n else 1.0
+    side = max(np.sqrt(total_area / density), 5.0)
+    factory_width = float(np.ceil(side))
+    factory_length = float(np.ceil(side))
+    xs = rng.uniform(0, factory_width, n)
+    ys = rng.uniform(0, factory_length, n)
+    rots = rng.choice(np.asarray(rotations), n)
+
+    equipment_list = []
+    for i in range(n):
+        equipment_list.append({
+            "type": types[type_idx[i]],
+            "width": float(sizes[i, 0]),
+            "length": float(sizes[i, 1]),
+            "color": "#607D8B",
+            "x": float(xs[i]),
+            "y": float(ys[i]),
+            "rotation": int(rots[i]),
+            "label": f"{types[type_idx[i]]}-{i}",
+            "id": i,
+        })
+    return equipment_list, factory_width, factory_length
@@ -0,0 +1,94 @@
+"""レイアウト図のキャンバス（streamlit-drawable-canvas）と設備リストの変換
+
+表示範囲に掛かる設備を Fabric.js の矩形（中心が原点、角度は時計回りの度）にして
+キャンバスに渡し、ドラッグ・回転・拡大はブラウザ側で行う。キャンバスから戻ってきた矩形と
+設備リストを比べ、位置・サイズ・回転が変わった設備だけをまとめて返す。
+ドラッグ中の移動はブラウザの中で済み、サーバーに届くのはマウスを離したときの結果だけになる。
+"""
+import numpy as np
+
+from geometry import rotated_bounds
+from layout_core import MAX_SIZE, MIN_SIZE
+
+# キャンバスに載せる設備の上限（これより多いときは拡大して表示範囲を狭める）
+MAX_OBJECTS = 1500
+# これより小さい変化（画素）は動かしていないものとみなす
+PIXEL_TOLERANCE = 0.5
+
+_ORIGIN_OFFSET = {"left": -0.5, "top": -0.5, "center": 0.0, "right": 0.5, "bottom": 0.5}
+
+
+def visible_items(store, view, scale):
+    """表示範囲 view (left, top, width, height) [px] に掛かる設備の index の配列"""
+    if not len(store):
+        return np.zeros(0, dtype=np.int64)
+    xmin, ymin, xmax, ymax = (bound * scale for bound in rotated_bounds(*store.arrays()))
+    left, top, width, height = view
+    return np.flatnonzero((xmax >= left) & (xmin <= left + width) & (ymax >= top) & (ymin <= top + height))
+
+
+def canvas_objects(store, indices, view, scale, colliding=()):
+    """indices の設備を Fabric.js の矩形のリストにする（並びは indices と同じで、後ろが上に重なる）"""
+    x, y, w, l, rot = (column[indices] for column in store.arrays())
+    colors = store.strings("color")[indices]
+    colliding = set(colliding)
+    objects = []
+    for k, index in enumerate(indices.tolist()):
+        hit = index in colliding
+        objects.append({
+            "type": "rect",
+            "left": float(x[k] * scale - view[0]),
+            "top": float(y[k] * scale - view[1]),
+            "width": float(w[k] * scale),
+            "height": float(l[k] * scale),
+            "angle": float(rot[k]),
+            "originX": "center",
+            "originY": "center",
+            "scaleX": 1,
+            "scaleY": 1,
+            "fill": str(colors[k]),
+            "stroke": "#FF0000" if hit else "#000000",
+            "strokeWidth": 3 if hit else 1,
+            "strokeUniform": True,
+        })
+    return objects
+
+
+def canvas_changes(objects, store, indices, view, scale):
+    """キャンバスの矩形と設備を比べて、変わった設備の {index: {x, y, width, length, rotation}} を返す
+
+    幅・長さは MIN_SIZE から MAX_SIZE に収め、回転は 0 から 359 の整数（度）に丸める。
+
+    objects の先頭から indices の数だけを設備の矩形とみなす（後ろに描き足された図形は無視する）。
+    矩形が足りない（キャンバス上で消された）ときは対応が取れないので None を返す。
+    """
+    rectangles = [obj for obj in objects[:len(indices)] if obj.get("type") == "rect"]
+    if len(rectangles) < len(indices):
+        return None
+    if not len(indices):
+        return {}
+    width = np.array([obj["width"] * obj.get("scaleX", 1) for obj in rectangles], dtype=np.float64)
+    height = np.array([obj["height"] * obj.get("scaleY", 1) for obj in rectangles], dtype=np.float64)
+    angle = np.array([obj.get("angle", 0) for obj in rectangles], dtype=np.float64)
+    # 原点が中心でない矩形は、回転を考えて中心に直す
+    offset_x = np.array([_ORIGIN_OFFSET.get(obj.get("originX", "left"), -0.5) for obj in rectangles]) * width
+    offset_y = np.array([_ORIGIN_OFFSET.get(obj.get("originY", "top"), -0.5) for obj in rectangles]) * height
+    cos, sin = np.cos(np.radians(angle)), np.sin(np.radians(angle))
+    center_x = np.array([obj["left"] for obj in rectangles]) - offset_x * cos + offset_y * sin
+    center_y = np.array([obj["top"] for obj in rectangles]) - offset_x * sin - offset_y * cos
+
+    x, y, w, l, rot = (column[indices] for column in store.arrays())
+    new = np.column_stack([(center_x + view[0]) / scale, (center_y + view[1]) / scale,
+                           width / scale, height / scale, angle % 360])
+    old = np.column_stack([x, y, w, l, rot % 360])
+    moved = np.abs(new[:, :4] - old[:, :4]).max(axis=1) * scale > PIXEL_TOLERANCE
+    turned = np.abs((new[:, 4] - old[:, 4] + 180) % 360 - 180) > 1e-6
+    # 動かした設備は、サイドバーの入力欄で扱えるようにサイズを範囲内に収め、回転を整数の度にする
+    new[:, 2:4] = np.clip(new[:, 2:4], MIN_SIZE, MAX_SIZE)
+    new[:, 4] = np.round(new[:, 4]) % 360
+    changes = {}
+    for k in np.flatnonzero(moved | turned).tolist():
+        change = dict(zip(("x", "y", "width", "length"), np.round(new[k, :4], 6).tolist()))
+        change["rotation"] = int(new[k, 4])
+        changes[int(indices[k])] = change
+    return changes
@@ -0,0 +1,239 @@
+"""通路幅・安全距離の検査
+
+設備の種類ごとに必要な離隔距離（安全距離）を決め、設備どうし・設備と壁の間が
+それより狭くなっている場所を resolution (m) 四方のセル単位で求める。
+設備 a と b（または壁）の間のセル p の隙間は、p を通って a から b へ渡る最短の長さ
+d_a(p) + d_b(p) とし、空いているセルのうちこれが必要な距離（2 つのうち大きいほう）より
+短いものを狭い場所として報告する。重なっている設備は衝突検出が扱うのでここでは数えない。
+
+工場全体を距離変換すると 300 x 500 m を 10 cm で 1500 万セルになるので、先に外接矩形を
+安全距離だけ広げた広域判定と矩形どうしの最短距離で違反の組を絞り、その周りの窓だけを
+セルに分ける。各セルから設備までの距離は回転矩形への距離の式で厳密に求める。
+"""
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+from collision import aabb_overlap, broad_phase_pairs, rectangle_gaps
+from geometry import rotated_bounds
+
+DEFAULT_RESOLUTION = 0.1
+# 種類ごとの値がないときの安全距離 (m)
+DEFAULT_CLEARANCE = 1.0
+# 一度に展開するセル数の上限（メモリ使用量の目安）
+CHUNK_CELLS = 1 << 21
+
+
+class ClearanceAnalyzer:
+    """レイアウトの形と安全距離ごとに検査結果を覚えておく"""
+
+    def __init__(self, resolution=DEFAULT_RESOLUTION, max_results=4):
+        self.resolution = resolution
+        self.max_results = max_results
+        self._results = OrderedDict()
+
+    def analyze(self, store, factory_width, factory_length, thresholds, default=DEFAULT_CLEARANCE):
+        """clearance_violations() の結果（同じレイアウトなら覚えておいたもの）を返す"""
+        key = _layout_key(store, factory_width, factory_length, self.resolution, thresholds, default)
+        result = self._results.get(key)
+        if result is None:
+            result = clearance_violations(store, factory_width, factory_length, thresholds,
+                                          self.resolution, default)
+            self._results[key] = result
+            while len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+        else:
+            self._results.move_to_end(key)
+        return result
+
+
+def clearance_violations(store, factory_width, factory_length, thresholds,
+                         resolution=DEFAULT_RESOLUTION, default=DEFAULT_CLEARANCE):
+    """安全距離に満たない設備の組と、その間の狭いセルを求める
+
+    thresholds は {設備の種類: 安全距離 (m)}。戻り値は次のキーを持つ辞書:
+    violations: 組ごとの辞書（item・other は設備の index、壁なら other は None。
+        clearance は矩形どうしの最短距離、x・y は最も狭いセルの中心、area は狭いセルの面積）のリストで、
+        clearance の小さい順
+    x, y, gap, violation: 狭いセルの中心 (m)・そこでの隙間 (m)・どの組のセルか（violations の番号）
+    """
+    x, y, w, l, rot = store.arrays()
+    types = store.strings("type")
+    required = np.array([thresholds.get(t, default) for t in store.table("type")],
+                        dtype=np.float64)[store.codes("type")] if len(store) else np.zeros(0)
+    xmin, ymin, xmax, ymax = rotated_bounds(x, y, w, l, rot)
+
+    # 壁との組（other = -1）と設備どうしの組を、矩形の最短距離で絞る
+    wall_gap = np.maximum(np.minimum.reduce([xmin, ymin, factory_width - xmax,
+                                             factory_length - ymax]), 0.0)
+    walls = np.flatnonzero(wall_gap < required)
+    grown = (xmin - required, ymin - required, xmax + required, ymax + required)
+    pairs = broad_phase_pairs(*grown)
+    pairs = pairs[aabb_overlap(pairs, *grown)]
+    gaps = rectangle_gaps(pairs, x, y, w, l, rot)
+    pair_required = np.maximum(required[pairs[:, 0]], required[pairs[:, 1]])
+    near = (gaps > 0) & (gaps < pair_required)
+    item = np.concatenate([walls, pairs[near, 0]])
+    other = np.concatenate([np.full(len(walls), -1), pairs[near, 1]])
+    clearance = np.concatenate([wall_gap[walls], gaps[near]])
+    limit = np.concatenate([required[walls], pair_required[near]])
+
+    # 狭いセルは両方の設備から limit 以内にあるので、広げた外接矩形の共通部分を窓にする
+    wx0 = np.maximum(xmin[item] - limit, 0.0)
+    wy0 = np.maximum(ymin[item] - limit, 0.0)
+    wx1 = np.minimum(xmax[item] + limit, factory_width)
+    wy1 = np.minimum(ymax[item] + limit, factory_length)
+    paired = other >= 0
+    partner = other[paired]
+    wx0[paired] = np.maximum(wx0[paired], xmin[partner] - limit[paired])
+    wy0[paired] = np.maximum(wy0[paired], ymin[partner] - limit[paired])
+    wx1[paired] = np.minimum(wx1[paired], xmax[partner] + limit[paired])
+    wy1[paired] = np.minimum(wy1[paired], ymax[partner] + limit[paired])
+    windows = (wx0, wy0, wx1, wy1)
+
+    cells = _narrow_cells(store, factory_width, factory_length, resolution, windows,
+                          item, other, limit, (xmin, ymin, xmax, ymax))
+    owner, px, py, gap = cells
+
+    # セルのない組（間に別の設備がある）を除き、隙間の小さい順に並べる。
+    # セルは組の番号順に並んでいるので、組ごとの最小は区切りごとの reduceat で求める
+    counts = np.bincount(owner, minlength=len(item))
+    kept = np.flatnonzero(counts)
+    starts = np.cumsum(counts) - counts
+    smallest = np.minimum.reduceat(gap, starts[kept]) if len(kept) else np.zeros(0)
+    at_smallest = np.flatnonzero(gap == np.repeat(smallest, counts[kept]))
+    first = at_smallest[np.searchsorted(owner[at_smallest], kept)]
+    kept_order = np.argsort(clearance[kept], kind="stable")
+    kept, first = kept[kept_order], first[kept_order]
+    renumber = np.full(len(item), -1)
+    renumber[kept] = np.arange(len(kept))
+
+    ids = store.ids
+    violations = []
+    for k, cell in zip(kept.tolist(), first.tolist()):
+        a, b = int(item[k]), int(other[k])
+        violations.append({
+            "item": a,
+            "item_id": int(ids[a]),
+            "type": str(types[a]),
+            "other": b if b >= 0 else None,
+            "other_id": int(ids[b]) if b >= 0 else None,
+            "other_type": str(types[b]) if b >= 0 else None,
+            "required": float(limit[k]),
+            "clearance": float(clearance[k]),
+            "x": float(px[cell]),
+            "y": float(py[cell]),
+            "area": float(counts[k] * resolution * resolution),
+        })
+    return {"violations": violations, "x": px, "y": py, "gap": gap, "violation": renumber[owner]}
+
+
+def _narrow_cells(store, factory_width, factory_length, resolution, windows, item, other,
+                  limit, bounds):
+    """窓ごとのセルのうち、空いていて隙間が limit より狭いセル (組の番号, x, y, 隙間)
+
+    壁との組が先に並んでいる前提で、壁の窓のセルは壁までの距離、それ以外は相手の設備までの距離を足す。
+    """
+    x, y, w, l, rot = store.arrays()
+    wx0, wy0, wx1, wy1 = windows
+    column0 = np.floor(wx0 / resolution).astype(np.int64)
+    row0 = np.floor(wy0 / resolution).astype(np.int64)
+    widths = np.maximum(np.ceil(wx1 / resolution).astype(np.int64) - column0, 0)
+    heights = np.maximum(np.ceil(wy1 / resolution).astype(np.int64) - row0, 0)
+    cell_counts = widths * heights
+    walls = int(np.count_nonzero(other < 0))
+
+    # 設備ごとの中心・向き・半分の大きさを 1 度だけ求め、窓ごとの値にしておく
+    angle = np.radians(rot)
+    frames = np.stack([x, y, np.cos(angle), np.sin(angle), w / 2, l / 2])
+    frame_a = frames[:, item]
+    frame_b = frames[:, np.maximum(other, 0)]
+
+    # 窓に掛かる設備（セルが空いているかを調べる相手）を広域判定で求める
+    n = len(store)
+    boxes = [np.concatenate([bound, window]) for bound, window in zip(bounds, windows)]
+    touching = broad_phase_pairs(*boxes)
+    touching = touching[aabb_overlap(touching, *boxes)]
+    touching = touching[(touching[:, 0] < n) & (touching[:, 1] >= n)]
+    # 組の設備そのものは距離が 0 かどうかで分かるので除く
+    touching = touching[(touching[:, 0] != item[touching[:, 1] - n])
+                        & (touching[:, 0] != other[touching[:, 1] - n])]
+    order = np.argsort(touching[:, 1], kind="stable")
+    touching_window = touching[order, 1] - n
+    touching_item = touching[order, 0]
+
+    results = []
+    cumulative = np.cumsum(cell_counts)
+    start = 0
+    while start < len(item):
+        chunk_limit = (cumulative[start - 1] if start else 0) + CHUNK_CELLS
+        stop = max(int(np.searchsorted(cumulative, chunk_limit, side="right")), start + 1)
+        window = slice(start, stop)
+        counts = cell_counts[window]
+        owner = np.repeat(np.arange(start, stop), counts)
+        local = np.arange(owner.size, dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts)
+        row, column = np.divmod(local, np.repeat(widths[window], counts))
+        px = (column + np.repeat(column0[window], counts) + 0.5) * resolution
+        py = (row + np.repeat(row0[window], counts) + 0.5) * resolution
+
+        # 距離が 0 のセルは設備 a・b の内側なので、隙間が狭くても数えない。
+        # a から limit 以上離れたセルは相手までの距離を求めるまでもなく外れる
+        distance_a = _frame_distance(np.repeat(frame_a[:, window], counts, axis=1), px, py)
+        near = np.flatnonzero((distance_a > 0) & (distance_a < np.repeat(limit[window], counts)))
+        owner, px, py, distance_a = owner[near], px[near], py[near], distance_a[near]
+        split = int(np.searchsorted(owner, walls))
+        distance_b = np.empty_like(distance_a)
+        distance_b[:split] = np.minimum.reduce([px[:split], py[:split], factory_width - px[:split],
+                                                factory_length - py[:split]])
+        distance_b[split:] = _frame_distance(frame_b[:, owner[split:]], px[split:], py[split:])
+        gap = distance_a + distance_b
+        narrow = np.flatnonzero((gap < limit[owner]) & (distance_b > 0))
+        results.append(_free_cells(start, stop, owner[narrow], px[narrow], py[narrow], gap[narrow],
+                                   frames, touching_window, touching_item))
+        start = stop
+    if not results:
+        empty = np.zeros(0)
+        return np.zeros(0, dtype=np.int64), empty, empty, empty
+    return tuple(np.concatenate(parts) for parts in zip(*results))
+
+
+def _frame_distance(frame, px, py):
+    """(中心 x, 中心 y, cos, sin, 幅の半分, 長さの半分) の矩形までの距離"""
+    cx, cy, cos, sin, half_width, half_length = frame
+    dx = px - cx
+    dy = py - cy
+    outside_u = np.abs(dx * cos + dy * sin) - half_width
+    outside_v = np.abs(dy * cos - dx * sin) - half_length
+    return np.hypot(np.maximum(outside_u, 0.0, out=outside_u), np.maximum(outside_v, 0.0, out=outside_v))
+
+
+def _free_cells(start, stop, owner, px, py, gap, frames, touching_window, touching_item):
+    """窓に掛かる設備の内側のセルを除く（窓ごとのセルは連続しているので範囲で展開する）"""
+    windows = np.arange(start, stop)
+    first = np.searchsorted(owner, windows)
+    narrow_counts = np.searchsorted(owner, windows, side="right") - first
+    begin, end = np.searchsorted(touching_window, [start, stop])
+    pair_window = touching_window[begin:end] - start
+    pair_item = touching_item[begin:end]
+    pair_counts = narrow_counts[pair_window]
+    cell = np.repeat(first[pair_window], pair_counts)
+    cell += np.arange(cell.size) - np.repeat(np.cumsum(pair_counts) - pair_counts, pair_counts)
+    cx, cy, cos, sin, half_width, half_length = np.repeat(frames[:, pair_item], pair_counts, axis=1)
+    dx = px[cell] - cx
+    dy = py[cell] - cy
+    inside = ((np.abs(dx * cos + dy * sin) <= half_width)
+              & (np.abs(dy * cos - dx * sin) <= half_length))
+    free = np.ones(len(owner), dtype=bool)
+    free[cell[inside]] = False
+    return owner[free], px[free], py[free], gap[free]
+
+
+def _layout_key(store, factory_width, factory_length, resolution, thresholds, default):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((float(factory_width), float(factory_length), float(resolution),
+                        sorted(thresholds.items()), float(default))).encode())
+    digest.update(np.ascontiguousarray(np.stack(store.arrays())).tobytes())
+    digest.update(np.ascontiguousarray(store.codes("type")).tobytes())
+    digest.update("\0".join(store.table("type")).encode())
+    return digest.hexdigest()
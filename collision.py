@@ -0,0 +1,467 @@
+"""設備の衝突検出エンジン
+
+一様グリッドによるブロードフェーズで候補ペアを絞り込み、
+候補ペアだけを分離軸定理 (SAT) で NumPy により一括判定する。
+"""
+import numpy as np
+
+from equipment_store import EquipmentStore
+from geometry import contains_point, rectangle_corners, rotated_bounds, rotation_axes
+
+# 接触しているだけの設備を衝突扱いしないための許容誤差 (m)
+SAT_EPSILON = 1e-9
+
+
+def equipment_arrays(equipment_list):
+    """設備リストから (x, y, width, length, rotation) の配列を作る"""
+    if isinstance(equipment_list, EquipmentStore):
+        return tuple(column.copy() for column in equipment_list.arrays())
+    n = len(equipment_list)
+    x = np.fromiter((eq["x"] for eq in equipment_list), dtype=np.float64, count=n)
+    y = np.fromiter((eq["y"] for eq in equipment_list), dtype=np.float64, count=n)
+    w = np.fromiter((eq["width"] for eq in equipment_list), dtype=np.float64, count=n)
+    l = np.fromiter((eq["length"] for eq in equipment_list), dtype=np.float64, count=n)
+    rot = np.fromiter((eq.get("rotation", 0) for eq in equipment_list), dtype=np.float64, count=n)
+    return x, y, w, l, rot
+
+
+def aabb_bounds(x, y, w, l):
+    """中心とサイズから軸平行の外接矩形 (xmin, ymin, xmax, ymax) を返す"""
+    return x - w / 2, y - l / 2, x + w / 2, y + l / 2
+
+
+def choose_cell_size(xmin, ymin, xmax, ymax):
+    """グリッドのセルサイズを設備サイズの中央値から決める"""
+    if len(xmin) == 0:
+        return 1.0
+    extent = np.maximum(xmax - xmin, ymax - ymin)
+    cell = float(np.median(extent)) * 2.0
+    return cell if cell > 0 else 1.0
+
+
+def broad_phase_pairs(xmin, ymin, xmax, ymax, cell_size=None):
+    """一様グリッドで外接矩形が重なる可能性のあるペア (i < j) を列挙する
+
+    戻り値は shape (k, 2) の int64 配列で、行は辞書順に並ぶ。
+    """
+    n = len(xmin)
+    if n < 2:
+        return np.empty((0, 2), dtype=np.int64)
+    if cell_size is None:
+        cell_size = choose_cell_size(xmin, ymin, xmax, ymax)
+
+    # 各設備が覆うセル範囲
+    origin_x = float(xmin.min())
+    origin_y = float(ymin.min())
+    ix0 = np.floor((xmin - origin_x) / cell_size).astype(np.int64)
+    ix1 = np.floor((xmax - origin_x) / cell_size).astype(np.int64)
+    iy0 = np.floor((ymin - origin_y) / cell_size).astype(np.int64)
+    iy1 = np.floor((ymax - origin_y) / cell_size).astype(np.int64)
+    nx = ix1 - ix0 + 1
+    ny = iy1 - iy0 + 1
+    counts = nx * ny
+
+    # (設備, セル) のエントリを一括展開
+    owner = np.repeat(np.arange(n, dtype=np.int64), counts)
+    starts = np.cumsum(counts) - counts
+    local = np.arange(owner.size, dtype=np.int64) - np.repeat(starts, counts)
+    cx = ix0[owner] + local % nx[owner]
+    cy = iy0[owner] + local // nx[owner]
+    cell_id = cx * (int(iy1.max()) + 1) + cy
+
+    # セル番号でソートし、同じセル内の組み合わせを列挙
+    order = np.lexsort((owner, cell_id))
+    cell_id = cell_id[order]
+    owner = owner[order]
+    pairs = []
+    k = 1
+    while k < owner.size:
+        same = cell_id[k:] == cell_id[:-k]
+        if not same.any():
+            break
+        pairs.append(np.stack([owner[:-k][same], owner[k:][same]], axis=1))
+        k += 1
+    if not pairs:
+        return np.empty((0, 2), dtype=np.int64)
+
+    # 複数セルで重複したペアを除去
+    pairs = np.concatenate(pairs)
+    keys = np.unique(pairs[:, 0] * n + pairs[:, 1])
+    return np.stack([keys // n, keys % n], axis=1)
+
+
+def aabb_overlap(pairs, xmin, ymin, xmax, ymax):
+    """候補ペアの外接矩形が重なっているかを一括判定する（接触は衝突としない）"""
+    i, j = pairs[:, 0], pairs[:, 1]
+    return ((xmin[i] < xmax[j]) & (xmax[i] > xmin[j]) &
+            (ymin[i] < ymax[j]) & (ymax[i] > ymin[j]))
+
+
+def sat_overlap(pairs, x, y, w, l, rot):
+    """候補ペアの回転矩形が重なっているかを分離軸定理で一括判定する
+
+    各ペアについて両矩形の辺方向 4 軸に投影し、どの軸でも
+    中心間距離が投影半径の和より小さければ重なりとみなす。
+    """
+    if len(pairs) == 0:
+        return np.zeros(0, dtype=bool)
+    i, j = pairs[:, 0], pairs[:, 1]
+    u, v = rotation_axes(rot)
+    ux_i, uy_i, vx_i, vy_i = u[i, 0], u[i, 1], v[i, 0], v[i, 1]
+    ux_j, uy_j, vx_j, vy_j = u[j, 0], u[j, 1], v[j, 0], v[j, 1]
+    hw_i, hl_i = w[i] / 2, l[i] / 2
+    hw_j, hl_j = w[j] / 2, l[j] / 2
+
+    # 両矩形の相対角の |cos|, |sin|（直交基底同士なので 2 つの内積で足りる）
+    c = np.abs(ux_i * ux_j + uy_i * uy_j)
+    s = np.abs(ux_i * vx_j + uy_i * vy_j)
+
+    # 中心間ベクトル
+    dx = x[j] - x[i]
+    dy = y[j] - y[i]
+
+    # 各軸への中心間距離の投影 < 投影半径の和 を 4 軸すべてで満たせば重なり
+    limit_ui = hw_i + hw_j * c + hl_j * s
+    limit_vi = hl_i + hw_j * s + hl_j * c
+    limit_uj = hw_j + hw_i * c + hl_i * s
+    limit_vj = hl_j + hw_i * s + hl_i * c
+    return ((np.abs(dx * ux_i + dy * uy_i) < limit_ui - SAT_EPSILON) &
+            (np.abs(dx * vx_i + dy * vy_i) < limit_vi - SAT_EPSILON) &
+            (np.abs(dx * ux_j + dy * uy_j) < limit_uj - SAT_EPSILON) &
+            (np.abs(dx * vx_j + dy * vy_j) < limit_vj - SAT_EPSILON))
+
+
+def collision_pairs(x, y, w, l, rot):
+    """配列から衝突ペアを shape (k, 2) の配列で返す"""
+    if len(x) < 2:
+        return np.empty((0, 2), dtype=np.int64)
+    xmin, ymin, xmax, ymax = rotated_bounds(x, y, w, l, rot)
+    pairs = broad_phase_pairs(xmin, ymin, xmax, ymax)
+    return pairs[sat_overlap(pairs, x, y, w, l, rot)]
+
+
+def rectangle_gaps(pairs, x, y, w, l, rot):
+    """ペアごとの回転矩形どうしの最短距離（重なっていれば 0）
+
+    重なっていない凸多角形どうしの距離は、一方の頂点と他方の辺の距離の最小なので、
+    両方向の 4 頂点 x 4 辺をまとめて計算する。
+    """
+    if len(pairs) == 0:
+        return np.zeros(0)
+    corners = rectangle_corners(x, y, w, l, rot)
+    a, b = corners[pairs[:, 0]], corners[pairs[:, 1]]
+    gaps = np.minimum(_vertex_edge_distance(a, b), _vertex_edge_distance(b, a))
+    gaps[sat_overlap(pairs, x, y, w, l, rot)] = 0.0
+    return gaps
+
+
+def _vertex_edge_distance(points, polygons):
+    """points (k, 4, 2) の各頂点と polygons (k, 4, 2) の各辺の距離の最小 (k,)"""
+    start = polygons[:, None, :, :]
+    edge = np.roll(polygons, -1, axis=1)[:, None, :, :] - start
+    offset = points[:, :, None, :] - start
+    length2 = np.maximum((edge ** 2).sum(axis=-1), 1e-18)
+    t = np.clip((offset * edge).sum(axis=-1) / length2, 0.0, 1.0)
+    nearest = offset - t[..., None] * edge
+    return np.sqrt((nearest ** 2).sum(axis=-1)).min(axis=(1, 2))
+
+
+def item_clearance(x, y, w, l, rot, factory_width, factory_length, radius):
+    """設備ごとの、最も近い設備または壁までの距離（重なり・はみ出しは 0）
+
+    radius より遠い設備は探さないので、戻り値は radius で頭打ちになる。
+    """
+    n = len(x)
+    if n == 0:
+        return np.zeros(0)
+    xmin, ymin, xmax, ymax = rotated_bounds(x, y, w, l, rot)
+    clearance = np.minimum.reduce([xmin, ymin, factory_width - xmax, factory_length - ymax])
+    clearance = np.clip(clearance, 0.0, radius)
+    if n > 1:
+        # 外接矩形を radius / 2 ずつ広げて重なるペアだけを近くの設備の候補にする
+        margin = radius / 2
+        grown = (xmin - margin, ymin - margin, xmax + margin, ymax + margin)
+        pairs = broad_phase_pairs(*grown)
+        pairs = pairs[aabb_overlap(pairs, *grown)]
+        gaps = rectangle_gaps(pairs, x, y, w, l, rot)
+        np.minimum.at(clearance, pairs[:, 0], gaps)
+        np.minimum.at(clearance, pairs[:, 1], gaps)
+    return clearance
+
+
+def detect_collisions(equipment_list):
+    """重なっている設備の組 (i, j) を i < j の辞書順で返す（回転を考慮）"""
+    if len(equipment_list) < 2:
+        return []
+    hits = collision_pairs(*equipment_arrays(equipment_list))
+    return [(int(i), int(j)) for i, j in hits]
+
+
+def detect_collisions_naive(equipment_list):
+    """全ペアを比較する従来の実装（回転なし、ベンチマークと検証用）"""
+    collisions = []
+    for i, equip1 in enumerate(equipment_list):
+        for j, equip2 in enumerate(equipment_list[i+1:], i+1):
+            x1_min = equip1["x"] - equip1["width"]/2
+            x1_max = equip1["x"] + equip1["width"]/2
+            y1_min = equip1["y"] - equip1["length"]/2
+            y1_max = equip1["y"] + equip1["length"]/2
+
+            x2_min = equip2["x"] - equip2["width"]/2
+            x2_max = equip2["x"] + equip2["width"]/2
+            y2_min = equip2["y"] - equip2["length"]/2
+            y2_max = equip2["y"] + equip2["length"]/2
+
+            if (x1_min < x2_max and x1_max > x2_min and
+                y1_min < y2_max and y1_max > y2_min):
+                collisions.append((i, j))
+    return collisions
+
+
+# 設備がない状態から始めるときのグリッドのセルサイズ (m)
+DEFAULT_CELL_SIZE = 4.0
+
+
+class CollisionState:
+    """設備の追加・移動・削除に合わせて差分更新する衝突状態
+
+    一様グリッド（セル -> 設備）と衝突の隣接集合を保持し、
+    1 台の変更ではその設備の近傍だけを SAT で再判定する。
+    外部からは設備リストの添字 (index) で操作する。
+    """
+
+    def __init__(self, cell_size=DEFAULT_CELL_SIZE):
+        self.cell_size = cell_size
+        self._geometry = {}   # slot -> (x, y, width, length, rotation)
+        self._cells = {}      # slot -> 覆っているセルのタプル
+        self._grid = {}       # セル -> slot の集合
+        self._adjacent = {}   # slot -> 衝突している slot の集合
+        self._slots = []      # index -> slot
+        self._index_of = {}   # slot -> index（削除後は遅延再構築）
+        self._index_dirty = False
+        self._next_slot = 0
+
+    @classmethod
+    def from_equipment(cls, equipment_list):
+        state = cls()
+        state.rebuild(equipment_list)
+        return state
+
+    def __len__(self):
+        return len(self._slots)
+
+    def rebuild(self, equipment_list):
+        """設備リスト全体から状態を作り直す（読み込み・インポート時）"""
+        x, y, w, l, rot = equipment_arrays(equipment_list)
+        bounds = rotated_bounds(x, y, w, l, rot)
+        cell_size = choose_cell_size(*bounds) if len(equipment_list) else DEFAULT_CELL_SIZE
+        self.__init__(cell_size)
+
+        # 作り直した直後は slot と index が一致する
+        geometry = np.column_stack([x, y, w, l, rot]).tolist()
+        bounds = np.column_stack(bounds).tolist()
+        for index in range(len(equipment_list)):
+            slot = self._new_slot()
+            self._slots.append(slot)
+            self._index_of[slot] = index
+            self._geometry[slot] = tuple(geometry[index])
+            self._place(slot, bounds[index])
+            self._adjacent[slot] = set()
+
+        # 初回の衝突ペアは一括判定で求める
+        for i, j in collision_pairs(x, y, w, l, rot):
+            self._adjacent[int(i)].add(int(j))
+            self._adjacent[int(j)].add(int(i))
+
+    def add(self, equipment):
+        """設備をリスト末尾に追加したときに呼ぶ"""
+        slot = self._new_slot()
+        self._slots.append(slot)
+        if not self._index_dirty:
+            self._index_of[slot] = len(self._slots) - 1
+        self._adjacent[slot] = set()
+        self._set_geometry(slot, equipment)
+
+    def extend(self, equipment_list, start, stop=None):
+        """equipment_list の start から stop の手前まで（まとめて追加した設備）を一度に登録する
+
+        stop を省くと末尾まで。新しい設備をグリッドに置いてから、新しい設備が入ったセルの
+        候補ペアをまとめて SAT で判定する。
+        """
+        x, y, w, l, rot = (column[start:stop] for column in equipment_arrays(equipment_list))
+        geometry = np.column_stack([x, y, w, l, rot]).tolist()
+        bounds = np.column_stack(rotated_bounds(x, y, w, l, rot)).tolist()
+        added = []
+        for k in range(len(geometry)):
+            slot = self._new_slot()
+            self._adjacent[slot] = set()
+            self._geometry[slot] = tuple(geometry[k])
+            self._place(slot, bounds[k])
+            added.append(slot)
+        if start < len(self._slots):
+            # 途中に挿入したときは後ろの設備の番号がずれる
+            self._slots[start:start] = added
+            self._index_dirty = True
+        else:
+            self._slots.extend(added)
+            if not self._index_dirty:
+                self._index_of.update((slot, start + k) for k, slot in enumerate(added))
+
+        # slot は増える一方なので、other < slot の組だけを取れば同じ組を 2 回数えない
+        candidates = set()
+        for slot in added:
+            for cell in self._cells[slot]:
+                candidates.update((other, slot) for other in self._grid[cell] if other < slot)
+        if not candidates:
+            return
+        candidates = np.array(sorted(candidates), dtype=np.int64)
+        slots, pairs = np.unique(candidates, return_inverse=True)
+        arrays = np.array([self._geometry[slot] for slot in slots.tolist()]).T
+        hits = sat_overlap(pairs.reshape(-1, 2), *arrays)
+        for a, b in candidates[hits].tolist():
+            self._adjacent[a].add(b)
+            self._adjacent[b].add(a)
+
+    def insert(self, index, equipment):
+        """設備をリストの index の位置に挿入したときに呼ぶ（元に戻す・やり直すとき）"""
+        slot = self._new_slot()
+        self._slots.insert(index, slot)
+        self._index_of[slot] = index
+        self._index_dirty = True
+        self._adjacent[slot] = set()
+        self._set_geometry(slot, equipment)
+
+    def remove_range(self, start, stop):
+        """リストの start から stop の手前までの設備をまとめて削除したときに呼ぶ"""
+        for slot in self._slots[start:stop]:
+            self._detach(slot)
+            del self._adjacent[slot]
+            del self._geometry[slot]
+            self._index_of.pop(slot, None)
+        del self._slots[start:stop]
+        if start < len(self._slots):
+            self._index_dirty = True
+
+    def update(self, index, equipment):
+        """index の設備の位置・サイズ・回転が変わったときに呼ぶ"""
+        slot = self._slots[index]
+        geometry = _geometry_of(equipment)
+        if self._geometry.get(slot) == geometry:
+            return
+        self._detach(slot)
+        self._set_geometry(slot, equipment)
+
+    def remove(self, index):
+        """index の設備をリストから削除したときに呼ぶ"""
+        slot = self._slots.pop(index)
+        self._detach(slot)
+        del self._adjacent[slot]
+        del self._geometry[slot]
+        self._index_of.pop(slot, None)
+        if index < len(self._slots):
+            self._index_dirty = True
+
+    def pairs(self):
+        """衝突している設備の組 (i, j) を i < j の辞書順で返す"""
+        index_of = self._indices()
+        result = []
+        for slot, others in self._adjacent.items():
+            i = index_of[slot]
+            for other in others:
+                j = index_of[other]
+                if i < j:
+                    result.append((i, j))
+        result.sort()
+        return result
+
+    def colliding(self):
+        """何かと衝突している設備の index の集合"""
+        index_of = self._indices()
+        return {index_of[slot] for slot, others in self._adjacent.items() if others}
+
+    def neighbours(self, index):
+        """index の設備と衝突している設備の index の集合"""
+        index_of = self._indices()
+        return {index_of[slot] for slot in self._adjacent[self._slots[index]]}
+
+    def hit_test(self, x, y):
+        """点 (x, y) を含む設備のうち一番上に描かれる（index が最大の）設備の index。なければ None
+
+        点のあるセルに登録された設備だけを回転矩形で判定する。
+        """
+        size = self.cell_size
+        slots = self._grid.get((int(np.floor(x / size)), int(np.floor(y / size))))
+        if not slots:
+            return None
+        slots = list(slots)
+        x_, y_, w, l, rot = np.array([self._geometry[slot] for slot in slots]).T
+        hits = np.flatnonzero(contains_point(x_, y_, w, l, rot, x, y))
+        if not len(hits):
+            return None
+        index_of = self._indices()
+        return max(index_of[slots[k]] for k in hits.tolist())
+
+    # 内部処理
+    def _new_slot(self):
+        slot = self._next_slot
+        self._next_slot += 1
+        return slot
+
+    def _indices(self):
+        if self._index_dirty:
+            self._index_of = {slot: index for index, slot in enumerate(self._slots)}
+            self._index_dirty = False
+        return self._index_of
+
+    def _cell_range(self, bounds):
+        xmin, ymin, xmax, ymax = bounds
+        size = self.cell_size
+        ix0, ix1 = int(np.floor(xmin / size)), int(np.floor(xmax / size))
+        iy0, iy1 = int(np.floor(ymin / size)), int(np.floor(ymax / size))
+        return tuple((cx, cy) for cx in range(ix0, ix1 + 1) for cy in range(iy0, iy1 + 1))
+
+    def _place(self, slot, bounds):
+        cells = self._cell_range(bounds)
+        self._cells[slot] = cells
+        for cell in cells:
+            self._grid.setdefault(cell, set()).add(slot)
+
+    def _detach(self, slot):
+        # グリッドと隣接集合から slot を外す
+        for cell in self._cells.pop(slot, ()):
+            members = self._grid[cell]
+            members.discard(slot)
+            if not members:
+                del self._grid[cell]
+        for other in self._adjacent[slot]:
+            self._adjacent[other].discard(slot)
+        self._adjacent[slot] = set()
+
+    def _set_geometry(self, slot, equipment):
+        geometry = _geometry_of(equipment)
+        self._geometry[slot] = geometry
+        x, y, w, l, rot = (np.array([value]) for value in geometry)
+        bounds = tuple(float(b[0]) for b in rotated_bounds(x, y, w, l, rot))
+        self._place(slot, bounds)
+
+        # 同じセルにいる設備だけを候補として SAT で判定
+        candidates = set()
+        for cell in self._cells[slot]:
+            candidates.update(self._grid[cell])
+        candidates.discard(slot)
+        if not candidates:
+            return
+        candidates = list(candidates)
+        arrays = np.array([geometry] + [self._geometry[other] for other in candidates]).T
+        pairs = np.column_stack([np.zeros(len(candidates), dtype=np.int64),
+                                 np.arange(1, len(candidates) + 1)])
+        hits = sat_overlap(pairs, *arrays)
+        for other, hit in zip(candidates, hits):
+            if hit:
+                self._adjacent[slot].add(other)
+                self._adjacent[other].add(slot)
+
+
+def _geometry_of(equipment):
+    return (float(equipment["x"]), float(equipment["y"]), float(equipment["width"]),
+            float(equipment["length"]), float(equipment.get("rotation", 0)))
@@ -0,0 +1,397 @@
+"""コンベヤーラインの接続とスループット
+
+コンベヤーは長さ方向に流れる（回転 0 度で y が増える向き）ものとし、始端・終端を持つ。
+端点が tolerance (m) 以内で接している設備どうしを有向グラフにつなぐ。
+
+- コンベヤー c の終端が設備 r に接していれば c -> r（r がコンベヤーなら、r の終端付近は除く）
+- コンベヤー c の始端が設備 r に接していれば r -> c（r がコンベヤーなら、r の始端付近は除く）
+
+設備の種類ごとの処理能力 (個/時) をノードの容量として、流入のない設備を投入口、
+流出のない設備を払い出し口とした最大流でラインの流量を求める。最小カットの容量いっぱいの
+設備がボトルネック、その上流で行き場のない設備は詰まり（バッファが満杯）とする。
+それ以外の設備のバッファ（コンベヤーは長さ / pitch 個、ほかは 1 個）の中身は
+稼働率 ρ から ρ / (1 - ρ) で見積もる。
+
+接続は設備の変更分だけ一様グリッドで探し直し、流量はつながった部分（連結成分）ごとに
+覚えておくので、1 台を動かしたときに解き直すのはその設備を含むラインだけになる。
+"""
+import math
+from collections import deque
+
+import numpy as np
+
+from collision import choose_cell_size
+from geometry import rotated_bounds
+
+DEFAULT_TOLERANCE = 0.3
+# コンベヤー 1 個分の間隔 (m)
+DEFAULT_PITCH = 1.0
+# 種類ごとの値がないときの処理能力 (個/時)
+DEFAULT_RATE = 60.0
+CONVEYOR_TYPE = "conveyor"
+# ラインに含めない種類（動き回る設備）
+EXCLUDED_TYPES = ("agv",)
+EPSILON = 1e-9
+
+
+class ConveyorNetwork:
+    """設備の接続グラフと、連結成分ごとの流量の計算結果を差分で更新しながら持つ
+
+    設備は (x, y, 幅, 長さ, 回転, 種類) と同じ値の何番目か で見分けるので、
+    設備リストの並びが削除で変わっても動いていない設備の接続と結果はそのまま使う。
+    """
+
+    def __init__(self, tolerance=DEFAULT_TOLERANCE, pitch=DEFAULT_PITCH):
+        self.tolerance = tolerance
+        self.pitch = pitch
+        self.cell_size = None
+        self.evaluated = 0       # 直前の analyze で解き直した設備の数
+        self._successors = {}    # key -> 下流の key の集合
+        self._predecessors = {}  # key -> 上流の key の集合
+        self._rectangles = {}    # セル -> そのセルに（tolerance だけ広げて）かかる key の集合
+        self._starts = {}        # セル -> 始端がそのセルにあるコンベヤーの key の集合
+        self._ends = {}          # セル -> 終端がそのセルにあるコンベヤーの key の集合
+        self._cells = {}         # key -> 登録したセルのタプル
+        self._component = {}     # key -> 連結成分の番号
+        self._lines = {}         # 連結成分の番号 -> 計算結果
+        self._rates = None
+        self._default_rate = None
+        self._next_component = 0
+
+    def analyze(self, store, rates=None, default_rate=DEFAULT_RATE):
+        """設備リストのラインの接続・流量・ボトルネック・バッファの中身を求める
+
+        rates は種類ごとの処理能力 {種類: 個/時}。戻り値は設備リストの並びの配列を持つ辞書で、
+        ラインに含めない設備の値は nan（真偽値は False）。
+        """
+        rates = dict(rates or {})
+        keys = _row_keys(store)
+        current = set(keys)
+        if self.cell_size is None and len(store):
+            self.cell_size = choose_cell_size(*rotated_bounds(*store.arrays()))
+
+        touched = set()
+        for key in [key for key in self._successors if key not in current]:
+            touched |= self._remove(key)
+        for key in current:
+            if key not in self._successors and key[5] not in EXCLUDED_TYPES:
+                touched |= self._add(key)
+        if rates != self._rates or default_rate != self._default_rate:
+            self._rates, self._default_rate = rates, default_rate
+            touched |= set(self._successors)
+        self._reevaluate(touched)
+        return self._collect(keys)
+
+    def edges(self, store):
+        """直前に analyze した設備リストでの接続 (上流の index, 下流の index) を (k, 2) で返す"""
+        index = {key: i for i, key in enumerate(_row_keys(store))}
+        pairs = [(index[a], index[b]) for a, successors in self._successors.items() if a in index
+                 for b in successors if b in index]
+        return np.array(sorted(pairs), dtype=np.int64).reshape(-1, 2)
+
+    # 接続グラフの更新
+    def _add(self, key):
+        """key の設備を加えて、接続を探す。影響を受けた key の集合を返す"""
+        self._successors[key] = set()
+        self._predecessors[key] = set()
+        touched = {key}
+        tolerance = self.tolerance
+        xmin, ymin, xmax, ymax = _bounds(key)
+        covered = self._cell_range(xmin - tolerance, ymin - tolerance, xmax + tolerance, ymax + tolerance)
+        cells = list(covered)
+        for cell in covered:
+            self._rectangles.setdefault(cell, set()).add(key)
+
+        # 既にあるコンベヤーの端点がこの設備に接しているか
+        for cell in covered:
+            for other in self._ends.get(cell, ()):
+                if other != key and self._feeds(other, key):
+                    touched |= self._link(other, key)
+            for other in self._starts.get(cell, ()):
+                if other != key and self._drains(key, other):
+                    touched |= self._link(key, other)
+
+        if key[5] == CONVEYOR_TYPE:
+            start, end = _endpoints(key)
+            start_cell, end_cell = self._cell_of(*start), self._cell_of(*end)
+            self._starts.setdefault(start_cell, set()).add(key)
+            self._ends.setdefault(end_cell, set()).add(key)
+            cells += [("start", start_cell), ("end", end_cell)]
+            for other in list(self._rectangles.get(end_cell, ())):
+                if other != key and self._feeds(key, other):
+                    touched |= self._link(key, other)
+            for other in list(self._rectangles.get(start_cell, ())):
+                if other != key and self._drains(other, key):
+                    touched |= self._link(other, key)
+        self._cells[key] = tuple(cells)
+        return touched
+
+    def _remove(self, key):
+        """key の設備を外す。接続していた key（と key 自身）の集合を返す"""
+        for cell in self._cells.pop(key):
+            if cell[0] == "start":
+                _discard(self._starts, cell[1], key)
+            elif cell[0] == "end":
+                _discard(self._ends, cell[1], key)
+            else:
+                _discard(self._rectangles, cell, key)
+        neighbors = self._successors.pop(key) | self._predecessors.pop(key)
+        for other in neighbors:
+            self._successors[other].discard(key)
+            self._predecessors[other].discard(key)
+        return neighbors | {key}
+
+    def _link(self, upstream, downstream):
+        self._successors[upstream].add(downstream)
+        self._predecessors[downstream].add(upstream)
+        return {upstream, downstream}
+
+    def _feeds(self, conveyor, other):
+        """コンベヤー conveyor の終端が other に流れ込むか"""
+        point = _endpoints(conveyor)[1]
+        if _distance_to(other, point) > self.tolerance:
+            return False
+        return other[5] != CONVEYOR_TYPE or _along(other, point) < other[3] - self.tolerance
+
+    def _drains(self, other, conveyor):
+        """other からコンベヤー conveyor の始端へ流れ出すか"""
+        point = _endpoints(conveyor)[0]
+        if _distance_to(other, point) > self.tolerance:
+            return False
+        return other[5] != CONVEYOR_TYPE or _along(other, point) > self.tolerance
+
+    def _cell_of(self, x, y):
+        return (math.floor(x / self.cell_size), math.floor(y / self.cell_size))
+
+    def _cell_range(self, xmin, ymin, xmax, ymax):
+        x0, y0 = self._cell_of(xmin, ymin)
+        x1, y1 = self._cell_of(xmax, ymax)
+        return tuple((cx, cy) for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1))
+
+    # 流量の計算
+    def _reevaluate(self, touched):
+        """touched を含む連結成分の結果を捨てて、その成分だけ解き直す"""
+        stale = {self._component.pop(key) for key in touched if key in self._component}
+        members = set()
+        for component in stale:
+            members |= self._lines.pop(component)["members"]
+        members = {key for key in members | touched if key in self._successors}
+        for key in members:
+            self._component.pop(key, None)
+        self.evaluated = len(members)
+
+        for seed in members:
+            if seed in self._component:
+                continue
+            component = self._next_component
+            self._next_component += 1
+            nodes, queue = [seed], deque([seed])
+            self._component[seed] = component
+            while queue:
+                key = queue.popleft()
+                for other in self._successors[key] | self._predecessors[key]:
+                    if other not in self._component:
+                        self._component[other] = component
+                        nodes.append(other)
+                        queue.append(other)
+            self._lines[component] = self._solve(nodes)
+
+    def _solve(self, nodes):
+        """1 つの連結成分の最大流と、設備ごとの流量・稼働率・バッファの中身"""
+        capacity = [float(self._rates.get(key[5], self._default_rate)) for key in nodes]
+        sources = [k for k, key in enumerate(nodes) if not self._predecessors[key]]
+        sinks = [k for k, key in enumerate(nodes) if not self._successors[key]]
+        index = {key: k for k, key in enumerate(nodes)}
+        links = [(index[key], index[other]) for key in nodes for other in self._successors[key]]
+        flow, supplied, passed = _max_flow(capacity, links, sources, sinks)
+
+        results = {}
+        for k, key in enumerate(nodes):
+            rho = flow[k] / capacity[k] if capacity[k] > 0 else 0.0
+            bottleneck = supplied[k] and not passed[k]
+            # ボトルネックより上流で流れきれない設備はバッファが埋まる
+            blocked = passed[k]
+            buffer = max(key[3] / self.pitch, 1.0) if key[5] == CONVEYOR_TYPE else 1.0
+            if bottleneck or blocked or rho >= 1 - EPSILON:
+                occupancy = buffer
+            else:
+                occupancy = min(rho / (1 - rho), buffer)
+            results[key] = (flow[k], rho, occupancy, buffer, bottleneck, blocked)
+        return {"members": set(nodes), "nodes": results,
+                "throughput": sum(flow[k] for k in sinks)}
+
+    def _collect(self, keys):
+        n = len(keys)
+        line = np.full(n, -1, dtype=np.int64)
+        values = np.full((n, 4), np.nan)
+        flags = np.zeros((n, 2), dtype=bool)
+        for i, key in enumerate(keys):
+            component = self._component.get(key)
+            if component is None:
+                continue
+            flow, rho, occupancy, buffer, bottleneck, blocked = self._lines[component]["nodes"][key]
+            line[i] = component
+            values[i] = flow, rho, occupancy, buffer
+            flags[i] = bottleneck, blocked
+
+        # 2 台以上つながった成分をラインとして、最初の設備の並び順に番号を振り直す
+        lines = []
+        numbers = {}
+        for i, component in enumerate(line.tolist()):
+            if component < 0 or len(self._lines[component]["members"]) < 2:
+                continue
+            if component not in numbers:
+                numbers[component] = len(lines)
+                lines.append({"items": [], "throughput": self._lines[component]["throughput"],
+                              "bottlenecks": []})
+            entry = lines[numbers[component]]
+            entry["items"].append(i)
+            if flags[i, 0]:
+                entry["bottlenecks"].append(i)
+        line = np.array([numbers.get(component, -1) for component in line.tolist()], dtype=np.int64)
+        return {
+            "line": line,
+            "throughput": values[:, 0],
+            "utilization": values[:, 1],
+            "occupancy": values[:, 2],
+            "buffer": values[:, 3],
+            "bottleneck": flags[:, 0],
+            "blocked": flags[:, 1],
+            "lines": lines,
+            "evaluated": self.evaluated,
+        }
+
+
+def _max_flow(capacity, links, sources, sinks):
+    """設備に容量のある最大流（Dinic 法）
+
+    設備 k を入口 2k と出口 2k+1 に分け、その間の辺の容量を capacity[k] にする。
+    投入口へ・払い出し口からは容量無限の辺を張り、最小カットが必ず設備の辺になるようにする。
+    戻り値は (設備ごとの流量, 残余グラフで入口に届くか, 出口に届くか)。
+    """
+    n = len(capacity)
+    source, sink = 2 * n, 2 * n + 1
+    head = [[] for _ in range(2 * n + 2)]
+    target, residual = [], []
+
+    def add(u, v, amount):
+        head[u].append(len(target))
+        target.append(v)
+        residual.append(amount)
+        head[v].append(len(target))
+        target.append(u)
+        residual.append(0.0)
+
+    for k in range(n):
+        add(2 * k, 2 * k + 1, capacity[k])
+    for a, b in links:
+        add(2 * a + 1, 2 * b, math.inf)
+    for k in sources:
+        add(source, 2 * k, math.inf)
+    for k in sinks:
+        add(2 * k + 1, sink, math.inf)
+
+    def levels():
+        level = [-1] * len(head)
+        level[source] = 0
+        queue = deque([source])
+        while queue:
+            u = queue.popleft()
+            for e in head[u]:
+                if residual[e] > EPSILON and level[target[e]] < 0:
+                    level[target[e]] = level[u] + 1
+                    queue.append(target[e])
+        return level
+
+    level = levels()
+    while level[sink] >= 0:
+        pointer = [0] * len(head)
+        while True:
+            # 階層グラフで増加路を 1 本探す（再帰しない深さ優先探索）
+            stack, path = [source], []
+            while stack and stack[-1] != sink:
+                u = stack[-1]
+                edges = head[u]
+                while pointer[u] < len(edges):
+                    e = edges[pointer[u]]
+                    if residual[e] > EPSILON and level[target[e]] == level[u] + 1:
+                        break
+                    pointer[u] += 1
+                if pointer[u] < len(edges):
+                    stack.append(target[edges[pointer[u]]])
+                    path.append(edges[pointer[u]])
+                else:
+                    # 行き止まりは以後たどらない
+                    level[u] = -1
+                    stack.pop()
+                    if path:
+                        path.pop()
+                        pointer[stack[-1]] += 1
+            if not stack:
+                break
+            amount = min(residual[e] for e in path)
+            for e in path:
+                residual[e] -= amount
+                residual[e ^ 1] += amount
+        level = levels()
+
+    reached = [value >= 0 for value in level]
+    # 設備 k の入口から出口への辺は 2k 番目に張ったので、逆向きの辺の残余がその流量
+    flow = [residual[2 * k + 1] for k in range(n)]
+    return flow, reached[0::2][:n], reached[1::2][:n]
+
+
+def _row_keys(store):
+    """設備ごとの (x, y, 幅, 長さ, 回転, 種類, 同じ値の何番目か)"""
+    seen = {}
+    keys = []
+    columns = [column.tolist() for column in store.arrays()] + [store.strings("type").tolist()]
+    for row in zip(*columns):
+        count = seen.get(row, 0)
+        seen[row] = count + 1
+        keys.append(row + (count,))
+    return keys
+
+
+def _axes(key):
+    angle = math.radians(key[4])
+    return math.cos(angle), math.sin(angle)
+
+
+def _bounds(key):
+    x, y, width, length = key[:4]
+    cos, sin = _axes(key)
+    ex = width / 2 * abs(cos) + length / 2 * abs(sin)
+    ey = width / 2 * abs(sin) + length / 2 * abs(cos)
+    return x - ex, y - ey, x + ex, y + ey
+
+
+def _endpoints(key):
+    """コンベヤーの始端と終端（長さ方向 v = (-sin, cos) の両端）"""
+    x, y, _, length = key[:4]
+    cos, sin = _axes(key)
+    dx, dy = -sin * length / 2, cos * length / 2
+    return (x - dx, y - dy), (x + dx, y + dy)
+
+
+def _distance_to(key, point):
+    """点から回転矩形 key までの距離（内側は 0）"""
+    cos, sin = _axes(key)
+    dx, dy = point[0] - key[0], point[1] - key[1]
+    outside_u = max(abs(dx * cos + dy * sin) - key[2] / 2, 0.0)
+    outside_v = max(abs(-dx * sin + dy * cos) - key[3] / 2, 0.0)
+    return math.hypot(outside_u, outside_v)
+
+
+def _along(key, point):
+    """コンベヤー key の始端から流れの向きに測った point の位置 (m)"""
+    cos, sin = _axes(key)
+    return (point[0] - key[0]) * -sin + (point[1] - key[1]) * cos + key[3] / 2
+
+
+def _discard(grid, cell, key):
+    members = grid.get(cell)
+    if members is not None:
+        members.discard(key)
+        if not members:
+            del grid[cell]
@@ -0,0 +1,196 @@
+"""設備が実際に占める面積と密度（回転した設備をセルに塗って数える）
+
+工場の床を resolution (m) 四方のセルに分け、中心が設備の内側にあるセルをその設備が
+占めるセルとする。全設備の占めるセルを行ごとの区間として一括で求め、
+セルごとの重なり数と、一番上（index が最大）の設備を 1 回でまとめて数える。
+
+- 占有面積: 1 台以上に占められたセルの面積（重なりを二重に数えない）
+- 重なり面積: 2 台以上に占められたセルの面積
+- 区画ごとの密度: zone_size (m) 四方の区画ごとの占有セルの割合
+- 種類ごとの面積: 各セルを一番上の設備の種類に数えた面積（合計は占有面積と一致する）
+
+セルの数が MAX_CELLS を超える広い工場ではセルを粗くする。
+結果はレイアウトの形のハッシュごとに CoverageAnalyzer が覚えておく。
+"""
+import hashlib
+import math
+from collections import OrderedDict
+
+import numpy as np
+
+from geometry import rotated_bounds
+
+DEFAULT_RESOLUTION = 0.1
+DEFAULT_ZONE_SIZE = 5.0
+MAX_CELLS = 1 << 22
+# 一度に展開するセル数の上限（メモリ使用量の目安）
+CHUNK_CELLS = 1 << 21
+
+
+class CoverageAnalyzer:
+    """レイアウトの形ごとに面積の集計結果を覚えておく"""
+
+    def __init__(self, resolution=DEFAULT_RESOLUTION, zone_size=DEFAULT_ZONE_SIZE, max_results=4):
+        self.resolution = resolution
+        self.zone_size = zone_size
+        self.max_results = max_results
+        self._results = OrderedDict()
+
+    def analyze(self, store, factory_width, factory_length):
+        """coverage_statistics() の結果（同じレイアウトなら覚えておいたもの）を返す"""
+        key = _layout_key(store, factory_width, factory_length, self.resolution, self.zone_size)
+        result = self._results.get(key)
+        if result is None:
+            result = coverage_statistics(store, factory_width, factory_length, self.resolution,
+                                         self.zone_size)
+            self._results[key] = result
+            while len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+        else:
+            self._results.move_to_end(key)
+        return result
+
+
+def coverage_statistics(store, factory_width, factory_length, resolution=DEFAULT_RESOLUTION,
+                        zone_size=DEFAULT_ZONE_SIZE):
+    """床の上の占有面積・空き面積・重なり面積・区画ごとの密度・種類ごとの集計を求める
+
+    戻り値は次のキーを持つ辞書（面積は m²）:
+    nominal_area（幅 x 長さ の合計）, covered_area, overlap_area, free_area, factory_area,
+    resolution（実際に使ったセルの大きさ）, zone_size, density（区画ごとの占有割合の 2 次元配列）,
+    types（{種類: {"count", "nominal_area", "covered_area"}}）
+    """
+    factory_area = float(factory_width) * float(factory_length)
+    counts, top, resolution = _count_cells(*store.arrays(), factory_width, factory_length, resolution)
+    rows, columns = counts.shape
+    counts = counts.ravel()
+    top = top.ravel()
+    scale = 1.0 / resolution
+
+    cell_area = resolution * resolution
+    covered = counts > 0
+    codes = store.codes("type")
+    table = store.table("type")
+    covered_by_type = np.bincount(codes[top[covered] - 1], minlength=len(table)) * cell_area
+    count_by_type = np.bincount(codes, minlength=len(table))
+    nominal = store.width * store.length
+    nominal_by_type = np.bincount(codes, weights=nominal, minlength=len(table))
+    types = {equipment_type: {"count": int(count_by_type[k]), "nominal_area": float(nominal_by_type[k]),
+                              "covered_area": float(covered_by_type[k])}
+             for k, equipment_type in enumerate(table) if count_by_type[k]}
+
+    covered_area = float(covered.sum()) * cell_area
+    return {
+        "items": len(store),
+        "nominal_area": float(nominal.sum()),
+        "covered_area": covered_area,
+        "overlap_area": float((counts > 1).sum()) * cell_area,
+        "free_area": max(factory_area - covered_area, 0.0),
+        "factory_area": factory_area,
+        "resolution": resolution,
+        "zone_size": zone_size,
+        "density": _zone_density(covered.reshape(rows, columns), max(int(round(zone_size * scale)), 1)),
+        "types": types,
+    }
+
+
+def covered_area(x, y, width, length, rotation, factory_width, factory_length,
+                 resolution=DEFAULT_RESOLUTION):
+    """設備の配列から床の上の占有面積 (m²) だけを求める（重なりは二重に数えない）"""
+    counts, _, resolution = _count_cells(x, y, width, length, rotation, factory_width,
+                                         factory_length, resolution)
+    return float(np.count_nonzero(counts)) * resolution * resolution
+
+
+def _count_cells(x, y, width, length, rotation, factory_width, factory_length, resolution):
+    """セルごとの重なり数と一番上の設備の index + 1（0 は空き）、実際に使ったセルの大きさを返す"""
+    factory_area = float(factory_width) * float(factory_length)
+    resolution = max(resolution, math.sqrt(factory_area / MAX_CELLS)) if factory_area > 0 else resolution
+    scale = 1.0 / resolution
+    # 中心が床の内側にあるセルだけを数える
+    rows = max(int(math.ceil(factory_length * scale - 0.5)), 1)
+    columns = max(int(math.ceil(factory_width * scale - 0.5)), 1)
+    counts = np.zeros(rows * columns, dtype=np.int32)
+    top = np.zeros(rows * columns, dtype=np.int64)
+    for items, cells in _footprint_cells(x * scale, y * scale, width * scale, length * scale, rotation,
+                                         rows, columns):
+        counts += np.bincount(cells, minlength=counts.size).astype(np.int32)
+        # 同じセルへの代入は後のもの（index の大きい設備）が残る
+        top[cells] = items + 1
+    return counts.reshape(rows, columns), top.reshape(rows, columns), resolution
+
+
+def _footprint_cells(x, y, width, length, rotation, rows, columns):
+    """中心が回転矩形の内側にあるセルを (設備の index, 平坦化したセル番号) の組で区切って返す
+
+    座標はセル単位。行ごとに、行の中心の高さで矩形を切った区間を
+    幅方向・長さ方向の 2 つの帯の共通部分として求める。
+    """
+    n = len(x)
+    if n == 0:
+        return
+    xmin, ymin, xmax, ymax = rotated_bounds(x, y, width, length, rotation)
+    row0 = np.maximum(np.ceil(ymin - 0.5), 0).astype(np.int64)
+    row1 = np.minimum(np.floor(ymax - 0.5), rows - 1).astype(np.int64)
+    row_counts = np.maximum(row1 - row0 + 1, 0)
+    box = np.maximum(np.floor(xmax - 0.5) - np.ceil(xmin - 0.5) + 1, 0)
+    angle = np.radians(rotation)
+    cos, sin = np.cos(angle), np.sin(angle)
+    # 行の中心 yc で、幅方向 |(p - c)·u| <= w/2 と長さ方向 |(p - c)·v| <= l/2 を x の区間にする
+    axes = ((cos, sin, width / 2), (-sin, cos, length / 2))
+
+    cumulative = np.cumsum(row_counts * box)
+    start = 0
+    while start < n:
+        limit = (cumulative[start - 1] if start else 0) + CHUNK_CELLS
+        stop = max(int(np.searchsorted(cumulative, limit, side="right")), start + 1)
+        counts = row_counts[start:stop]
+        item = np.repeat(np.arange(start, stop), counts)
+        offsets = np.cumsum(counts) - counts
+        row = row0[item] + (np.arange(len(item)) - np.repeat(offsets, counts))
+        dy = row + 0.5 - y[item]
+        lo = np.full(len(item), -np.inf)
+        hi = np.full(len(item), np.inf)
+        for ax, ay, half in axes:
+            ax, ay, half = ax[item], ay[item], half[item]
+            flat = np.abs(ax) < 1e-12
+            safe = np.where(flat, 1.0, ax)
+            a = (-half - dy * ay) / safe
+            b = (half - dy * ay) / safe
+            # 軸が水平に近い帯は x によらず、行が帯の中にあるかだけで決まる
+            inside = np.abs(dy * ay) <= half
+            lo = np.maximum(lo, np.where(flat, np.where(inside, -np.inf, np.inf), np.minimum(a, b)))
+            hi = np.minimum(hi, np.where(flat, np.where(inside, np.inf, -np.inf), np.maximum(a, b)))
+        center = x[item]
+        column0 = np.maximum(np.ceil(lo + center - 0.5), 0)
+        column1 = np.minimum(np.floor(hi + center - 0.5), columns - 1)
+        spans = np.maximum(column1 - column0 + 1, 0).astype(np.int64)
+        keep = spans > 0
+        spans, item = spans[keep], item[keep]
+        first = row[keep] * columns + column0[keep].astype(np.int64)
+        span_offsets = np.cumsum(spans) - spans
+        cells = np.repeat(first - span_offsets, spans) + np.arange(int(spans.sum()))
+        yield np.repeat(item, spans), cells
+        start = stop
+
+
+def _zone_density(covered, zone_cells):
+    """zone_cells 四方の区画ごとの占有セルの割合"""
+    rows, columns = covered.shape
+    row_starts = np.arange(0, rows, zone_cells)
+    column_starts = np.arange(0, columns, zone_cells)
+    totals = np.add.reduceat(np.add.reduceat(covered.astype(np.int64), row_starts, axis=0),
+                             column_starts, axis=1)
+    heights = np.diff(np.append(row_starts, rows))
+    widths = np.diff(np.append(column_starts, columns))
+    return totals / np.outer(heights, widths)
+
+
+def _layout_key(store, factory_width, factory_length, resolution, zone_size):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((float(factory_width), float(factory_length), float(resolution),
+                        float(zone_size))).encode())
+    digest.update(np.ascontiguousarray(np.stack(store.arrays())).tobytes())
+    digest.update(np.ascontiguousarray(store.codes("type")).tobytes())
+    digest.update("\0".join(store.table("type")).encode())
+    return digest.hexdigest()
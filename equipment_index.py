@@ -0,0 +1,77 @@
+"""設備一覧の検索と、一覧の表のページ分け
+
+数万台の設備を 1 つの表にしたり選択肢に並べたりすると、表の作成とブラウザへの送信で
+再実行が遅くなる。ここでは一覧を次のように扱う。
+
+- 検索は列を直接使う。ラベルは intern テーブル（重複のないラベル）だけを小文字にした索引で
+  部分一致を調べ、当てはまるコードを持つ設備を NumPy でまとめて選ぶ。種類と範囲も列の比較で選ぶ
+- 索引はラベルのテーブルに追加された分だけを足していく（テーブルが変わったときだけ作り直す）
+- 表は見ているページの行だけを作り、選択肢も検索で当てはまった設備の先頭だけにする
+"""
+import numpy as np
+
+from geometry import rotated_bounds
+from layout_core import equipment_table
+
+PAGE_SIZE = 100
+# 選択肢に並べる設備の上限（これより多いときは検索で絞り込む）
+MAX_OPTIONS = 200
+
+
+class EquipmentIndex:
+    """ラベル・種類・範囲で設備を探す索引"""
+
+    def __init__(self):
+        self._table = None   # 索引を作ったラベルのテーブル（ストアのリストそのもの）
+        self._lowered = []   # ラベルのコード -> 小文字にしたラベル
+
+    def search(self, store, text="", equipment_type=None, region=None):
+        """当てはまる設備の index の配列（昇順）
+
+        text はラベルの部分一致（大文字小文字を区別しない）。数字だけのときは一覧の番号（1 から）にも
+        一致させる。equipment_type は種類、region は (xmin, ymin, xmax, ymax) [m] で、
+        回転した設備の外接矩形が掛かっていれば当てはまる。
+        """
+        mask = np.ones(len(store), dtype=bool)
+        text = text.strip().lower()
+        if text:
+            codes = self._matching_labels(store, text)
+            found = np.isin(store.codes("label"), codes)
+            if text.isdigit() and 0 < int(text) <= len(store):
+                found[int(text) - 1] = True
+            mask &= found
+        if equipment_type is not None:
+            table = store.table("type")
+            code = table.index(equipment_type) if equipment_type in table else -1
+            mask &= store.codes("type") == code
+        if region is not None:
+            xmin, ymin, xmax, ymax = rotated_bounds(*store.arrays())
+            left, top, right, bottom = region
+            mask &= (xmax >= left) & (xmin <= right) & (ymax >= top) & (ymin <= bottom)
+        return np.flatnonzero(mask)
+
+    def _matching_labels(self, store, text):
+        table = store.table("label")
+        if table is not self._table or len(self._lowered) > len(table):
+            self._table = table
+            self._lowered = []
+        # テーブルは追加されるだけなので、増えた分だけ小文字にして足す
+        self._lowered.extend(value.lower() for value in table[len(self._lowered):])
+        return [code for code, value in enumerate(self._lowered) if text in value]
+
+
+def page_count(matches, page_size=PAGE_SIZE):
+    return max((len(matches) + page_size - 1) // page_size, 1)
+
+
+def table_page(store, matches, page, page_size=PAGE_SIZE):
+    """当てはまった設備のうち page ページ目（0 から）の行だけの表"""
+    return equipment_table(store, matches[page * page_size:(page + 1) * page_size])
+
+
+def options(store, matches, limit=MAX_OPTIONS):
+    """選択肢にする設備の index と表示名 {index: "番号: ラベル"}（先頭の limit 台だけ）"""
+    indices = matches[:limit]
+    table = store.table("label")
+    codes = store.codes("label")[indices]
+    return {index: f"{index + 1}: {table[code]}" for index, code in zip(indices.tolist(), codes.tolist())}
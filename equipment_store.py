@@ -0,0 +1,330 @@
+"""列指向の設備ストア
+
+設備を辞書のリストではなく NumPy の列（x, y, width, length, rotation, id）と
+文字列の intern テーブル（type, color, label）で保持する。
+各設備は辞書のように読み書きできるビューとして取り出せるので、
+既存の UI コードはそのまま動き、ベクトル化された処理は列を直接読める。
+"""
+from collections.abc import MutableMapping
+
+import numpy as np
+
+# 数値列と文字列列
+NUMERIC_FIELDS = ("x", "y", "width", "length", "rotation")
+STRING_FIELDS = ("type", "color", "label")
+FIELDS = ("type", "width", "length", "color", "x", "y", "rotation", "label", "id")
+
+_INITIAL_CAPACITY = 16
+
+
+class StringTable:
+    """文字列を整数コードに intern するテーブル"""
+
+    def __init__(self, values=()):
+        self.values = []
+        self._codes = {}
+        for value in values:
+            self.code(value)
+
+    def code(self, value):
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self._codes[value] = code
+            self.values.append(value)
+        return code
+
+    def copy(self):
+        table = StringTable()
+        table.values = list(self.values)
+        table._codes = dict(self._codes)
+        return table
+
+
+class EquipmentView(MutableMapping):
+    """ストア内の 1 設備を辞書として扱うためのビュー"""
+
+    __slots__ = ("_store", "_index")
+
+    def __init__(self, store, index):
+        self._store = store
+        self._index = index
+
+    def __getitem__(self, key):
+        return self._store.get_field(self._index, key)
+
+    def __setitem__(self, key, value):
+        self._store.set_field(self._index, key, value)
+
+    def __delitem__(self, key):
+        raise TypeError("設備の項目は削除できません")
+
+    def __iter__(self):
+        return iter(FIELDS)
+
+    def __len__(self):
+        return len(FIELDS)
+
+    def __repr__(self):
+        return f"EquipmentView({self.to_dict()!r})"
+
+    def to_dict(self):
+        return {key: self[key] for key in FIELDS}
+
+    copy = to_dict
+
+
+class EquipmentStore:
+    """設備リストの代わりに使う列指向ストア（リストと同じ操作ができる）"""
+
+    def __init__(self, capacity=_INITIAL_CAPACITY):
+        self._size = 0
+        self._numeric = np.zeros((len(NUMERIC_FIELDS), capacity), dtype=np.float64)
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._codes = np.zeros((len(STRING_FIELDS), capacity), dtype=np.int32)
+        self._tables = {field: StringTable() for field in STRING_FIELDS}
+        # 次に振る id（削除しても戻らないので、id が設備の間で重ならない）
+        self._next_id = 0
+
+    @classmethod
+    def from_records(cls, records):
+        """辞書のリスト（従来形式）からストアを作る"""
+        if isinstance(records, EquipmentStore):
+            return records.copy()
+        records = list(records)
+        store = cls(max(len(records), _INITIAL_CAPACITY))
+        n = len(records)
+        for row, field in enumerate(NUMERIC_FIELDS):
+            store._numeric[row, :n] = [record.get(field, 0) for record in records]
+        store._ids[:n] = [record.get("id", i) for i, record in enumerate(records)]
+        store._next_id = int(store._ids[:n].max()) + 1 if n else 0
+        for row, field in enumerate(STRING_FIELDS):
+            table = store._tables[field]
+            store._codes[row, :n] = [table.code(record.get(field, "")) for record in records]
+        store._size = n
+        return store
+
+    @classmethod
+    def from_columns(cls, columns):
+        """列の辞書（各値は長さ n の配列）からストアを作る"""
+        n = len(columns["x"])
+        store = cls(max(n, _INITIAL_CAPACITY))
+        for row, field in enumerate(NUMERIC_FIELDS):
+            store._numeric[row, :n] = columns[field]
+        store._ids[:n] = columns["id"] if "id" in columns else np.arange(n)
+        store._next_id = int(store._ids[:n].max()) + 1 if n else 0
+        for row, field in enumerate(STRING_FIELDS):
+            table = store._tables[field]
+            values = columns[field]
+            # 重複の多い文字列列は一意な値だけ intern する
+            uniques, inverse = np.unique(np.asarray(values, dtype=object).astype(str),
+                                         return_inverse=True)
+            codes = np.array([table.code(value) for value in uniques.tolist()], dtype=np.int32)
+            store._codes[row, :n] = codes[inverse] if n else []
+        store._size = n
+        return store
+
+    # 列の直接参照（長さ n のビュー。書き換えるとストアに反映される）
+    @property
+    def x(self):
+        return self._numeric[0, :self._size]
+
+    @property
+    def y(self):
+        return self._numeric[1, :self._size]
+
+    @property
+    def width(self):
+        return self._numeric[2, :self._size]
+
+    @property
+    def length(self):
+        return self._numeric[3, :self._size]
+
+    @property
+    def rotation(self):
+        return self._numeric[4, :self._size]
+
+    @property
+    def ids(self):
+        return self._ids[:self._size]
+
+    def codes(self, field):
+        """文字列列の整数コード配列"""
+        return self._codes[STRING_FIELDS.index(field), :self._size]
+
+    def table(self, field):
+        """文字列列の intern テーブル（コード -> 文字列のリスト）"""
+        return self._tables[field].values
+
+    def strings(self, field):
+        """文字列列を object 配列として展開する"""
+        values = np.asarray(self.table(field) or [""], dtype=object)
+        return values[self.codes(field)]
+
+    def arrays(self):
+        """(x, y, width, length, rotation) の列をまとめて返す"""
+        return self.x, self.y, self.width, self.length, self.rotation
+
+    def nbytes(self):
+        """列とテーブルが使っているおおよそのバイト数"""
+        total = self._numeric.nbytes + self._ids.nbytes + self._codes.nbytes
+        for table in self._tables.values():
+            total += sum(len(value) * 4 + 49 for value in table.values)
+        return total
+
+    # 1 設備単位の読み書き
+    def get_field(self, index, key):
+        index = self._check_index(index)
+        if key in NUMERIC_FIELDS:
+            value = float(self._numeric[NUMERIC_FIELDS.index(key), index])
+            # 回転はスライダー（整数）で扱うので整数値は int で返す
+            if key == "rotation" and value.is_integer():
+                return int(value)
+            return value
+        if key in STRING_FIELDS:
+            row = STRING_FIELDS.index(key)
+            return self._tables[key].values[self._codes[row, index]]
+        if key == "id":
+            return int(self._ids[index])
+        raise KeyError(key)
+
+    def set_field(self, index, key, value):
+        index = self._check_index(index)
+        if key in NUMERIC_FIELDS:
+            self._numeric[NUMERIC_FIELDS.index(key), index] = value
+        elif key in STRING_FIELDS:
+            self._codes[STRING_FIELDS.index(key), index] = self._tables[key].code(value)
+        elif key == "id":
+            self._ids[index] = value
+            self._next_id = max(self._next_id, int(value) + 1)
+        else:
+            raise KeyError(key)
+
+    # リストと同じ操作
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        for index in range(self._size):
+            yield EquipmentView(self, index)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [EquipmentView(self, i) for i in range(*index.indices(self._size))]
+        return EquipmentView(self, self._check_index(index))
+
+    def __setitem__(self, index, record):
+        index = self._check_index(index)
+        values = {key: record[key] for key in FIELDS if key in record}
+        for key, value in values.items():
+            self.set_field(index, key, value)
+
+    def append(self, record):
+        if self._size == self._ids.size:
+            self._grow(max(self._size * 2, _INITIAL_CAPACITY))
+        self._size += 1
+        index = self._size - 1
+        for key in FIELDS:
+            self.set_field(index, key, record.get(key, "" if key in STRING_FIELDS else 0))
+
+    def extend(self, records, index=None):
+        """records（辞書のリストかストア）をまとめて末尾に追加する。index を渡すとその位置に挿入する"""
+        other = records if isinstance(records, EquipmentStore) else EquipmentStore.from_records(records)
+        n = len(other)
+        if self._size + n > self._ids.size:
+            self._grow(max((self._size + n) * 2, _INITIAL_CAPACITY))
+        start = self._size
+        end = start + n
+        self._numeric[:, start:end] = other._numeric[:, :n]
+        self._ids[start:end] = other.ids
+        for row, field in enumerate(STRING_FIELDS):
+            remap = np.array([self._tables[field].code(value) for value in other.table(field)],
+                             dtype=np.int32)
+            self._codes[row, start:end] = remap[other.codes(field)] if n else []
+        self._size = end
+        self._next_id = max(self._next_id, other._next_id)
+        if index is not None and index < start:
+            # 末尾に足した分を index の位置へ回す
+            for columns in (self._numeric, self._codes):
+                columns[:, index:end] = np.roll(columns[:, index:end], n, axis=1)
+            self._ids[index:end] = np.roll(self._ids[index:end], n)
+
+    def delete_range(self, start, stop):
+        """start から stop の手前までの設備をまとめて削除する（後ろの設備は前に詰める）"""
+        start, stop = max(start, 0), min(stop, self._size)
+        if start >= stop:
+            return
+        end = self._size
+        count = stop - start
+        self._numeric[:, start:end - count] = self._numeric[:, stop:end]
+        self._ids[start:end - count] = self._ids[stop:end]
+        self._codes[:, start:end - count] = self._codes[:, stop:end]
+        self._size -= count
+
+    def new_ids(self, count=1):
+        """これから追加する count 台に振る id の配列（今ある設備とも削除した設備とも重ならない）"""
+        return np.arange(self._next_id, self._next_id + count, dtype=np.int64)
+
+    def insert(self, index, record):
+        """index の位置に設備を挿入する（後ろの設備は 1 つずつずれる）"""
+        index = min(max(index + self._size if index < 0 else index, 0), self._size)
+        self.append(record)
+        end = self._size - 1
+        if index < end:
+            for columns in (self._numeric, self._codes):
+                columns[:, index:end + 1] = np.roll(columns[:, index:end + 1], 1, axis=1)
+            self._ids[index:end + 1] = np.roll(self._ids[index:end + 1], 1)
+
+    def pop(self, index=-1):
+        index = self._check_index(index)
+        record = EquipmentView(self, index).to_dict()
+        end = self._size
+        self._numeric[:, index:end - 1] = self._numeric[:, index + 1:end]
+        self._ids[index:end - 1] = self._ids[index + 1:end]
+        self._codes[:, index:end - 1] = self._codes[:, index + 1:end]
+        self._size -= 1
+        return record
+
+    def copy(self):
+        store = EquipmentStore(max(self._size, _INITIAL_CAPACITY))
+        store._numeric[:, :self._size] = self._numeric[:, :self._size]
+        store._ids[:self._size] = self.ids
+        store._codes[:, :self._size] = self._codes[:, :self._size]
+        store._tables = {field: table.copy() for field, table in self._tables.items()}
+        store._size = self._size
+        store._next_id = self._next_id
+        return store
+
+    def to_records(self):
+        """従来形式の辞書のリストに変換する（JSON エクスポート用）"""
+        return [view.to_dict() for view in self]
+
+    def to_columns(self):
+        """from_columns() と同じ形の列の辞書（配列はコピー）に変換する"""
+        columns = {field: self._numeric[row, :self._size].copy()
+                   for row, field in enumerate(NUMERIC_FIELDS)}
+        columns["id"] = self.ids.copy()
+        for field in STRING_FIELDS:
+            columns[field] = self.strings(field)
+        return columns
+
+    def __repr__(self):
+        return f"EquipmentStore({self._size} items)"
+
+    # 内部処理
+    def _check_index(self, index):
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("設備の番号が範囲外です")
+        return index
+
+    def _grow(self, capacity):
+        numeric = np.zeros((len(NUMERIC_FIELDS), capacity), dtype=np.float64)
+        ids = np.zeros(capacity, dtype=np.int64)
+        codes = np.zeros((len(STRING_FIELDS), capacity), dtype=np.int32)
+        numeric[:, :self._size] = self._numeric[:, :self._size]
+        ids[:self._size] = self.ids
+        codes[:, :self._size] = self._codes[:, :self._size]
+        self._numeric, self._ids, self._codes = numeric, ids, codes
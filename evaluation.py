@@ -0,0 +1,97 @@
+"""複数のレイアウト案をまとめて評価する（what-if 比較）
+
+レイアウトごとに、衝突しているペアと設備の数、工場からはみ出した設備の数、面積使用率（設備が実際に占める面積の割合）、
+設備どうし・壁との通路幅（最小値と、基準に満たない設備の数）を求めて 1 行にする。
+
+プールで並列に評価するときは、全レイアウトの数値列を 1 つの共有メモリに詰めておき、
+各プロセスは起動時にそれを読み取り専用で参照する。タスクとして渡すのはレイアウトの番号だけで、
+設備の配列をタスクごとに pickle して送ることはしない。
+"""
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from collision import collision_pairs, item_clearance
+from coverage import covered_area
+from equipment_store import EquipmentStore
+from geometry import rotated_bounds
+
+# 通路幅の基準 (m)。これより狭い設備を数える
+DEFAULT_MIN_AISLE = 1.0
+# 並列にする最小のレイアウト数（少ないときはプロセスを起こすほうが遅い）
+MIN_PARALLEL_LAYOUTS = 4
+
+_shared = None  # 子プロセスが参照する (共有メモリ, 列, 区切り, 工場サイズ, 通路幅の基準)
+
+
+def evaluate_layouts(layouts, min_aisle=DEFAULT_MIN_AISLE, processes=None):
+    """レイアウト（name・equipment_list・factory_width・factory_length の辞書）のリストを評価する
+
+    戻り値は layouts と同じ順の、評価結果の辞書のリスト。
+    """
+    columns = []
+    for layout in layouts:
+        store = layout["equipment_list"]
+        if not isinstance(store, EquipmentStore):
+            store = EquipmentStore.from_records(store)
+        columns.append(np.stack(store.arrays()))
+    offsets = np.cumsum([0] + [column.shape[1] for column in columns])
+    floors = np.array([(layout["factory_width"], layout["factory_length"]) for layout in layouts],
+                      dtype=np.float64).reshape(-1, 2)
+    packed = np.concatenate(columns, axis=1) if columns else np.zeros((5, 0))
+
+    processes = min(len(layouts), processes or os.cpu_count() or 1)
+    if processes <= 1 or len(layouts) < MIN_PARALLEL_LAYOUTS:
+        scores = [_score(packed[:, offsets[i]:offsets[i + 1]], floors[i], min_aisle)
+                  for i in range(len(layouts))]
+    else:
+        memory = shared_memory.SharedMemory(create=True, size=max(packed.nbytes, 1))
+        try:
+            np.ndarray(packed.shape, dtype=packed.dtype, buffer=memory.buf)[:] = packed
+            # 子プロセスへは共有メモリの名前と小さな区切りの配列だけを起動時に 1 度渡す
+            with multiprocessing.get_context("spawn").Pool(
+                    processes, initializer=_attach,
+                    initargs=(memory.name, packed.shape, offsets, floors, min_aisle)) as pool:
+                scores = pool.map(_score_shared, range(len(layouts)))
+        finally:
+            memory.close()
+            memory.unlink()
+    return [dict(score, name=layout.get("name", "")) for layout, score in zip(layouts, scores)]
+
+
+def _attach(name, shape, offsets, floors, min_aisle):
+    global _shared
+    # 後始末（unlink）は作った親プロセスが行う
+    memory = shared_memory.SharedMemory(name=name)
+    packed = np.ndarray(shape, dtype=np.float64, buffer=memory.buf)
+    packed.flags.writeable = False
+    _shared = (memory, packed, offsets, floors, min_aisle)
+
+
+def _score_shared(index):
+    _, packed, offsets, floors, min_aisle = _shared
+    return _score(packed[:, offsets[index]:offsets[index + 1]], floors[index], min_aisle)
+
+
+def _score(columns, floor, min_aisle):
+    """1 つのレイアウトの評価（columns は (x, y, width, length, rotation) の行）"""
+    x, y, w, l, rot = columns
+    factory_width, factory_length = floor
+    n = len(x)
+    pairs = collision_pairs(x, y, w, l, rot)
+    xmin, ymin, xmax, ymax = rotated_bounds(x, y, w, l, rot)
+    outside = (xmin < 0) | (ymin < 0) | (xmax > factory_width) | (ymax > factory_length)
+    clearance = item_clearance(x, y, w, l, rot, factory_width, factory_length, radius=min_aisle)
+    return {
+        "items": n,
+        "collision_pairs": len(pairs),
+        "colliding_items": len(np.unique(pairs)),
+        "outside_items": int(outside.sum()),
+        # 統計情報の面積使用率と同じく、重なりを二重に数えない占有面積から求める
+        "area_usage": covered_area(x, y, w, l, rot, factory_width, factory_length)
+        / (factory_width * factory_length) if n else 0.0,
+        "min_clearance": float(clearance.min()) if n else float(min_aisle),
+        "narrow_items": int((clearance < min_aisle).sum()),
+    }
@@ -0,0 +1,271 @@
+"""レイアウト図のエクスポート（PNG / SVG / PDF）
+
+どの形式も出力を少しずつ生成して書き出すので、工場全体の画像をメモリに持たない。
+
+- PNG は TILE_SIZE 行ずつの帯をタイル描画で作り、圧縮して IDAT チャンクとして順に書く。
+  メモリに載るのは帯 1 本分（幅 x TILE_SIZE 画素）だけ。
+- SVG と PDF は同じ頂点計算（geometry.rectangle_corners）から設備をまとめて
+  VECTOR_CHUNK 台ずつ書き出すベクター形式。PDF の文字は標準フォント (Helvetica) で描くので、
+  ASCII 以外を含むラベルは設備番号だけを表示する。
+"""
+import tempfile
+import zlib
+from functools import lru_cache
+from xml.sax.saxutils import escape, quoteattr
+
+import numpy as np
+
+from equipment_store import EquipmentStore
+from geometry import rectangle_corners
+from raster import hex_to_rgb
+from rendering import FONT_SIZE, GRID_COLOR, SCALE_FACTOR
+from tiles import TILE_SIZE, TileRenderer, grid_step
+
+# 形式ごとの MIME タイプ
+EXPORT_FORMATS = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+    "pdf": "application/pdf",
+}
+# ベクター形式で一度に書き出す設備の数
+VECTOR_CHUNK = 4096
+# PDF のページの一辺の上限 (pt)。多くのビューアの上限 200 インチに合わせる
+PDF_MAX_PAGE = 14400
+# これを超える出力は一時ファイル（ディスク）に書く
+SPOOL_BYTES = 16 * 2**20
+
+
+def export_layout(fmt, equipment_list, factory_width, factory_length, floor_color,
+                  colliding=(), show_grid=True, show_equipment_info=True,
+                  scale_factor=SCALE_FACTOR):
+    """fmt 形式で書き出したファイルオブジェクト（先頭に巻き戻し済み）を返す"""
+    writers = {"png": iter_png, "svg": iter_svg, "pdf": iter_pdf}
+    if fmt not in writers:
+        raise ValueError(f"未対応のエクスポート形式です: {fmt}")
+    output = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+    for chunk in writers[fmt](equipment_list, factory_width, factory_length, floor_color,
+                              colliding, show_grid, show_equipment_info, scale_factor):
+        output.write(chunk)
+    output.seek(0)
+    return output
+
+
+def export_bytes(*args, **kwargs):
+    """export_layout() と同じ引数で、書き出した内容をバイト列で返す（st.download_button 用）
+
+    ダウンロードボタンに渡せるのはバイト列などに限られ、SpooledTemporaryFile は渡せない。
+    """
+    with export_layout(*args, **kwargs) as output:
+        return output.read()
+
+
+def iter_png(equipment_list, factory_width, factory_length, floor_color, colliding=(),
+             show_grid=True, show_equipment_info=True, scale_factor=SCALE_FACTOR):
+    """PNG のバイト列を帯ごとに生成する"""
+    store = _as_store(equipment_list)
+    width_px = int(factory_width * scale_factor)
+    length_px = int(factory_length * scale_factor)
+    # 帯 1 本ずつ描いてすぐ捨てるのでタイルはキャッシュしない
+    renderer = TileRenderer(max_tiles=0, scale_factor=scale_factor)
+
+    yield b"\x89PNG\r\n\x1a\n"
+    # 幅, 高さ, ビット深度 8, カラータイプ 2 (RGB), 圧縮・フィルタ・インターレースは標準
+    yield _png_chunk(b"IHDR", np.array([width_px, length_px], dtype=">u4").tobytes() +
+                     bytes([8, 2, 0, 0, 0]))
+    compressor = zlib.compressobj(6)
+    for top in range(0, length_px, TILE_SIZE):
+        height = min(TILE_SIZE, length_px - top)
+        band = renderer.render_view(store, factory_width, factory_length, floor_color,
+                                    (0, top, width_px, height), 0, colliding=colliding,
+                                    show_grid=show_grid, show_equipment_info=show_equipment_info)
+        # 各行の先頭にフィルタ種別 0 (なし) を付ける
+        rows = np.zeros((height, 1 + width_px * 3), dtype=np.uint8)
+        rows[:, 1:] = np.asarray(band).reshape(height, -1)
+        data = compressor.compress(rows.tobytes())
+        if data:
+            yield _png_chunk(b"IDAT", data)
+    yield _png_chunk(b"IDAT", compressor.flush())
+    yield _png_chunk(b"IEND", b"")
+
+
+def iter_svg(equipment_list, factory_width, factory_length, floor_color, colliding=(),
+             show_grid=True, show_equipment_info=True, scale_factor=SCALE_FACTOR):
+    """SVG（座標はメートル単位）のバイト列を少しずつ生成する"""
+    store = _as_store(equipment_list)
+    pixel = 1 / scale_factor  # 画像の 1 画素に当たる長さ (m)
+    yield (f'<?xml version="1.0" encoding="UTF-8"?>\n'
+           f'<svg xmlns="http://www.w3.org/2000/svg" '
+           f'width="{factory_width * scale_factor:g}" height="{factory_length * scale_factor:g}" '
+           f'viewBox="0 0 {factory_width:g} {factory_length:g}">\n'
+           f'<rect width="{factory_width:g}" height="{factory_length:g}" '
+           f'fill={quoteattr(floor_color)}/>\n').encode()
+    if show_grid:
+        step = grid_step(scale_factor)
+        path = [f"M{x:g} 0V{factory_length:g}" for x in np.arange(0, factory_width, step)]
+        path += [f"M0 {y:g}H{factory_width:g}" for y in np.arange(0, factory_length, step)]
+        yield (f'<path d="{"".join(path)}" stroke="{GRID_COLOR}" '
+               f'stroke-width="{pixel:g}" fill="none"/>\n').encode()
+
+    font_size = FONT_SIZE * pixel
+    for chunk in _vector_chunks(store, colliding, show_equipment_info, scale_factor):
+        lines = []
+        for k in range(len(chunk.indices)):
+            points = " ".join(f"{x:.3f},{y:.3f}" for x, y in chunk.corners[k])
+            lines.append(f'<polygon points="{points}" fill={quoteattr(chunk.fills[k])} '
+                         f'stroke="{chunk.outlines[k]}" stroke-width="{pixel:g}"/>')
+        for text, x, y in chunk.texts:
+            lines.append(f'<text x="{x:.3f}" y="{y:.3f}" font-size="{font_size:g}" '
+                         f'text-anchor="middle" dominant-baseline="central">{escape(text)}</text>')
+        yield ("\n".join(lines) + "\n").encode()
+
+    yield (f'<rect x="{pixel:g}" y="{pixel:g}" width="{factory_width - 2 * pixel:g}" '
+           f'height="{factory_length - 2 * pixel:g}" fill="none" stroke="#000000" '
+           f'stroke-width="{2 * pixel:g}"/>\n</svg>\n').encode()
+
+
+def iter_pdf(equipment_list, factory_width, factory_length, floor_color, colliding=(),
+             show_grid=True, show_equipment_info=True, scale_factor=SCALE_FACTOR):
+    """1 ページの PDF のバイト列を少しずつ生成する
+
+    ページ内容のストリームは圧縮しながら書き出し、長さは後ろのオブジェクトで示す。
+    """
+    store = _as_store(equipment_list)
+    # 1 m あたりの pt。ページが上限を超えないように縮める
+    points = min(float(scale_factor), PDF_MAX_PAGE / max(factory_width, factory_length))
+    page_width = factory_width * points
+    page_height = factory_length * points
+
+    offsets = []
+    position = 0
+
+    def emit(data):
+        nonlocal position
+        position += len(data)
+        return data
+
+    def begin_object(number):
+        offsets.append((number, position))
+        return emit(f"{number} 0 obj\n".encode())
+
+    yield emit(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    yield begin_object(1) + emit(b"<< /Type /Catalog /Pages 2 0 R >>\nendobj\n")
+    yield begin_object(2) + emit(b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>\nendobj\n")
+    yield begin_object(3) + emit(
+        f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_width:.2f} {page_height:.2f}] "
+        f"/Resources << /Font << /F1 5 0 R >> >> /Contents 4 0 R >>\nendobj\n".encode())
+
+    yield begin_object(4) + emit(b"<< /Length 6 0 R /Filter /FlateDecode >>\nstream\n")
+    compressor = zlib.compressobj(6)
+    length = 0
+    for text in _pdf_content(store, factory_width, factory_length, floor_color, colliding,
+                             show_grid, show_equipment_info, scale_factor, points):
+        data = compressor.compress(text.encode("latin-1"))
+        length += len(data)
+        yield emit(data)
+    data = compressor.flush()
+    length += len(data)
+    yield emit(data) + emit(b"\nendstream\nendobj\n")
+
+    yield begin_object(5) + emit(
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>\nendobj\n")
+    yield begin_object(6) + emit(f"{length}\nendobj\n".encode())
+
+    xref = position
+    table = [f"xref\n0 {len(offsets) + 1}\n", "0000000000 65535 f \n"]
+    table += [f"{offset:010d} 00000 n \n" for _, offset in sorted(offsets)]
+    table.append(f"trailer\n<< /Size {len(offsets) + 1} /Root 1 0 R >>\n"
+                 f"startxref\n{xref}\n%%EOF\n")
+    yield emit("".join(table).encode())
+
+
+def _pdf_content(store, factory_width, factory_length, floor_color, colliding, show_grid,
+                 show_equipment_info, scale_factor, points):
+    """PDF のページ内容（座標はメートル、y 軸下向きに変換済み）"""
+    pixel = 1 / scale_factor
+    # y 軸を反転し、1 単位 = 1 m にする
+    yield (f"{points:.4f} 0 0 {-points:.4f} 0 {factory_length * points:.4f} cm\n"
+           f"{_pdf_color(floor_color)} rg 0 0 {factory_width:g} {factory_length:g} re f\n")
+    if show_grid:
+        step = grid_step(scale_factor)
+        lines = [f"{x:g} 0 m {x:g} {factory_length:g} l" for x in np.arange(0, factory_width, step)]
+        lines += [f"0 {y:g} m {factory_width:g} {y:g} l" for y in np.arange(0, factory_length, step)]
+        yield f"{_pdf_color(GRID_COLOR)} RG {pixel:g} w\n" + "\n".join(lines) + "\nS\n"
+
+    font_size = FONT_SIZE * pixel
+    for chunk in _vector_chunks(store, colliding, show_equipment_info, scale_factor):
+        lines = [f"{pixel:g} w"]
+        for k in range(len(chunk.indices)):
+            (x0, y0), (x1, y1), (x2, y2), (x3, y3) = chunk.corners[k]
+            lines.append(f"{_pdf_color(chunk.fills[k])} rg {_pdf_color(chunk.outlines[k])} RG "
+                         f"{x0:.3f} {y0:.3f} m {x1:.3f} {y1:.3f} l {x2:.3f} {y2:.3f} l "
+                         f"{x3:.3f} {y3:.3f} l h B")
+        if chunk.texts:
+            lines.append(f"0 0 0 rg BT /F1 {font_size:g} Tf")
+            for text, x, y in chunk.texts:
+                # 標準フォントで描けない文字を含むラベルは番号だけにする
+                if not text.isascii():
+                    text = text.split(":")[0]
+                width = len(text) * font_size * 0.5
+                text = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+                # 文字は y 軸を戻して描く
+                lines.append(f"1 0 0 -1 {x - width / 2:.3f} {y + font_size / 3:.3f} Tm ({text}) Tj")
+            lines.append("ET")
+        yield "\n".join(lines) + "\n"
+
+    yield (f"0 0 0 RG {2 * pixel:g} w {pixel:g} {pixel:g} {factory_width - 2 * pixel:g} "
+           f"{factory_length - 2 * pixel:g} re S\n")
+
+
+class _VectorChunk:
+    """ベクター形式で書き出す設備のまとまり"""
+
+    def __init__(self, indices, corners, fills, outlines, texts):
+        self.indices = indices
+        self.corners = corners
+        self.fills = fills
+        self.outlines = outlines
+        self.texts = texts  # (文字列, 中心 x, 中心 y) のリスト
+
+
+def _vector_chunks(store, colliding, show_equipment_info, scale_factor):
+    """設備を VECTOR_CHUNK 台ずつ、頂点・色・ラベルをまとめて計算して返す"""
+    n = len(store)
+    colliding_mask = np.zeros(n, dtype=bool)
+    if len(colliding):
+        colliding_mask[np.fromiter(colliding, dtype=np.int64)] = True
+    colors = store.table("color")
+    labels = store.table("label")
+    x, y, width, length, rotation = store.arrays()
+    for start in range(0, n, VECTOR_CHUNK):
+        indices = np.arange(start, min(start + VECTOR_CHUNK, n))
+        corners = rectangle_corners(x[indices], y[indices], width[indices], length[indices],
+                                    rotation[indices])
+        fills = [colors[code] for code in store.codes("color")[indices].tolist()]
+        outlines = np.where(colliding_mask[indices], "#FF0000", "#000000").tolist()
+        texts = []
+        if show_equipment_info:
+            label_codes = store.codes("label")
+            for i in indices.tolist():
+                # 画像と同じく、ラベルが設備に収まらなければ番号だけ
+                text = f"{i+1}: {labels[label_codes[i]]}"
+                fits = (len(text) * FONT_SIZE * 0.6 < width[i] * scale_factor - 10 and
+                        FONT_SIZE < length[i] * scale_factor - 10)
+                texts.append((text if fits else str(i + 1), float(x[i]), float(y[i])))
+        yield _VectorChunk(indices, corners, fills, outlines, texts)
+
+
+def _as_store(equipment_list):
+    if isinstance(equipment_list, EquipmentStore):
+        return equipment_list
+    return EquipmentStore.from_records(equipment_list)
+
+
+def _png_chunk(kind, data):
+    crc = zlib.crc32(kind + data) & 0xFFFFFFFF
+    return len(data).to_bytes(4, "big") + kind + data + crc.to_bytes(4, "big")
+
+
+@lru_cache(maxsize=256)
+def _pdf_color(color):
+    r, g, b = hex_to_rgb([color])[0] / 255
+    return f"{r:.3f} {g:.3f} {b:.3f}"
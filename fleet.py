@@ -0,0 +1,316 @@
+"""AGV の走行シミュレーション（時間刻みで全車両を一括に進める）
+
+搬送（flows: from・to・rate）ごとにシフトの間の搬送依頼をポアソン到着で作り、空いている
+AGV のうち搬送元に一番近い車両に割り当てる。AGV は動線解析と同じ占有グリッド上の最短経路を
+speed (m/s) で走り、搬送元と搬送先でそれぞれ handling_time 秒の荷役をする。
+AGV 自身（種類 agv の設備）は障害物に含めず、その位置を車両の出発点にする。
+
+車両どうしの干渉は cell_size (m) 四方の交通セルで判定する。走行中の別の車両がいるセルには
+入らずに待ち（待ち始めを干渉 1 回と数える）、待ち時間をセルごとに積算して混雑箇所とする。
+互いに道を譲れないまま max_wait 秒たった車両は通す（すり抜けとして数える）。
+
+経路はすべてつないで 1 本の配列に持ち、各車両の「何本目の経路の何 m 地点か」から
+searchsorted で位置を一括に求める。1 歩ごとの処理は車両数の長さの配列演算で、
+到着や荷役の終わりで状態が変わる車両だけを Python で処理する。
+"""
+import math
+from collections import deque
+
+import numpy as np
+
+from equipment_store import EquipmentStore
+from flow import FlowAnalyzer, _point_cells
+from raster import hex_to_rgb, paint_rectangles
+
+DEFAULT_SPEED = 1.0
+DEFAULT_HANDLING_TIME = 30.0
+DEFAULT_CELL_SIZE = 2.0
+MAX_WAIT = 60.0
+HOT_SPOTS = 10
+VEHICLE_TYPE = "agv"
+
+# 車両の状態（WAITING は記録用で、走行中に待っている車両）
+IDLE, EMPTY, PICKING, LOADED, DROPPING, WAITING = range(6)
+STATE_LABELS = ["待機", "空車走行", "積み込み", "積載走行", "荷降ろし", "干渉待ち"]
+STATE_COLORS = ["#9E9E9E", "#03A9F4", "#FFC107", "#4CAF50", "#FF9800", "#F44336"]
+
+
+def simulate_fleet(store, factory_width, factory_length, flows, vehicles=None, shift_hours=8.0,
+                   time_step=1.0, speed=DEFAULT_SPEED, handling_time=DEFAULT_HANDLING_TIME,
+                   cell_size=DEFAULT_CELL_SIZE, max_wait=MAX_WAIT, frame_interval=10.0, seed=0,
+                   analyzer=None):
+    """AGV の搬送をシフトの間シミュレーションして、スループット・干渉・混雑と再生用のフレームを返す
+
+    vehicles を省略すると種類 agv の設備の台数。設備より多いときは、残りの車両は
+    搬送元の設備の出入口から出発する。
+    """
+    analyzer = analyzer or FlowAnalyzer()
+    types = store.strings("type")
+    is_vehicle = types == VEHICLE_TYPE
+    obstacles = _subset(store, ~is_vehicle)
+    routes = _Routes(analyzer, obstacles, factory_width, factory_length)
+
+    flows = [flow for flow in flows]
+    pickups = [flow["from"] for flow in flows if flow["rate"] > 0]
+    n = int(is_vehicle.sum()) if vehicles is None else int(vehicles)
+    position = np.zeros((n, 2))
+    parked = min(n, int(is_vehicle.sum()))
+    position[:parked] = np.stack([store.x[is_vehicle], store.y[is_vehicle]], axis=1)[:parked]
+    for v in range(parked, n):
+        start = routes.path_between(pickups[v % len(pickups)], pickups[v % len(pickups)]) if pickups else None
+        position[v] = start[0] if start is not None and len(start) else (factory_width / 2, factory_length / 2)
+    position = routes.snap(position)
+
+    # 搬送依頼（ポアソン到着）を発生時刻順に並べる
+    duration = shift_hours * 3600.0
+    rng = np.random.default_rng(seed)
+    releases, task_flows = [], []
+    for index, flow in enumerate(flows):
+        if flow["rate"] <= 0:
+            continue
+        count = int(flow["rate"] * shift_hours * 2 + 10)
+        times = np.cumsum(rng.exponential(3600.0 / flow["rate"], count))
+        times = times[times < duration]
+        releases.append(times)
+        task_flows.append(np.full(len(times), index))
+    releases = np.concatenate(releases) if releases else np.zeros(0)
+    task_flows = np.concatenate(task_flows) if task_flows else np.zeros(0, dtype=np.int64)
+    order = np.argsort(releases, kind="stable")
+    releases, task_flows = releases[order], task_flows[order]
+
+    columns = max(int(math.ceil(factory_width / cell_size)), 1)
+    rows = max(int(math.ceil(factory_length / cell_size)), 1)
+    congestion = np.zeros(rows * columns)
+    cell_owner = np.full(rows * columns, -1, dtype=np.int64)
+
+    state = np.zeros(n, dtype=np.int8)
+    path = np.full(n, -1, dtype=np.int64)
+    progress = np.zeros(n)
+    timer = np.zeros(n)
+    wait = np.zeros(n)
+    task = np.full(n, -1, dtype=np.int64)
+    state_time = np.zeros(6)
+    travelled = 0.0
+    delivered = np.zeros(len(flows), dtype=np.int64)
+    lead_time = np.zeros(len(flows))
+    conflicts = overrides = unreachable = 0
+    pending = deque()
+    released = 0
+
+    steps = int(round(duration / time_step))
+    frame_every = max(int(round(frame_interval / time_step)), 1)
+    frame_times, frame_positions, frame_states = [], [], []
+    step_length = speed * time_step
+    for step in range(steps):
+        now = step * time_step
+
+        # 発生した依頼を、搬送元に一番近い空き車両へ割り当てる
+        while released < len(releases) and releases[released] <= now:
+            pending.append(released)
+            released += 1
+        idle = np.flatnonzero(state == IDLE)
+        while pending and len(idle):
+            k = pending.popleft()
+            flow = flows[task_flows[k]]
+            # 経路の距離で一番近い車両（設備に囲まれて届かない車両は選ばない）
+            distance = routes.distances(position[idle], flow["from"])
+            v = int(idle[np.argmin(distance)])
+            index = routes.path_from(position[v], flow["from"]) if np.isfinite(distance).any() else None
+            if index is None:
+                unreachable += 1
+                continue
+            state[v], path[v], progress[v], task[v] = EMPTY, index, 0.0, k
+            idle = idle[idle != v]
+
+        # 荷役が終わった車両を次の状態へ
+        handling = np.flatnonzero((state == PICKING) | (state == DROPPING))
+        if len(handling):
+            timer[handling] -= time_step
+            for v in handling[timer[handling] <= 0].tolist():
+                flow_index = task_flows[task[v]]
+                if state[v] == DROPPING:
+                    delivered[flow_index] += 1
+                    lead_time[flow_index] += now - releases[task[v]]
+                    state[v], task[v] = IDLE, -1
+                    continue
+                index = routes.path_from(position[v], flows[flow_index]["to"])
+                if index is None:
+                    unreachable += 1
+                    state[v], task[v] = IDLE, -1
+                else:
+                    state[v], path[v], progress[v] = LOADED, index, 0.0
+
+        # 走行中の車両を一括で進める
+        moving = np.flatnonzero((state == EMPTY) | (state == LOADED))
+        waiting = 0
+        if len(moving):
+            length = routes.length[path[moving]]
+            advanced = np.minimum(progress[moving] + step_length, length)
+            proposed = routes.locate(path[moving], advanced)
+            current_cell = _cell_index(position[moving], cell_size, columns, rows)
+            proposed_cell = _cell_index(proposed, cell_size, columns, rows)
+            cell_owner[current_cell] = moving
+            entering = proposed_cell != current_cell
+            taken = cell_owner[proposed_cell]
+            blocked = entering & (taken >= 0) & (taken != moving)
+            # 同じ空きセルに同時に入ろうとした車両は番号の小さい 1 台だけ進む
+            candidates = np.flatnonzero(entering & ~blocked)
+            if len(candidates) > 1:
+                _, first = np.unique(proposed_cell[candidates], return_index=True)
+                losers = np.ones(len(candidates), dtype=bool)
+                losers[first] = False
+                blocked[candidates[losers]] = True
+            cell_owner[current_cell] = -1
+            forced = blocked & (wait[moving] >= max_wait)
+            overrides += int(forced.sum())
+            blocked &= ~forced
+            conflicts += int((blocked & (wait[moving] == 0)).sum())
+            wait[moving] = np.where(blocked, wait[moving] + time_step, 0.0)
+            np.add.at(congestion, current_cell[blocked], time_step)
+            waiting = int(blocked.sum())
+
+            go = ~blocked
+            movers = moving[go]
+            travelled += float((advanced[go] - progress[movers]).sum())
+            progress[movers] = advanced[go]
+            position[movers] = proposed[go]
+            for v in movers[advanced[go] >= length[go]].tolist():
+                state[v] = PICKING if state[v] == EMPTY else DROPPING
+                timer[v] = handling_time
+
+        state_time[:5] += np.bincount(state, minlength=5)[:5] * time_step
+        state_time[WAITING] += waiting * time_step
+        if step % frame_every == 0:
+            shown = state.copy()
+            if waiting:
+                shown[moving[blocked]] = WAITING
+            frame_times.append(now)
+            frame_positions.append(position.astype(np.float32))
+            frame_states.append(shown)
+
+    # 待っている時間は走行中からも引いておく（状態ごとの時間の合計が車両数 × シフト時間になる）
+    moving_time = state_time[EMPTY] + state_time[LOADED]
+    if moving_time > 0:
+        share = state_time[WAITING] / moving_time
+        state_time[EMPTY] -= state_time[EMPTY] * share
+        state_time[LOADED] -= state_time[LOADED] * share
+    total_time = max(n * steps * time_step, 1e-9)
+    hottest = np.argsort(congestion)[::-1][:HOT_SPOTS]
+    hottest = hottest[congestion[hottest] > 0]
+    return {
+        "vehicles": n,
+        "duration": steps * time_step,
+        "requested": len(releases),
+        "delivered": int(delivered.sum()),
+        "unreachable": unreachable,
+        "throughput": float(delivered.sum()) / max(shift_hours, 1e-9),
+        "flows": [dict(flow, requested=int((task_flows == index).sum()), delivered=int(delivered[index]),
+                       mean_lead_time=float(lead_time[index] / delivered[index]) if delivered[index] else math.nan)
+                  for index, flow in enumerate(flows)],
+        "conflicts": conflicts,
+        "overrides": overrides,
+        "distance": travelled,
+        "utilization": dict(zip(STATE_LABELS, (state_time / total_time).tolist())),
+        "hot_spots": [{"x": (cell % columns + 0.5) * cell_size, "y": (cell // columns + 0.5) * cell_size,
+                       "wait": float(congestion[cell])} for cell in hottest.tolist()],
+        "congestion": congestion.reshape(rows, columns),
+        "cell_size": cell_size,
+        "frames": {
+            "time": np.array(frame_times),
+            "position": np.array(frame_positions, dtype=np.float32).reshape(-1, n, 2),
+            "state": np.array(frame_states, dtype=np.int8).reshape(-1, n),
+        },
+    }
+
+
+def paint_vehicles(pixels, result, frame, view, scale, size=1.5):
+    """再生フレーム frame の車両を状態ごとの色の四角で pixels（表示範囲の画像の配列）に塗る"""
+    frames = result["frames"]
+    if not len(frames["time"]):
+        return
+    position = frames["position"][frame].astype(np.float64) * scale - np.array(view[:2])
+    state = frames["state"][frame]
+    colors = hex_to_rgb(STATE_COLORS)
+    for code in np.unique(state).tolist():
+        chosen = state == code
+        count = int(chosen.sum())
+        side = np.full(count, size * scale)
+        paint_rectangles(pixels, position[chosen, 0], position[chosen, 1], side, side,
+                         np.zeros(count), colors[code], hex_to_rgb(["#212121"])[0])
+
+
+class _Routes:
+    """車両が走る経路をつないだ 1 本の配列（出発セルと行き先ごとに 1 本）"""
+
+    def __init__(self, analyzer, store, factory_width, factory_length):
+        self.analyzer = analyzer
+        self.layout = (store, factory_width, factory_length)
+        self.grid = analyzer.grid(*self.layout)
+        # どの経路もこれより短いので、経路の番号 × spacing を足したキーは全体で単調に増える
+        self.spacing = float(self.grid.free.size) * self.grid.resolution * 2 + 1.0
+        self._index = {}
+        self._pieces = []  # (キー, 点列)
+        self.length = np.zeros(0)
+        self._dirty = False
+
+    def path_between(self, from_id, to_id):
+        return self.analyzer.path(*self.layout, from_id, to_id)
+
+    def distances(self, points, to_id):
+        """points から to_id までの経路の距離 (m)（届かなければ inf）"""
+        return self.analyzer.distances_from(*self.layout, points, to_id)
+
+    def snap(self, points):
+        """設備の上にある点を一番近い空きセルの中心に移した (k, 2) の配列"""
+        points = np.array(points, dtype=np.float64).reshape(-1, 2)
+        blocked = np.flatnonzero(~self.grid.free.ravel()[_point_cells(self.grid, points)])
+        free = self.grid.cell_center(np.flatnonzero(self.grid.free.ravel()))
+        if len(blocked) and len(free):
+            for k in blocked.tolist():
+                points[k] = free[np.argmin(np.hypot(*(free - points[k]).T))]
+        return points
+
+    def path_from(self, point, to_id):
+        """point から to_id への経路の番号（経路がなければ None）"""
+        cell = (int(point[0] * self.grid.scale), int(point[1] * self.grid.scale), to_id)
+        if cell not in self._index:
+            points = self.analyzer.path_from(*self.layout, point, to_id)
+            if not len(points):
+                self._index[cell] = None
+            else:
+                # 車両の今の位置から経路の始めのセルの中心へつなぐ。1 点だけの経路も区間になる
+                points = np.concatenate([np.asarray(point, dtype=np.float64)[None], points])
+                cumulative = np.concatenate([[0.0], np.cumsum(np.hypot(*np.diff(points, axis=0).T))])
+                self._index[cell] = len(self._pieces)
+                self._pieces.append((len(self._pieces) * self.spacing + cumulative, points))
+                self.length = np.append(self.length, cumulative[-1])
+                self._dirty = True
+        index = self._index[cell]
+        if index is not None and self._dirty:
+            self._key = np.concatenate([key for key, _ in self._pieces])
+            self._points = np.concatenate([points for _, points in self._pieces])
+            self._stop = np.cumsum([len(key) for key, _ in self._pieces])
+            self._start = self._stop - np.array([len(key) for key, _ in self._pieces])
+            self._dirty = False
+        return index
+
+    def locate(self, paths, distance):
+        """経路 paths の始点から distance (m) 進んだ位置を (k, 2) で返す"""
+        key = paths * self.spacing + distance
+        segment = np.searchsorted(self._key, key, side="right") - 1
+        segment = np.minimum(np.maximum(segment, self._start[paths]), self._stop[paths] - 2)
+        span = self._key[segment + 1] - self._key[segment]
+        fraction = np.minimum(np.maximum((key - self._key[segment]) / np.where(span > 0, span, 1.0), 0.0), 1.0)
+        return self._points[segment] + (self._points[segment + 1] - self._points[segment]) * fraction[:, None]
+
+
+def _cell_index(points, cell_size, columns, rows):
+    # np.clip は小さい配列では遅いので minimum・maximum で切る
+    column = np.minimum(np.maximum((points[:, 0] / cell_size).astype(np.int64), 0), columns - 1)
+    row = np.minimum(np.maximum((points[:, 1] / cell_size).astype(np.int64), 0), rows - 1)
+    return row * columns + column
+
+
+def _subset(store, keep):
+    columns = store.to_columns()
+    return EquipmentStore.from_columns({field: np.asarray(values)[keep] for field, values in columns.items()})
@@ -0,0 +1,336 @@
+"""動線解析: 設備間の搬送距離を障害物を避けた最短経路で求める
+
+レイアウトを resolution (m) 四方のセルの占有グリッドにし、設備の周り 1 セルの空きセルを
+その設備の出入口とする。搬送先ごとに、出入口からの距離場（8 近傍、斜めは √2）を
+求めておけば、どの搬送元からの最短距離も距離場を引くだけで分かる。
+
+距離場は、距離を幅 1 のバケツに分けて短い順に伝える（Dial の方法）。バケツごとに
+その中のセル全部の隣をまとめて緩和するので、グリッド全体を 1 度なめるだけで求まる。
+距離場はレイアウトのハッシュごとに覚えておき、設備を動かしたときは前の距離場のうち
+最短経路が新しく塞がったセルを通らないセルをそのまま使い、値が変わるセルだけを計算し直す。
+"""
+import hashlib
+import heapq
+import math
+from collections import OrderedDict
+
+import numpy as np
+
+from raster import paint_rectangles
+
+DEFAULT_RESOLUTION = 0.5
+# 占有グリッドのセル数の上限。広い工場ではこれを超えないようにセルを粗くする
+MAX_CELLS = 250_000
+# 覚えておく距離場の合計バイト数の上限
+MAX_FIELD_BYTES = 256 * 2**20
+# 収束の判定に使う許容誤差（セル単位）
+TOLERANCE = 1e-6
+_NEIGHBOURS = [(dy, dx, math.hypot(dy, dx)) for dy in (-1, 0, 1) for dx in (-1, 0, 1)
+               if dy or dx]
+_OCCUPIED = (255, 255, 255)
+
+
+def geometry_hash(store, factory_width, factory_length, resolution):
+    """占有グリッドと出入口を決めるレイアウトの形のハッシュ"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((float(factory_width), float(factory_length), float(resolution))).encode())
+    digest.update(np.ascontiguousarray(np.stack(store.arrays())).tobytes())
+    digest.update(store.ids.tobytes())
+    return digest.hexdigest()
+
+
+class OccupancyGrid:
+    """設備が占めるセルと、設備ごとの出入口のセル"""
+
+    def __init__(self, store, factory_width, factory_length, resolution=DEFAULT_RESOLUTION):
+        self.resolution = resolution
+        self.scale = 1.0 / resolution
+        self.shape = (max(int(math.ceil(factory_length * self.scale)), 1),
+                      max(int(math.ceil(factory_width * self.scale)), 1))
+        x, y, w, l, rot = (column * self.scale for column in store.arrays())
+        buffer = np.zeros(self.shape + (3,), dtype=np.uint8)
+        paint_rectangles(buffer, x, y, w, l, rot, _OCCUPIED, _OCCUPIED)
+        self.free = buffer[:, :, 0] == 0
+        self._store = store.copy()
+        self._ports = {}
+
+    def ports(self, equipment_id):
+        """設備の出入口（周り 1 セルの空きセル）の平坦化した番号。設備がなければ KeyError"""
+        ports = self._ports.get(equipment_id)
+        if ports is None:
+            matches = np.flatnonzero(self._store.ids == equipment_id)
+            if not len(matches):
+                raise KeyError(equipment_id)
+            ports = self._ports[equipment_id] = self._ring(int(matches[0]))
+        return ports
+
+    def cell_center(self, cells):
+        """平坦化したセル番号の中心座標 (m) を (k, 2) で返す"""
+        row, column = np.divmod(np.asarray(cells), self.shape[1])
+        return np.stack([column + 0.5, row + 0.5], axis=-1) * self.resolution
+
+    def _ring(self, index):
+        # 設備だけを周りに 1 セルの余白を付けた小さなバッファに塗り、1 セル膨らませる
+        x, y, w, l, rot = (column[index:index + 1] * self.scale for column in self._store.arrays())
+        reach = math.hypot(w[0], l[0]) / 2 + 2
+        left, top = int(math.floor(x[0] - reach)), int(math.floor(y[0] - reach))
+        size = int(math.ceil(2 * reach)) + 1
+        buffer = np.zeros((size, size, 3), dtype=np.uint8)
+        paint_rectangles(buffer, x, y, w, l, rot, _OCCUPIED, _OCCUPIED, origin=(left, top))
+        footprint = buffer[:, :, 0] > 0
+        grown = footprint.copy()
+        grown[1:] |= footprint[:-1]
+        grown[:-1] |= footprint[1:]
+        grown[:, 1:] |= grown[:, :-1].copy()
+        grown[:, :-1] |= grown[:, 1:].copy()
+        rows, columns = np.nonzero(grown & ~footprint)
+        rows, columns = rows + top, columns + left
+        inside = (rows >= 0) & (rows < self.shape[0]) & (columns >= 0) & (columns < self.shape[1])
+        cells = rows[inside] * self.shape[1] + columns[inside]
+        return cells[self.free.ravel()[cells]]
+
+
+class FlowAnalyzer:
+    """搬送（動線）ごとの最短距離と経路を求める。距離場はレイアウトのハッシュごとに覚える"""
+
+    def __init__(self, resolution=DEFAULT_RESOLUTION, max_grids=4, max_field_bytes=MAX_FIELD_BYTES):
+        self.resolution = resolution
+        self.max_grids = max_grids
+        self.max_field_bytes = max_field_bytes
+        self._grids = OrderedDict()   # レイアウトのハッシュ -> OccupancyGrid
+        self._fields = OrderedDict()  # (ハッシュ, 搬送先の id) -> (空きセル, 出入口, 距離場)
+        self.solved = 0
+        self.reused = 0
+
+    def grid(self, store, factory_width, factory_length):
+        resolution = max(self.resolution, math.sqrt(factory_width * factory_length / MAX_CELLS))
+        key = geometry_hash(store, factory_width, factory_length, resolution)
+        grid = self._grids.get(key)
+        if grid is None:
+            grid = self._grids[key] = OccupancyGrid(store, factory_width, factory_length,
+                                                    resolution)
+            grid.key = key
+            while len(self._grids) > self.max_grids:
+                self._grids.popitem(last=False)
+        self._grids.move_to_end(key)
+        return grid
+
+    def distance_field(self, store, factory_width, factory_length, equipment_id):
+        """設備 equipment_id の出入口からの距離 (m) のグリッド（届かないセルは inf）"""
+        grid = self.grid(store, factory_width, factory_length)
+        return self._field(grid, equipment_id) * grid.resolution
+
+    def analyze(self, store, factory_width, factory_length, flows):
+        """flows（from・to・rate の辞書のリスト）の距離と加重距離 (rate × 距離) を求める
+
+        戻り値は flows の各要素に distance と weighted を加えた辞書のリスト。
+        経路がないときや設備が見つからないときは inf になる。
+        """
+        grid = self.grid(store, factory_width, factory_length)
+        results = []
+        for flow in flows:
+            distance = self._distance(grid, flow["from"], flow["to"])
+            results.append(dict(flow, distance=distance, weighted=flow["rate"] * distance))
+        return results
+
+    def path(self, store, factory_width, factory_length, from_id, to_id):
+        """from_id から to_id への最短経路の点列 (m) を (k, 2) で返す（経路がなければ空）"""
+        grid = self.grid(store, factory_width, factory_length)
+        try:
+            starts = grid.ports(from_id)
+            field = self._field(grid, to_id)
+        except KeyError:
+            return np.empty((0, 2))
+        return self._descend(grid, field, starts)
+
+    def path_from(self, store, factory_width, factory_length, point, to_id):
+        """点 point (m) のあるセルから to_id への最短経路の点列 (m)（経路がなければ空）"""
+        grid = self.grid(store, factory_width, factory_length)
+        try:
+            field = self._field(grid, to_id)
+        except KeyError:
+            return np.empty((0, 2))
+        return self._descend(grid, field, _point_cells(grid, np.reshape(point, (1, 2))))
+
+    def distances_from(self, store, factory_width, factory_length, points, to_id):
+        """points（(k, 2) の m 単位の点）のあるセルから to_id までの距離 (m)（届かなければ inf）"""
+        grid = self.grid(store, factory_width, factory_length)
+        try:
+            field = self._field(grid, to_id)
+        except KeyError:
+            return np.full(len(points), np.inf)
+        return field.ravel()[_point_cells(grid, np.asarray(points))] * grid.resolution
+
+    def nbytes(self):
+        """覚えている距離場のバイト数"""
+        return sum(entry[2].nbytes for entry in self._fields.values())
+
+    # 内部処理
+    def _descend(self, grid, field, starts):
+        """starts のうち一番近いセルから距離場を下る経路の点列 (m)"""
+        if not len(starts) or not np.isfinite(field.ravel()[starts]).any():
+            return np.empty((0, 2))
+        height, width = grid.shape
+        row, column = divmod(int(starts[np.argmin(field.ravel()[starts])]), width)
+        cells = [row * width + column]
+        # 距離場を下る（距離 + 1 歩の長さが最小の隣へ進む）
+        while field[row, column] > TOLERANCE:
+            best = None
+            for dy, dx, step in _NEIGHBOURS:
+                r, c = row + dy, column + dx
+                if 0 <= r < height and 0 <= c < width:
+                    value = field[r, c] + step
+                    if best is None or value < best[0]:
+                        best = (value, r, c)
+            _, row, column = best
+            cells.append(row * width + column)
+        return grid.cell_center(cells)
+
+    def _distance(self, grid, from_id, to_id):
+        try:
+            starts = grid.ports(from_id)
+            field = self._field(grid, to_id)
+        except KeyError:
+            return math.inf
+        if not len(starts):
+            return math.inf
+        return float(field.ravel()[starts].min()) * grid.resolution
+
+    def _field(self, grid, equipment_id):
+        """距離場（セル単位）。なければ前のレイアウトの距離場を元に計算する"""
+        key = (grid.key, equipment_id)
+        entry = self._fields.get(key)
+        if entry is None:
+            sources = grid.ports(equipment_id)
+            previous = None
+            # 同じ搬送先で出入口も同じ、一番新しい距離場を元にする
+            for (_, other_id), (free, other_sources, field) in reversed(self._fields.items()):
+                if other_id == equipment_id and np.array_equal(other_sources, sources):
+                    previous = (free, field)
+                    self.reused += 1
+                    break
+            entry = self._fields[key] = (grid.free, sources,
+                                         solve_distance_field(grid.free, sources, previous))
+            self.solved += 1
+            # 使っている距離場は残し、古いものから上限まで捨てる
+            while len(self._fields) > 1 and self.nbytes() > self.max_field_bytes:
+                self._fields.popitem(last=False)
+        self._fields.move_to_end(key)
+        return entry[2]
+
+
+def solve_distance_field(free, sources, previous=None):
+    """空きセル free の上で sources（平坦化したセル番号）からの 8 近傍の距離場を求める
+
+    previous に前のレイアウトの (空きセル, 距離場) を渡すと、最短経路が新しく塞がったセルを
+    通らないセルの距離をそのまま使い、残りのセル（塞がったセルの先と、空いたセル）だけを
+    その周りのセルから計算し直す。sources は前と同じであること。
+    """
+    # 隣の番号を足し算だけで求められるように、周りに塞がったセルを 1 列ずつ足して計算する
+    height, width = free.shape
+    stride = width + 2
+    offsets = np.array([dy * stride + dx for dy, dx, _ in _NEIGHBOURS])
+    steps = np.array([step for _, _, step in _NEIGHBOURS])
+    rows, columns = np.divmod(np.asarray(sources, dtype=np.int64), width)
+    sources = (rows + 1) * stride + columns + 1
+    usable = _pad(free, False)
+    dist = np.full(usable.size, np.inf)
+    seeds = sources
+    if previous is not None and previous[0].shape == free.shape:
+        old_free = _pad(previous[0], False)
+        old_dist = _pad(previous[1], np.inf)
+        stale = _stale_cells(usable, old_free, old_dist, sources, offsets, steps)
+        keep = usable & ~stale
+        dist[keep] = old_dist[keep]
+        # 計算し直すセルの隣にある、値を残したセルから伝え直す
+        redo = np.flatnonzero(stale | (usable & ~old_free))
+        neighbours = (redo[:, None] + offsets).ravel()
+        seeds = np.append(neighbours[np.isfinite(dist[neighbours])], sources)
+    dist[sources] = 0.0
+    if len(seeds):
+        _propagate(usable, dist, seeds, offsets, steps)
+    return dist.reshape(height + 2, stride)[1:-1, 1:-1].copy()
+
+
+def _pad(grid, fill):
+    """周りに fill のセルを 1 列ずつ足して平坦にする"""
+    padded = np.full((grid.shape[0] + 2, grid.shape[1] + 2), fill, dtype=grid.dtype)
+    padded[1:-1, 1:-1] = grid
+    return padded.ravel()
+
+
+def _propagate(usable, dist, seeds, offsets, steps):
+    """seeds のセルから距離の短い順に dist を書き換えていく
+
+    距離を幅 1 のバケツに分け、バケツごとにその中のセル全部の隣を NumPy でまとめて
+    緩和する（Dial の方法）。1 歩は 1 以上なので、緩和した隣は必ず後のバケツに入り、
+    取り出したバケツのセルの距離はもう縮まない。どのセルも 1 度だけ取り出せば済む。
+    """
+    slot = np.zeros(dist.size, dtype=np.int64)
+    buckets = {}  # 距離の整数部 -> セル番号の配列のリスト
+    levels = []   # buckets のキーのヒープ
+
+    def push(cells):
+        level_of = np.floor(dist[cells]).astype(np.int64)
+        low, high = int(level_of.min()), int(level_of.max())
+        for level in range(low, high + 1):
+            part = cells if low == high else cells[level_of == level]
+            if not len(part):
+                continue
+            if level not in buckets:
+                buckets[level] = []
+                heapq.heappush(levels, level)
+            buckets[level].append(part)
+
+    push(_unique(seeds, slot))
+    while levels:
+        parts = buckets.pop(heapq.heappop(levels))
+        cells = parts[0] if len(parts) == 1 else _unique(np.concatenate(parts), slot)
+        neighbours = (cells[:, None] + offsets).ravel()
+        candidates = (dist[cells][:, None] + steps).ravel()
+        better = usable[neighbours] & (candidates < dist[neighbours] - TOLERANCE)
+        if not better.any():
+            continue
+        neighbours = neighbours[better]
+        np.minimum.at(dist, neighbours, candidates[better])
+        push(_unique(neighbours, slot))
+
+
+def _stale_cells(usable, old_free, old_dist, sources, offsets, steps):
+    """前の距離場のうち、新しく塞がったセルを通らないと値が出ないセル（塞がったセルを含む）
+
+    出発点以外のセルは、隣のセルの距離 + 1 歩がちょうど自分の距離になる隣（最短経路の 1 つ前）の
+    どれかが使えるあいだは値が変わらない。塞がったセルから始めて、使える 1 つ前がなくなった
+    セルを外側へたどっていく。たどるのは値が変わるセルの周りだけで、グリッド全体は見ない。
+    """
+    slot = np.zeros(old_dist.size, dtype=np.int64)
+    stale = np.zeros(old_dist.size, dtype=bool)
+    frontier = np.flatnonzero(old_free & ~usable & np.isfinite(old_dist))
+    stale[frontier] = True
+    is_source = np.zeros(old_dist.size, dtype=bool)
+    is_source[sources] = True
+    while len(frontier):
+        candidates = _unique((frontier[:, None] + offsets).ravel(), slot)
+        candidates = candidates[usable[candidates] & ~stale[candidates] & ~is_source[candidates]
+                                & np.isfinite(old_dist[candidates])]
+        # 使える 1 つ前の隣が残っているか
+        neighbours = candidates[:, None] + offsets
+        supports = (usable[neighbours] & ~stale[neighbours]
+                    & (np.abs(old_dist[neighbours] + steps - old_dist[candidates, None]) <= TOLERANCE))
+        frontier = candidates[~supports.any(axis=1)]
+        stale[frontier] = True
+    return stale
+
+
+def _unique(cells, slot):
+    """cells から重複を除く（並べ替えずに、作業用の配列 slot に書いた位置で見分ける）"""
+    order = np.arange(len(cells))
+    slot[cells] = order
+    return cells[slot[cells] == order]
+
+
+def _point_cells(grid, points):
+    """(k, 2) の点 (m) のあるセルの平坦化した番号（床の外は端のセル）"""
+    row = np.clip((points[:, 1] * grid.scale).astype(np.int64), 0, grid.shape[0] - 1)
+    column = np.clip((points[:, 0] * grid.scale).astype(np.int64), 0, grid.shape[1] - 1)
+    return row * grid.shape[1] + column
@@ -0,0 +1,73 @@
+"""回転した設備矩形の幾何計算
+
+描画・衝突判定・クリック判定で同じ頂点計算を共有する。
+rotation は度単位で、画像座標系（y 軸下向き）での回転とする。
+"""
+import numpy as np
+
+# 頂点の並び: 左上, 右上, 右下, 左下
+_CORNER_SIGNS = np.array([[-1.0, -1.0], [1.0, -1.0], [1.0, 1.0], [-1.0, 1.0]])
+
+
+def rotation_axes(rotation):
+    """回転角から矩形の幅方向・長さ方向の単位ベクトル (u, v) を返す
+
+    u = (cos, sin), v = (-sin, cos)。どちらも shape (n, 2)。
+    """
+    angle_rad = np.radians(np.asarray(rotation, dtype=np.float64))
+    cos_theta = np.cos(angle_rad)
+    sin_theta = np.sin(angle_rad)
+    u = np.stack([cos_theta, sin_theta], axis=-1)
+    v = np.stack([-sin_theta, cos_theta], axis=-1)
+    return u, v
+
+
+def rectangle_corners(x, y, width, length, rotation):
+    """中心 (x, y)・サイズ・回転角から 4 頂点を一括計算する
+
+    戻り値は shape (n, 4, 2)。render_layout の頂点計算と同じ式。
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    half_width = np.asarray(width, dtype=np.float64) / 2
+    half_length = np.asarray(length, dtype=np.float64) / 2
+    angle_rad = np.radians(np.asarray(rotation, dtype=np.float64))
+    cos_theta = np.cos(angle_rad)[:, None]
+    sin_theta = np.sin(angle_rad)[:, None]
+
+    px = _CORNER_SIGNS[:, 0] * half_width[:, None]
+    py = _CORNER_SIGNS[:, 1] * half_length[:, None]
+    rx = px * cos_theta - py * sin_theta + x[:, None]
+    ry = px * sin_theta + py * cos_theta + y[:, None]
+    return np.stack([rx, ry], axis=-1)
+
+
+def rotated_bounds(x, y, width, length, rotation):
+    """回転後の矩形を囲む軸平行の外接矩形 (xmin, ymin, xmax, ymax)"""
+    u, v = rotation_axes(rotation)
+    half_width = np.asarray(width, dtype=np.float64) / 2
+    half_length = np.asarray(length, dtype=np.float64) / 2
+    ex = half_width * np.abs(u[..., 0]) + half_length * np.abs(v[..., 0])
+    ey = half_width * np.abs(u[..., 1]) + half_length * np.abs(v[..., 1])
+    return x - ex, y - ey, x + ex, y + ey
+
+
+def contains_point(x, y, width, length, rotation, px, py):
+    """点 (px, py) が各矩形の内側（境界を含む）にあるかを判定する"""
+    u, v = rotation_axes(rotation)
+    dx = px - np.asarray(x, dtype=np.float64)
+    dy = py - np.asarray(y, dtype=np.float64)
+    local_u = dx * u[..., 0] + dy * u[..., 1]
+    local_v = dx * v[..., 0] + dy * v[..., 1]
+    return ((np.abs(local_u) <= np.asarray(width) / 2) &
+            (np.abs(local_v) <= np.asarray(length) / 2))
+
+
+def rectangle_distance(x, y, width, length, rotation, px, py):
+    """点 (px, py) から各矩形までのユークリッド距離（内側と境界上は 0）"""
+    u, v = rotation_axes(rotation)
+    dx = px - np.asarray(x, dtype=np.float64)
+    dy = py - np.asarray(y, dtype=np.float64)
+    outside_u = np.abs(dx * u[..., 0] + dy * u[..., 1]) - np.asarray(width) / 2
+    outside_v = np.abs(dx * v[..., 0] + dy * v[..., 1]) - np.asarray(length) / 2
+    return np.hypot(np.maximum(outside_u, 0.0), np.maximum(outside_v, 0.0))
@@ -0,0 +1,170 @@
+"""設備リストの編集履歴（元に戻す / やり直す）
+
+編集は必ず EditHistory を通して設備ストアに反映し、そのとき変わった分だけを操作として記録する。
+
+- ("set", index, 前の値, 後の値): 変わった項目だけの辞書
+- ("insert", index, 設備) / ("delete", index, 設備): 追加・削除した 1 台
+- ("extend", 位置, 追加したストア): 一括配置でまとめて追加した設備。元に戻すときはその位置から
+  追加した台数だけを消す（共有レイアウトの同期で後ろに足された他のセッションの設備は残す）
+- ("replace", 前のストア, 後のストア): 読み込みや自動配置でリストごと差し替えたとき（ストアは共有する）
+
+1 段階は 1 つ以上の操作のまとまりで、元に戻すときは逆順に逆の操作を当てる。
+衝突状態（CollisionState）を渡せば、操作が触れた設備だけをその場で更新する。
+記録に使うメモリは変わった設備の数に比例し、レイアウトの大きさにはよらない。
+差し替えだけは前のストアをそのまま持つ（コピーはしない）。
+"""
+from collections import deque
+from contextlib import contextmanager
+
+MAX_STEPS = 5000
+
+
+class EditHistory:
+    """元に戻す / やり直すための操作の記録"""
+
+    def __init__(self, max_steps=MAX_STEPS):
+        self._undo = deque(maxlen=max_steps)
+        self._redo = []
+        self._pending = None
+
+    def __len__(self):
+        return len(self._undo)
+
+    @property
+    def can_undo(self):
+        return bool(self._undo)
+
+    @property
+    def can_redo(self):
+        return bool(self._redo)
+
+    def undo_label(self):
+        return self._undo[-1][0] if self._undo else None
+
+    def redo_label(self):
+        return self._redo[-1][0] if self._redo else None
+
+    def clear(self):
+        self._undo.clear()
+        self._redo.clear()
+
+    @contextmanager
+    def step(self, label):
+        """with の中の操作を 1 段階にまとめる（何も変わらなければ記録しない）"""
+        if self._pending is not None:
+            yield
+            return
+        self._pending = []
+        try:
+            yield
+        finally:
+            operations, self._pending = self._pending, None
+            if operations:
+                self._push(label, operations)
+
+    # 編集（ストアを変更して記録する）
+    def set_fields(self, store, index, values, label="編集"):
+        """index の設備の項目を values で書き換える。変わった項目があれば True"""
+        index = index + len(store) if index < 0 else index
+        before = {}
+        after = {}
+        for key, value in values.items():
+            old = store.get_field(index, key)
+            if old != value:
+                before[key] = old
+                after[key] = value
+        if not after:
+            return False
+        store[index] = after
+        self._record(label, ("set", index, before, after))
+        return True
+
+    def append(self, store, record, label="追加"):
+        record = dict(record)
+        store.append(record)
+        self._record(label, ("insert", len(store) - 1, record))
+
+    def extend(self, store, added, label="一括配置"):
+        """ストア added の設備を末尾にまとめて追加する"""
+        start = len(store)
+        store.extend(added)
+        self._record(label, ("extend", start, added))
+
+    def pop(self, store, index, label="削除"):
+        index = index + len(store) if index < 0 else index
+        record = store.pop(index)
+        self._record(label, ("delete", index, record))
+        return record
+
+    def replace(self, store, new_store, label="差し替え"):
+        """リストごと差し替える。戻り値の new_store をセッションに入れる"""
+        self._record(label, ("replace", store, new_store))
+        return new_store
+
+    # 元に戻す / やり直す
+    def undo(self, store, collision_state=None):
+        """1 段階元に戻す。戻り値のストアをセッションに入れる（差し替えを戻すと別のストアになる）"""
+        if not self._undo:
+            return store
+        label, operations = self._undo.pop()
+        for operation in reversed(operations):
+            store = _apply(store, operation, True, collision_state)
+        self._redo.append((label, operations))
+        return store
+
+    def redo(self, store, collision_state=None):
+        """元に戻した段階を 1 つやり直す"""
+        if not self._redo:
+            return store
+        label, operations = self._redo.pop()
+        for operation in operations:
+            store = _apply(store, operation, False, collision_state)
+        self._undo.append((label, operations))
+        return store
+
+    # 内部処理
+    def _record(self, label, operation):
+        if self._pending is not None:
+            self._pending.append(operation)
+        else:
+            self._push(label, [operation])
+
+    def _push(self, label, operations):
+        self._undo.append((label, operations))
+        self._redo.clear()
+
+
+def _apply(store, operation, reverse, collision_state=None):
+    kind = operation[0]
+    if kind == "set":
+        _, index, before, after = operation
+        store[index] = before if reverse else after
+        if collision_state is not None:
+            collision_state.update(index, store[index])
+    elif kind == "extend":
+        _, start, added = operation
+        stop = start + len(added)
+        if reverse:
+            store.delete_range(start, stop)
+            if collision_state is not None:
+                collision_state.remove_range(start, stop)
+        else:
+            store.extend(added, start)
+            if collision_state is not None:
+                collision_state.extend(store, start, stop)
+    elif kind in ("insert", "delete"):
+        _, index, record = operation
+        if (kind == "insert") == reverse:
+            store.pop(index)
+            if collision_state is not None:
+                collision_state.remove(index)
+        else:
+            store.insert(index, record)
+            if collision_state is not None:
+                collision_state.insert(index, record)
+    else:
+        _, old, new = operation
+        store = old if reverse else new
+        if collision_state is not None:
+            collision_state.rebuild(store)
+    return store
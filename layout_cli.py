@@ -0,0 +1,222 @@
+"""レイアウトファイルをコマンドラインで検査・集計・書き出す（Streamlit なしで動く）
+
+    python -m layout_cli check layouts/*.npz [--min-aisle 1.0] [--fail-on collisions outside]
+    python -m layout_cli stats layout.json [--output-format json]
+    python -m layout_cli clearance layout.npz [--resolution 0.1] [--output-format csv]
+    python -m layout_cli lines layout.npz [--output-format json]
+    python -m layout_cli export layout.npz layout.pdf [--scale 20] [--no-grid] [--no-labels]
+
+check と clearance は問題のあるレイアウトが 1 つでもあれば終了コード 1、読めないファイルがあれば 2 を返すので、
+夜間のバッチで大量のレイアウトをまとめて検査できる。
+"""
+import argparse
+import csv
+import json
+import sys
+
+from layout_format import LayoutFormatError
+
+# check で数える問題と、評価結果のキー
+PROBLEMS = {"collisions": "collision_pairs", "outside": "outside_items", "narrow": "narrow_items"}
+# check で一度に読み込んで評価するファイルの数（メモリを抑えるため）
+CHECK_BATCH = 256
+
+CHECK_COLUMNS = ["name", "items", "collision_pairs", "colliding_items", "outside_items",
+                 "area_usage", "min_clearance", "narrow_items", "status"]
+CLEARANCE_COLUMNS = ["name", "item_id", "type", "other_id", "other_type", "required", "clearance",
+                     "x", "y", "area"]
+LINE_COLUMNS = ["name", "line", "items", "conveyors", "throughput", "bottleneck_ids", "blocked_items"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="layout_cli", description="工場レイアウトファイルの検査・集計・書き出し")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    check = commands.add_parser("check", help="衝突・はみ出し・通路幅を検査する")
+    check.add_argument("files", nargs="+")
+    check.add_argument("--min-aisle", type=float, default=None, help="通路幅の基準 (m)")
+    check.add_argument("--fail-on", nargs="*", choices=sorted(PROBLEMS),
+                       default=["collisions", "outside"], help="失敗として扱う問題")
+    check.add_argument("--processes", type=int, default=None)
+    check.add_argument("--output-format", choices=("table", "csv", "json"), default="table")
+
+    stats = commands.add_parser("stats", help="設備の数や面積使用率を表示する")
+    stats.add_argument("files", nargs="+")
+    stats.add_argument("--output-format", choices=("table", "json"), default="table")
+
+    clearance = commands.add_parser("clearance", help="設備の種類ごとの安全距離に満たない場所を一覧にする")
+    clearance.add_argument("files", nargs="+")
+    clearance.add_argument("--resolution", type=float, default=None, help="セルの大きさ (m)")
+    clearance.add_argument("--output-format", choices=("table", "csv", "json"), default="table")
+
+    lines = commands.add_parser("lines", help="コンベヤーラインごとの流量とボトルネックを表示する")
+    lines.add_argument("files", nargs="+")
+    lines.add_argument("--output-format", choices=("table", "csv", "json"), default="table")
+
+    export = commands.add_parser("export", help="レイアウト図を PNG / SVG / PDF に書き出す")
+    export.add_argument("file")
+    export.add_argument("output", help="出力先（拡張子で形式を決める）")
+    export.add_argument("--scale", type=float, default=None, help="1 m あたりのピクセル数")
+    export.add_argument("--no-grid", action="store_true")
+    export.add_argument("--no-labels", action="store_true")
+
+    args = parser.parse_args(argv)
+    return {"check": _check, "stats": _stats, "clearance": _clearance, "lines": _lines,
+            "export": _export}[args.command](args)
+
+
+def _check(args):
+    from layout_core import DEFAULT_MIN_AISLE, check_layouts, load_layout
+
+    min_aisle = DEFAULT_MIN_AISLE if args.min_aisle is None else args.min_aisle
+    rows = []
+    failed = unreadable = 0
+    for start in range(0, len(args.files), CHECK_BATCH):
+        layouts = []
+        for path in args.files[start:start + CHECK_BATCH]:
+            try:
+                layouts.append(load_layout(path))
+            except (OSError, LayoutFormatError) as error:
+                unreadable += 1
+                rows.append({"name": path, "status": f"error: {error}"})
+        for score in check_layouts(layouts, min_aisle=min_aisle, processes=args.processes):
+            problems = [problem for problem in args.fail_on if score[PROBLEMS[problem]]]
+            failed += bool(problems)
+            rows.append(dict(score, status=",".join(problems) or "ok"))
+    # 読めなかったファイルも含めて、指定された順に並べ直す
+    order = {path: index for index, path in enumerate(args.files)}
+    rows.sort(key=lambda row: order[row["name"]])
+    _write_rows(rows, CHECK_COLUMNS, args.output_format)
+    print(f"{len(args.files)} layouts: {len(args.files) - failed - unreadable} ok, "
+          f"{failed} failed, {unreadable} unreadable", file=sys.stderr)
+    if unreadable:
+        return 2
+    return 1 if failed else 0
+
+
+def _stats(args):
+    from layout_core import layout_statistics, load_layout
+
+    results = []
+    status = 0
+    for path in args.files:
+        try:
+            layout = load_layout(path)
+        except (OSError, LayoutFormatError) as error:
+            print(f"{path}: {error}", file=sys.stderr)
+            status = 2
+            continue
+        statistics = layout_statistics(layout["equipment_list"], layout["factory_width"],
+                                       layout["factory_length"])
+        # 区画ごとの密度は表示しない（JSON にも入れない）
+        statistics.pop("density")
+        results.append(dict(statistics, name=path, layout_name=layout["layout_name"]))
+    if args.output_format == "json":
+        json.dump(results, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+        return status
+    for statistics in results:
+        print(f"{statistics['name']} ({statistics['layout_name']})")
+        print(f"  設備の数: {statistics['items']}")
+        print(f"  総設備面積: {statistics['total_area']:.1f} m²")
+        print(f"  占有面積: {statistics['covered_area']:.1f} m²（重なり {statistics['overlap_area']:.1f} m²）")
+        print(f"  空き面積: {statistics['free_area']:.1f} m²")
+        print(f"  工場総面積: {statistics['factory_area']:.1f} m²")
+        print(f"  面積使用率: {statistics['area_usage']:.1f}%")
+        for label, count in statistics["type_counts"].items():
+            print(f"  - {label}: {count}（{statistics['type_areas'][label]:.1f} m²）")
+    return status
+
+
+def _clearance(args):
+    from layout_core import DEFAULT_RESOLUTION, check_clearance, load_layout
+
+    resolution = DEFAULT_RESOLUTION if args.resolution is None else args.resolution
+    rows = []
+    status = 0
+    for path in args.files:
+        try:
+            layout = load_layout(path)
+        except (OSError, LayoutFormatError) as error:
+            print(f"{path}: {error}", file=sys.stderr)
+            status = 2
+            continue
+        violations = check_clearance(layout, resolution)["violations"]
+        rows.extend(dict(violation, name=path) for violation in violations)
+        if violations and not status:
+            status = 1
+    _write_rows(rows, CLEARANCE_COLUMNS, args.output_format)
+    print(f"{len(rows)} clearance violations in {len(args.files)} layouts", file=sys.stderr)
+    return status
+
+
+def _lines(args):
+    from layout_core import check_lines, load_layout
+
+    rows = []
+    status = 0
+    for path in args.files:
+        try:
+            layout = load_layout(path)
+        except (OSError, LayoutFormatError) as error:
+            print(f"{path}: {error}", file=sys.stderr)
+            status = 2
+            continue
+        store = layout["equipment_list"]
+        result = check_lines(layout)
+        ids, types = store.ids, store.strings("type")
+        for number, line in enumerate(result["lines"]):
+            rows.append({
+                "name": path,
+                "line": number,
+                "items": len(line["items"]),
+                "conveyors": int((types[line["items"]] == "conveyor").sum()),
+                "throughput": line["throughput"],
+                "bottleneck_ids": " ".join(str(ids[i]) for i in line["bottlenecks"]),
+                "blocked_items": int(result["blocked"][line["items"]].sum()),
+            })
+    _write_rows(rows, LINE_COLUMNS, args.output_format)
+    print(f"{len(rows)} lines in {len(args.files)} layouts", file=sys.stderr)
+    return status
+
+
+def _export(args):
+    from layout_core import export_file, load_layout
+
+    fmt = args.output.rsplit(".", 1)[-1].lower()
+    try:
+        layout = load_layout(args.file)
+        export_file(layout, args.output, fmt, show_grid=not args.no_grid,
+                    show_equipment_info=not args.no_labels, scale_factor=args.scale)
+    except (OSError, ValueError) as error:
+        # LayoutFormatError と未対応の出力形式はどちらも ValueError
+        print(f"{args.file}: {error}", file=sys.stderr)
+        return 2
+    return 0
+
+
+def _write_rows(rows, columns, output_format):
+    if output_format == "json":
+        json.dump(rows, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    elif output_format == "csv":
+        writer = csv.DictWriter(sys.stdout, columns, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+    else:
+        cells = [[_cell(row.get(column, "")) for column in columns] for row in rows]
+        widths = [max([len(column)] + [len(line[i]) for line in cells]) for i, column in enumerate(columns)]
+        for line in [columns] + cells:
+            print("  ".join(cell.ljust(width) for cell, width in zip(line, widths)).rstrip())
+
+
+def _cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return f"{value:.3f}"
+    return str(value)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
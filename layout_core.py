@@ -0,0 +1,157 @@
+"""Streamlit を使わずにレイアウトを扱う処理（アプリと CLI で共通）
+
+設備の種類ごとの既定値（安全距離を含む）、レイアウトファイルの読み込み、統計、
+検査（衝突・はみ出し・通路幅・安全距離・コンベヤーライン）、図の書き出しをまとめる。
+起動を速くするため、ここでは NumPy と標準ライブラリしか読み込まない。
+描画に使う PIL は書き出すときに、pandas は設備一覧の表を作るときに初めて読み込む
+（matplotlib は使わない）。
+"""
+import shutil
+
+import numpy as np
+
+from clearance import DEFAULT_RESOLUTION, clearance_violations
+from collision import collision_pairs
+from conveyor import ConveyorNetwork
+from coverage import coverage_statistics
+from equipment_store import EquipmentStore
+from evaluation import DEFAULT_MIN_AISLE, evaluate_layouts
+from layout_format import read_layout
+
+# 設備種類のデフォルトサイズマップ（clearance は周りに空けておく安全距離 (m)、rate はラインでの処理能力 (個/時)）
+EQUIPMENT_DEFAULTS = {
+    "robot": {"width": 2.0, "length": 2.0, "color": "#FF9800", "label": "産業用ロボット", "clearance": 1.5, "rate": 240.0},
+    "machine": {"width": 3.0, "length": 5.0, "color": "#2196F3", "label": "加工機械", "clearance": 1.0, "rate": 60.0},
+    "conveyor": {"width": 1.0, "length": 10.0, "color": "#8BC34A", "label": "コンベヤー", "clearance": 0.8, "rate": 1200.0},
+    "workstation": {"width": 2.0, "length": 3.0, "color": "#9C27B0", "label": "作業台", "clearance": 1.0, "rate": 40.0},
+    "storage": {"width": 5.0, "length": 8.0, "color": "#795548", "label": "倉庫/棚", "clearance": 1.2, "rate": 600.0},
+    "agv": {"width": 1.5, "length": 2.5, "color": "#FFEB3B", "label": "AGV/無人搬送車", "clearance": 1.0, "rate": 120.0},
+    "custom": {"width": 4.0, "length": 4.0, "color": "#607D8B", "label": "カスタム設備", "clearance": 1.0, "rate": 60.0}
+}
+
+# 設備の幅・長さの範囲 (m)（サイドバーのスライダーと同じ）。キャンバスで拡大した設備もこの範囲に収める
+MIN_SIZE = 0.5
+MAX_SIZE = 20.0
+
+
+def type_label(equipment_type):
+    """設備の種類の表示名（知らない種類はそのまま返す）"""
+    return EQUIPMENT_DEFAULTS.get(equipment_type, {}).get("label", equipment_type)
+
+
+def clearance_thresholds():
+    """設備の種類ごとの安全距離 {種類: m}"""
+    return {equipment_type: defaults["clearance"] for equipment_type, defaults in EQUIPMENT_DEFAULTS.items()}
+
+
+def throughput_rates():
+    """設備の種類ごとのラインでの処理能力 {種類: 個/時}"""
+    return {equipment_type: defaults["rate"] for equipment_type, defaults in EQUIPMENT_DEFAULTS.items()}
+
+
+def load_layout(path):
+    """レイアウトファイル（.json / .npz）を読み込む。戻り値は read_layout() と同じ辞書"""
+    with open(path, "rb") as file:
+        layout = read_layout(file)
+    layout["path"] = str(path)
+    return layout
+
+
+def layout_statistics(equipment_list, factory_width, factory_length, analyzer=None):
+    """設備の数・面積・面積使用率 (%)・設備タイプ別の数と面積を求める
+
+    total_area は幅 x 長さ の合計（重なりも二重に数える）、covered_area は設備が実際に
+    占める床の面積で、面積使用率は covered_area から求める。analyzer（CoverageAnalyzer）を
+    渡すと同じレイアウトの結果を使い回す。
+    """
+    store = _as_store(equipment_list)
+    if analyzer is None:
+        coverage = coverage_statistics(store, factory_width, factory_length)
+    else:
+        coverage = analyzer.analyze(store, factory_width, factory_length)
+    factory_area = factory_width * factory_length
+    type_counts = {}
+    type_areas = {}
+    for equipment_type, aggregate in coverage["types"].items():
+        label = type_label(equipment_type)
+        type_counts[label] = type_counts.get(label, 0) + aggregate["count"]
+        type_areas[label] = type_areas.get(label, 0.0) + aggregate["covered_area"]
+    return {
+        "items": len(store),
+        "total_area": coverage["nominal_area"],
+        "covered_area": coverage["covered_area"],
+        "free_area": coverage["free_area"],
+        "overlap_area": coverage["overlap_area"],
+        "factory_area": factory_area,
+        "area_usage": coverage["covered_area"] / factory_area * 100 if factory_area else 0.0,
+        "type_counts": type_counts,
+        "type_areas": type_areas,
+        "density": coverage["density"],
+        "zone_size": coverage["zone_size"],
+    }
+
+
+def equipment_table(equipment_list, indices=None):
+    """設備一覧の表（pandas.DataFrame）を列から一括で作る（indices を渡すとその行だけ）"""
+    import pandas as pd
+
+    store = _as_store(equipment_list)
+    if indices is None:
+        indices = np.arange(len(store))
+    type_labels = np.array([type_label(t) for t in store.table("type")], dtype=object)
+    labels = np.asarray(store.table("label") or [""], dtype=object)
+    rotation = store.rotation[indices]
+    if np.all(rotation == np.round(rotation)):
+        rotation = rotation.astype(int)
+    return pd.DataFrame({
+        "ID": indices + 1,
+        "設備名": labels[store.codes("label")[indices]],
+        "タイプ": type_labels[store.codes("type")[indices]],
+        "幅 (m)": store.width[indices],
+        "長さ (m)": store.length[indices],
+        "X位置 (m)": store.x[indices],
+        "Y位置 (m)": store.y[indices],
+        "回転 (度)": rotation
+    })
+
+
+def check_layouts(layouts, min_aisle=DEFAULT_MIN_AISLE, processes=None):
+    """読み込んだレイアウトを evaluate_layouts() でまとめて検査する（name にはファイルのパスを使う）"""
+    named = [dict(layout, name=layout.get("path", layout.get("layout_name", ""))) for layout in layouts]
+    return evaluate_layouts(named, min_aisle=min_aisle, processes=processes)
+
+
+def check_clearance(layout, resolution=DEFAULT_RESOLUTION, thresholds=None):
+    """安全距離に満たない場所を clearance_violations() で求める（thresholds の既定は種類ごとの値）"""
+    return clearance_violations(layout["equipment_list"], layout["factory_width"], layout["factory_length"],
+                                thresholds or clearance_thresholds(), resolution)
+
+
+def check_lines(layout, rates=None):
+    """コンベヤーラインの接続と流量を ConveyorNetwork で求める（rates の既定は種類ごとの値）"""
+    return ConveyorNetwork().analyze(_as_store(layout["equipment_list"]), rates or throughput_rates())
+
+
+def colliding_indices(equipment_list):
+    """ほかの設備と重なっている設備の index の集合"""
+    store = _as_store(equipment_list)
+    return set(np.unique(collision_pairs(*store.arrays())).tolist())
+
+
+def export_file(layout, output, fmt, show_grid=True, show_equipment_info=True, scale_factor=None):
+    """レイアウトを PNG / SVG / PDF にして output（パス）へ書き出す。衝突している設備は赤く描く"""
+    # PIL を読み込むのは書き出すときだけ
+    from export import SCALE_FACTOR, export_layout
+
+    store = layout["equipment_list"]
+    exported = export_layout(fmt, store, layout["factory_width"], layout["factory_length"],
+                             layout["floor_color"], colliding_indices(store), show_grid,
+                             show_equipment_info, scale_factor or SCALE_FACTOR)
+    with exported, open(output, "wb") as file:
+        shutil.copyfileobj(exported, file)
+
+
+def _as_store(equipment_list):
+    if isinstance(equipment_list, EquipmentStore):
+        return equipment_list
+    return EquipmentStore.from_records(equipment_list)
@@ -0,0 +1,244 @@
+"""レイアウトファイルの読み書き（JSON と列指向のバイナリ形式 NPZ）
+
+NPZ は設備の列をそのまま NumPy 配列として保存する形式で、文字列の列は
+重複を除いた表 ({列名}_table) と番号 ({列名}_codes) で持つ。
+工場サイズなどは meta に JSON 文字列として入れる。
+
+どちらの形式も読み込み時に内容を検査し、おかしなファイルは LayoutFormatError にする。
+読み込んだ列は辞書のリストを経由せずに EquipmentStore.from_columns() で取り込む。
+"""
+import io
+import json
+import math
+import zipfile
+import zlib
+
+import numpy as np
+
+from equipment_store import NUMERIC_FIELDS, STRING_FIELDS, EquipmentStore
+
+FORMAT_VERSION = 1
+# 形式ごとの MIME タイプ
+LAYOUT_FORMATS = {
+    "json": "application/json",
+    "npz": "application/octet-stream",
+}
+# アプリで扱える工場の幅・奥行きの範囲 (m)（工場サイズのスライダーと同じ）
+FACTORY_SIZE_RANGE = (5.0, 500.0)
+_META_FIELDS = {
+    "layout_name": str,
+    "factory_width": (int, float),
+    "factory_length": (int, float),
+    "floor_color": str,
+}
+
+
+class LayoutFormatError(ValueError):
+    """レイアウトファイルの内容が不正"""
+
+
+def write_layout(fmt, equipment_list, factory_width, factory_length, floor_color, layout_name):
+    """fmt 形式のレイアウトファイルのバイト列を返す"""
+    store = _as_store(equipment_list)
+    meta = {
+        "layout_name": layout_name,
+        "factory_width": factory_width,
+        "factory_length": factory_length,
+        "floor_color": floor_color,
+    }
+    if fmt == "json":
+        return _write_json(store, meta)
+    if fmt == "npz":
+        return _write_npz(store, meta)
+    raise ValueError(f"未対応のレイアウト形式です: {fmt}")
+
+
+def read_layout(file, fmt=None, size_range=None):
+    """レイアウトファイルを読み込んで検査する
+
+    fmt を省略するとファイル名（name 属性）の拡張子で判断する。size_range に (最小, 最大) を
+    渡すと、工場サイズがその範囲にないファイルも LayoutFormatError にする（アプリでは
+    FACTORY_SIZE_RANGE を渡す）。
+    戻り値は layout_name・equipment_list（EquipmentStore）・工場サイズ（float）・床の色の辞書。
+    """
+    if fmt is None:
+        fmt = str(getattr(file, "name", "")).rsplit(".", 1)[-1].lower()
+    if fmt == "json":
+        layout = _read_json(file)
+    elif fmt == "npz":
+        layout = _read_npz(file)
+    else:
+        raise LayoutFormatError(f"未対応のレイアウト形式です: {fmt}")
+    if size_range is not None:
+        check_factory_size(layout["factory_width"], layout["factory_length"], size_range)
+    return layout
+
+
+def check_factory_size(factory_width, factory_length, size_range=FACTORY_SIZE_RANGE):
+    """工場の幅・奥行きが size_range (最小, 最大) の中になければ LayoutFormatError にする"""
+    low, high = size_range
+    for name, value in (("工場の幅", factory_width), ("工場の奥行き", factory_length)):
+        if not low <= value <= high:
+            raise LayoutFormatError(f"{name} {value:g} m は {low:g} から {high:g} m の範囲にありません")
+
+
+def encode_columns(columns):
+    """列の辞書を NPZ に保存する配列の辞書にする"""
+    arrays = {field: np.asarray(columns[field], dtype=np.float64) for field in NUMERIC_FIELDS}
+    arrays["id"] = np.asarray(columns["id"], dtype=np.int64)
+    for field in STRING_FIELDS:
+        # 文字列は重複を除いた表と番号で持つ
+        table, codes = np.unique(np.asarray(columns[field], dtype=str), return_inverse=True)
+        arrays[f"{field}_table"] = table
+        arrays[f"{field}_codes"] = codes.reshape(-1).astype(np.int32)
+    return arrays
+
+
+def decode_columns(arrays):
+    """encode_columns() の配列（np.load の結果でもよい）を検査して列の辞書に戻す"""
+    files = set(getattr(arrays, "files", arrays))
+    required = set(NUMERIC_FIELDS) | {"id"}
+    required |= {f"{field}_{part}" for field in STRING_FIELDS for part in ("table", "codes")}
+    missing = sorted(required - files)
+    if missing:
+        raise LayoutFormatError(f"必要な列がありません: {', '.join(missing)}")
+
+    columns = {}
+    n = None
+    for field in NUMERIC_FIELDS + ("id",):
+        values = arrays[field]
+        kinds = "iu" if field == "id" else "fiu"
+        if values.ndim != 1 or values.dtype.kind not in kinds:
+            raise LayoutFormatError(f"列 {field} の型が不正です: {values.dtype} {values.shape}")
+        if n is None:
+            n = len(values)
+        elif len(values) != n:
+            raise LayoutFormatError(f"列 {field} の長さが他の列と違います")
+        columns[field] = values
+    for field in NUMERIC_FIELDS:
+        if not np.isfinite(columns[field]).all():
+            raise LayoutFormatError(f"列 {field} に数値でない値があります")
+    if n and ((columns["width"] <= 0).any() or (columns["length"] <= 0).any()):
+        raise LayoutFormatError("幅と長さは正の値でなければなりません")
+
+    for field in STRING_FIELDS:
+        table = arrays[f"{field}_table"]
+        codes = arrays[f"{field}_codes"]
+        if table.ndim != 1 or table.dtype.kind != "U":
+            raise LayoutFormatError(f"列 {field} の文字列表の型が不正です: {table.dtype}")
+        if codes.ndim != 1 or codes.dtype.kind not in "iu" or len(codes) != n:
+            raise LayoutFormatError(f"列 {field} の番号の型か長さが不正です")
+        if n and (codes.min() < 0 or codes.max() >= len(table)):
+            raise LayoutFormatError(f"列 {field} の番号が文字列表の範囲外です")
+        columns[field] = table.astype(object)[codes]
+    return columns
+
+
+# JSON（従来の形式。キーと値はエクスポートしていたものと同じ）
+def _write_json(store, meta):
+    columns = store.to_columns()
+    rotation = columns["rotation"]
+    values = {field: columns[field].tolist() for field in columns}
+    # 回転は整数値なら int で書く（EquipmentStore の読み出しと同じ）
+    if np.all(rotation == np.round(rotation)):
+        values["rotation"] = rotation.astype(np.int64).tolist()
+    keys = ("type", "width", "length", "color", "x", "y", "rotation", "label", "id")
+    equipment = [dict(zip(keys, row)) for row in zip(*(values[key] for key in keys))]
+    data = {"layout_name": meta["layout_name"], "equipment_list": equipment}
+    data.update((key, meta[key]) for key in ("factory_width", "factory_length", "floor_color"))
+    return json.dumps(data, separators=(",", ":")).encode()
+
+
+def _read_json(file):
+    try:
+        data = json.load(file)
+    except (UnicodeDecodeError, json.JSONDecodeError) as error:
+        raise LayoutFormatError(f"JSON として読めません: {error}") from error
+    if not isinstance(data, dict):
+        raise LayoutFormatError("レイアウトの JSON はオブジェクトでなければなりません")
+    meta = _check_meta(data)
+    records = data.get("equipment_list")
+    if not isinstance(records, list):
+        raise LayoutFormatError("equipment_list がリストではありません")
+
+    n = len(records)
+    columns = {field: np.empty(n, dtype=np.float64) for field in NUMERIC_FIELDS}
+    columns["id"] = np.arange(n, dtype=np.int64)
+    columns.update({field: [""] * n for field in STRING_FIELDS})
+    for i, record in enumerate(records):
+        if not isinstance(record, dict):
+            raise LayoutFormatError(f"{i + 1} 番目の設備がオブジェクトではありません")
+        for field in NUMERIC_FIELDS:
+            value = record.get(field)
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise LayoutFormatError(f"{i + 1} 番目の設備の {field} が数値ではありません")
+            columns[field][i] = value
+        if "id" in record:
+            if isinstance(record["id"], bool) or not isinstance(record["id"], int):
+                raise LayoutFormatError(f"{i + 1} 番目の設備の id が整数ではありません")
+            columns["id"][i] = record["id"]
+        for field in STRING_FIELDS:
+            value = record.get(field, "")
+            if not isinstance(value, str):
+                raise LayoutFormatError(f"{i + 1} 番目の設備の {field} が文字列ではありません")
+            columns[field][i] = value
+    # 数値の範囲などは NPZ と同じ検査にかける
+    decode_columns(encode_columns(columns))
+    return dict(meta, equipment_list=EquipmentStore.from_columns(columns))
+
+
+# NPZ
+def _write_npz(store, meta):
+    arrays = encode_columns(store.to_columns())
+    arrays["meta"] = np.array(json.dumps(dict(meta, format_version=FORMAT_VERSION)))
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def _read_npz(file):
+    try:
+        data = np.load(file, allow_pickle=False)
+        if not isinstance(data, np.lib.npyio.NpzFile):
+            raise LayoutFormatError("NPZ ファイルではありません")
+        with data:
+            return _read_npz_arrays(data)
+    except LayoutFormatError:
+        raise
+    except (OSError, ValueError, EOFError, zipfile.BadZipFile, zlib.error) as error:
+        raise LayoutFormatError(f"NPZ として読めません: {error}") from error
+
+
+def _read_npz_arrays(data):
+    if "meta" not in data.files:
+        raise LayoutFormatError("meta がありません")
+    try:
+        meta = json.loads(str(data["meta"]))
+    except json.JSONDecodeError as error:
+        raise LayoutFormatError(f"meta が JSON として読めません: {error}") from error
+    if not isinstance(meta, dict) or meta.get("format_version") != FORMAT_VERSION:
+        raise LayoutFormatError(f"未対応の形式のバージョンです: {meta!r:.80}")
+    meta = _check_meta(meta)
+    columns = decode_columns(data)
+    return dict(meta, equipment_list=EquipmentStore.from_columns(columns))
+
+
+def _check_meta(data):
+    meta = {}
+    for key, types in _META_FIELDS.items():
+        value = data.get(key)
+        if isinstance(value, bool) or not isinstance(value, types):
+            raise LayoutFormatError(f"{key} がないか型が不正です")
+        meta[key] = value
+    for key in ("factory_width", "factory_length"):
+        if not math.isfinite(meta[key]) or meta[key] <= 0:
+            raise LayoutFormatError(f"{key} は正の値でなければなりません")
+        # 整数で書かれていても float にそろえる（スライダーは float の値しか受け付けない）
+        meta[key] = float(meta[key])
+    return meta
+
+
+def _as_store(equipment_list):
+    if isinstance(equipment_list, EquipmentStore):
+        return equipment_list
+    return EquipmentStore.from_records(equipment_list)
@@ -0,0 +1,224 @@
+"""保存したレイアウトを SQLite に置くリポジトリ
+
+レイアウトは名前ごとに版を重ねて保存する。名前と保存日時には索引があり、
+読み込みは選んだ版だけを取り出すので、セッションには保存済みレイアウトを持たない。
+
+各版は次のどちらかで保存する。
+- 全体: 設備の列をそのまま圧縮した npz
+- 差分: 同じ名前の直前の版を元に、元の版の行番号 (source) と追加・変更された行だけの npz。
+  内容が同じ行は元の版の行を共有するので、数台だけ動かした版はほとんど場所を取らない。
+差分が長く連なると読み込みが遅くなるので、MAX_DELTA_CHAIN 版ごとと、
+変わった行が多いときは全体で保存し直す。
+"""
+import io
+import os
+import sqlite3
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+
+from equipment_store import NUMERIC_FIELDS, STRING_FIELDS, EquipmentStore
+from layout_format import decode_columns, encode_columns
+
+DEFAULT_PATH = os.environ.get("LAYOUT_DB_PATH", "layouts.sqlite3")
+# 差分を連ねる最大の版数
+MAX_DELTA_CHAIN = 16
+# 変わった行がこの割合を超えたら差分ではなく全体で保存する
+MAX_DELTA_FRACTION = 0.5
+# 保存・読み込みした版の列を覚えておく数（次の差分の元にする）
+RECENT_VERSIONS = 4
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS layout_versions (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    saved_at TEXT NOT NULL,
+    factory_width REAL NOT NULL,
+    factory_length REAL NOT NULL,
+    floor_color TEXT NOT NULL,
+    item_count INTEGER NOT NULL,
+    base_id INTEGER REFERENCES layout_versions(id),
+    depth INTEGER NOT NULL,
+    payload BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS layout_versions_name ON layout_versions(name, saved_at);
+CREATE INDEX IF NOT EXISTS layout_versions_saved_at ON layout_versions(saved_at);
+"""
+
+
+class LayoutRepository:
+    """レイアウトの版を保存・検索・読み込みする"""
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        # Streamlit は再実行ごとにスレッドが変わるので、同じ接続を別スレッドからも使う
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript(_SCHEMA)
+        self._recent = OrderedDict()  # 版 id -> 列の辞書
+
+    def close(self):
+        self._connection.close()
+
+    def save(self, name, equipment_list, factory_width, factory_length, floor_color,
+             saved_at=None):
+        """新しい版として保存し、その版の id を返す"""
+        store = equipment_list
+        if not isinstance(store, EquipmentStore):
+            store = EquipmentStore.from_records(equipment_list)
+        columns = store.to_columns()
+        saved_at = saved_at or datetime.now().strftime(TIMESTAMP_FORMAT)
+
+        base_id, depth, payload = None, 0, None
+        latest = self._latest_version(name)
+        if latest is not None and latest[1] < MAX_DELTA_CHAIN:
+            base_columns = self._columns(latest[0])
+            source = _shared_rows(base_columns, columns)
+            added = np.flatnonzero(source < 0)
+            if len(added) <= MAX_DELTA_FRACTION * max(len(source), 1):
+                base_id, depth = latest[0], latest[1] + 1
+                payload = _pack(_take(columns, added), source=source)
+        if payload is None:
+            payload = _pack(columns)
+
+        with self._connection:
+            cursor = self._connection.execute(
+                "INSERT INTO layout_versions (name, saved_at, factory_width, factory_length, "
+                "floor_color, item_count, base_id, depth, payload) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (name, saved_at, float(factory_width), float(factory_length), floor_color,
+                 len(store), base_id, depth, payload))
+        version_id = cursor.lastrowid
+        self._remember(version_id, columns)
+        return version_id
+
+    def names(self):
+        """保存済みの名前を新しい順に (名前, 最終保存日時, 版数) で返す"""
+        return self._connection.execute(
+            "SELECT name, MAX(saved_at), COUNT(*) FROM layout_versions "
+            "GROUP BY name ORDER BY MAX(saved_at) DESC").fetchall()
+
+    def versions(self, name):
+        """name の版を新しい順に (版 id, 保存日時, 設備数) で返す"""
+        return self._connection.execute(
+            "SELECT id, saved_at, item_count FROM layout_versions WHERE name = ? "
+            "ORDER BY saved_at DESC, id DESC", (name,)).fetchall()
+
+    def load(self, name=None, version_id=None):
+        """版（省略時は name の最新版）を読み込む
+
+        戻り値は equipment_list（EquipmentStore）・工場サイズ・床の色・保存日時の辞書。
+        """
+        if version_id is None:
+            latest = self._latest_version(name)
+            if latest is None:
+                raise KeyError(name)
+            version_id = latest[0]
+        row = self._connection.execute(
+            "SELECT name, saved_at, factory_width, factory_length, floor_color "
+            "FROM layout_versions WHERE id = ?", (version_id,)).fetchone()
+        if row is None:
+            raise KeyError(version_id)
+        name, saved_at, factory_width, factory_length, floor_color = row
+        return {
+            "name": name,
+            "equipment_list": EquipmentStore.from_columns(self._columns(version_id)),
+            "factory_width": factory_width,
+            "factory_length": factory_length,
+            "floor_color": floor_color,
+            "timestamp": saved_at,
+        }
+
+    def storage_bytes(self):
+        """保存している版のデータの合計バイト数"""
+        return self._connection.execute(
+            "SELECT COALESCE(SUM(LENGTH(payload)), 0) FROM layout_versions").fetchone()[0]
+
+    # 内部処理
+    def _latest_version(self, name):
+        return self._connection.execute(
+            "SELECT id, depth FROM layout_versions WHERE name = ? "
+            "ORDER BY saved_at DESC, id DESC LIMIT 1", (name,)).fetchone()
+
+    def _columns(self, version_id):
+        """版の列を組み立てる（差分なら元の版までさかのぼる）"""
+        if version_id in self._recent:
+            self._recent.move_to_end(version_id)
+            return self._recent[version_id]
+        chain = []
+        current = version_id
+        while current is not None and current not in self._recent:
+            base_id, payload = self._connection.execute(
+                "SELECT base_id, payload FROM layout_versions WHERE id = ?",
+                (current,)).fetchone()
+            chain.append((current, payload))
+            current = base_id
+        columns = self._recent[current] if current is not None else None
+        for current, payload in reversed(chain):
+            rows, source = _unpack(payload)
+            columns = rows if source is None else _apply(columns, rows, source)
+        self._remember(version_id, columns)
+        return columns
+
+    def _remember(self, version_id, columns):
+        self._recent[version_id] = columns
+        while len(self._recent) > RECENT_VERSIONS:
+            self._recent.popitem(last=False)
+
+
+def _shared_rows(base, columns):
+    """columns の各行と内容が同じ base の行番号（なければ -1）"""
+    n_base = len(base["x"])
+    fields = ([(field, "f8") for field in NUMERIC_FIELDS] + [("id", "i8")] +
+              [(field, "i8") for field in STRING_FIELDS])
+    rows = np.empty(n_base + len(columns["x"]), dtype=fields)
+    for field in NUMERIC_FIELDS + ("id",):
+        rows[field] = np.concatenate([base[field], columns[field]])
+    for field in STRING_FIELDS:
+        # 両方の版の文字列をまとめて番号を振る
+        values = np.concatenate([np.asarray(base[field], dtype=str),
+                                 np.asarray(columns[field], dtype=str)])
+        rows[field] = np.unique(values, return_inverse=True)[1].reshape(-1)
+    # 行全体を 1 つのバイト列として比べ、最初に現れた行（元の版を先に並べている）を探す
+    keys = rows.view(f"V{rows.dtype.itemsize}")
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    source = first[inverse.reshape(-1)[n_base:]]
+    return np.where(source < n_base, source, -1)
+
+
+def _take(columns, rows):
+    return {field: np.asarray(values)[rows] for field, values in columns.items()}
+
+
+def _apply(base, rows, source):
+    """元の版の列に差分（共有する行番号と追加された行）を当てる"""
+    kept = source >= 0
+    columns = {}
+    for field, values in base.items():
+        values = np.asarray(values)
+        added = np.asarray(rows[field])
+        dtype = object if field in STRING_FIELDS else values.dtype
+        merged = np.empty(len(source), dtype=dtype)
+        merged[kept] = values[source[kept]]
+        merged[~kept] = added
+        columns[field] = merged
+    return columns
+
+
+def _pack(columns, source=None):
+    """列（と差分の行番号）を圧縮した npz のバイト列にする（列は NPZ 形式と同じ持ち方）"""
+    arrays = encode_columns(columns)
+    if source is not None:
+        # 共有する行番号はほぼ連番なので、隣との差にするとよく圧縮できる
+        arrays["source_diff"] = np.diff(source, prepend=0).astype(np.int64)
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def _unpack(payload):
+    with np.load(io.BytesIO(payload), allow_pickle=False) as data:
+        columns = decode_columns(data)
+        source = np.cumsum(data["source_diff"]) if "source_diff" in data.files else None
+    return columns, source
@@ -0,0 +1,236 @@
+"""設備の自動配置（重ならない配置を探す）
+
+配置はスカイライン法の bottom-left-fill で決める。設備を順に、許可した回転角のうち
+上端が最も低く（同じなら最も左に）なる位置へ置いていく。置く順番を焼きなまし法で入れ替えて、
+コスト（既定は無駄な面積）が小さい順番を探す。初期の順番を変えた複数の探索を
+multiprocessing のプールで並列に走らせ、最もよい結果を使う。
+
+回転した設備は回転後の外接矩形で場所を取るので、90 度の倍数以外の角度も指定できる。
+"""
+import math
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from equipment_store import EquipmentStore
+from geometry import rotated_bounds
+
+# 置けなかった設備の面積に掛ける重み（置けた台数を何より優先する）
+UNPLACED_PENALTY = 1e6
+# 焼きなましの最終温度（初期温度に対する比）
+FINAL_TEMPERATURE = 1e-3
+# 途中の状態を残す間隔（台数）。焼きなましでは変わった位置より前の状態から置き直す
+CHECKPOINT = 16
+_EPSILON = 1e-9
+
+
+def wasted_area(x, y, width, length, rotation, placed):
+    """置けた設備を囲む外接矩形のうち、設備が占めていない面積（既定のコスト）
+
+    独自のコスト関数も同じ引数で渡せる。プールの別プロセスで呼ぶので、
+    モジュールの最上位で定義した関数にする（lambda は渡せない）。
+    """
+    if not placed.any():
+        return 0.0
+    xmin, ymin, xmax, ymax = rotated_bounds(x[placed], y[placed], width[placed],
+                                            length[placed], rotation[placed])
+    box = (xmax.max() - xmin.min()) * (ymax.max() - ymin.min())
+    return float(box - (width[placed] * length[placed]).sum())
+
+
+def optimize_layout(equipment_list, factory_width, factory_length, rotations=(0, 90), gap=0.0,
+                    cost=wasted_area, restarts=4, iterations=300, processes=None, seed=0,
+                    time_limit=None):
+    """設備が重ならない配置を探し、配置した新しいストアと結果を返す
+
+    rotations は許可する回転角、gap は設備どうし（と壁）の間に空ける距離 (m)。
+    restarts 個の探索をそれぞれ iterations 回（time_limit 秒で打ち切り）行う。
+    戻り値は equipment_list（配置後の EquipmentStore。置けなかった設備は元の位置）・
+    placed（置けたかどうかの配列）・cost の辞書。
+    """
+    store = equipment_list
+    if not isinstance(store, EquipmentStore):
+        store = EquipmentStore.from_records(equipment_list)
+    result = store.copy()
+    n = len(store)
+    if n == 0:
+        return {"equipment_list": result, "placed": np.zeros(0, dtype=bool), "cost": 0.0}
+
+    problem = {
+        "footprints": _footprints(store.width, store.length, rotations, gap),
+        "width": store.width.copy(),
+        "length": store.length.copy(),
+        # 外接矩形は右下に gap を足してあるので、原点を gap だけずらし、
+        # 右下も gap だけ狭めれば壁との間にも gap が空く
+        "bounds": (factory_width - gap, factory_length - gap),
+        "gap": gap,
+        "cost": cost,
+        "iterations": iterations,
+        "time_limit": time_limit,
+    }
+    tasks = [dict(problem, seed=seed + restart, restart=restart) for restart in range(restarts)]
+    processes = min(restarts, processes or os.cpu_count() or 1)
+    if processes <= 1:
+        outcomes = [_anneal(task) for task in tasks]
+    else:
+        # Streamlit はスレッドを使うので fork ではなく spawn で子プロセスを作る
+        with multiprocessing.get_context("spawn").Pool(processes) as pool:
+            outcomes = pool.map(_anneal, tasks)
+
+    energy, x, y, rotation, placed, layout_cost = min(outcomes, key=lambda outcome: outcome[0])
+    result.x[placed] = x[placed]
+    result.y[placed] = y[placed]
+    result.rotation[placed] = rotation[placed]
+    return {"equipment_list": result, "placed": placed, "cost": layout_cost}
+
+
+def _footprints(width, length, rotations, gap):
+    """設備ごとに、許可した回転角での (外接矩形の幅, 長さ, 回転角) のリスト"""
+    footprints = [[] for _ in range(len(width))]
+    for rotation in dict.fromkeys(rotations):
+        angle = np.full(len(width), float(rotation))
+        xmin, ymin, xmax, ymax = rotated_bounds(0.0, 0.0, width, length, angle)
+        for item, (fw, fl) in enumerate(zip((xmax - xmin + gap).tolist(),
+                                            (ymax - ymin + gap).tolist())):
+            # 向きが変わらない回転角（180 度など）は 1 つにまとめる
+            if all(abs(fw - w) > _EPSILON or abs(fl - l) > _EPSILON
+                   for w, l, _ in footprints[item]):
+                footprints[item].append((fw, fl, float(rotation)))
+    return footprints
+
+
+def _skyline_pack(order, footprints, bound_width, bound_length, resume=None):
+    """order の順に bottom-left-fill で置く
+
+    戻り値は設備ごとの外接矩形の左上 x, y（置けなければ nan）と回転角のリストと、
+    CHECKPOINT 台ごとの途中の状態のリスト。resume に途中の状態を渡すとそこから続きを置く。
+    """
+    if resume is None:
+        n = len(footprints)
+        resume = (0, [[0.0, 0.0, bound_width]], [math.nan] * n, [math.nan] * n, [0.0] * n)
+    position, skyline, left, top, rotation = resume
+    # 途中の状態は呼び出し元が使い回すのでコピーしてから書き換える
+    skyline = [list(segment) for segment in skyline]  # (左端, 高さ, 幅) の区間。左から順に並ぶ
+    left, top, rotation = list(left), list(top), list(rotation)
+    checkpoints = []
+    for position in range(position, len(order)):
+        if position % CHECKPOINT == 0:
+            checkpoints.append((position, [list(segment) for segment in skyline],
+                                list(left), list(top), list(rotation)))
+        item = order[position]
+        best = None
+        best_top = math.inf
+        for fw, fl, angle in footprints[item]:
+            for start in range(len(skyline)):
+                x = skyline[start][0]
+                if x + fw > bound_width + _EPSILON:
+                    break
+                # 設備の幅にかかる区間のうち最も高いところに載せる
+                y = 0.0
+                end = start
+                while end < len(skyline) and skyline[end][0] < x + fw - _EPSILON:
+                    y = max(y, skyline[end][1])
+                    if y + fl > best_top:
+                        break
+                    end += 1
+                if y + fl > min(best_top, bound_length + _EPSILON):
+                    continue
+                if best is None or (y + fl, x) < best[0]:
+                    best = ((y + fl, x), start, y, fw, fl, angle)
+                    best_top = y + fl
+        if best is None:
+            continue
+        _, start, y, fw, fl, angle = best
+        x = skyline[start][0]
+        left[item], top[item], rotation[item] = x, y, angle
+        _raise_skyline(skyline, start, x + fw, y + fl)
+    return left, top, rotation, checkpoints
+
+
+def _raise_skyline(skyline, start, right, height):
+    """start の区間の左端から right までの高さを height にする"""
+    x = skyline[start][0]
+    end = start
+    while end < len(skyline) and skyline[end][0] + skyline[end][2] <= right + _EPSILON:
+        end += 1
+    if end < len(skyline) and skyline[end][0] < right - _EPSILON:
+        # 一部だけ覆う区間は右側を残す
+        segment_right = skyline[end][0] + skyline[end][2]
+        skyline[end] = [right, skyline[end][1], segment_right - right]
+    skyline[start:end] = [[x, height, right - x]]
+    # 高さが同じ隣の区間はつなげる
+    for index in (start, start - 1):
+        if 0 <= index < len(skyline) - 1 and abs(skyline[index][1] - skyline[index + 1][1]) < _EPSILON:
+            skyline[index][2] += skyline[index + 1][2]
+            del skyline[index + 1]
+
+
+def _evaluate(order, task, checkpoints=None, changed=0):
+    """order の配置のエネルギーなどを返す（changed より前の順番が同じなら checkpoints から続ける）"""
+    resume = None
+    if checkpoints:
+        kept = checkpoints[:changed // CHECKPOINT + 1]
+        resume = kept[-1]
+    left, top, angle, new_checkpoints = _skyline_pack(order, task["footprints"], *task["bounds"],
+                                                     resume=resume)
+    if resume is not None:
+        new_checkpoints = kept[:-1] + new_checkpoints
+    left = np.array(left)
+    top = np.array(top)
+    rotation = np.array(angle)
+    placed = ~np.isnan(left)
+    # 外接矩形の左上から設備の中心へ（gap の分は右下に空けていて、左上の壁との間は原点をずらして空ける）
+    footprint_width, footprint_length = _placed_size(task, rotation)
+    x = task["gap"] + left + footprint_width / 2
+    y = task["gap"] + top + footprint_length / 2
+    layout_cost = task["cost"](x, y, task["width"], task["length"], rotation, placed)
+    unplaced_area = float((task["width"] * task["length"])[~placed].sum())
+    energy = layout_cost + UNPLACED_PENALTY * unplaced_area
+    return (energy, x, y, rotation, placed, layout_cost), new_checkpoints
+
+
+def _placed_size(task, rotation):
+    xmin, ymin, xmax, ymax = rotated_bounds(0.0, 0.0, task["width"], task["length"], rotation)
+    return xmax - xmin, ymax - ymin
+
+
+def _anneal(task):
+    """置く順番を焼きなまし法で探し、最もよかった (エネルギー, x, y, 回転角, 置けたか, コスト) を返す"""
+    rng = np.random.default_rng(task["seed"])
+    footprints = task["footprints"]
+    n = len(footprints)
+    # 背の高い（次に幅の広い）設備から置くのが基本の順番
+    heights = [max(fl for _, fl, _ in footprint) for footprint in footprints]
+    widths = [max(fw for fw, _, _ in footprint) for footprint in footprints]
+    order = sorted(range(n), key=lambda item: (-heights[item], -widths[item]))
+    if task["restart"] > 0:
+        # 2 つ目以降の探索は初期の順番を少し崩して始める
+        for _ in range(max(n // 10, 1)):
+            i, j = rng.integers(n, size=2)
+            order[i], order[j] = order[j], order[i]
+
+    current, checkpoints = _evaluate(order, task)
+    best = current
+    initial_temperature = float(np.mean(task["width"] * task["length"]))
+    deadline = None if task["time_limit"] is None else time.perf_counter() + task["time_limit"]
+    iterations = task["iterations"] if n > 1 else 0
+    for step in range(iterations):
+        if deadline is not None and time.perf_counter() > deadline:
+            break
+        temperature = initial_temperature * FINAL_TEMPERATURE ** (step / iterations)
+        candidate = list(order)
+        # 最後の段の高さで無駄な面積が決まるので、後ろの方の順番をよく動かす
+        i, j = np.sort(n - 1 - np.floor(n * rng.random(2) ** 2).astype(int))
+        if rng.random() < 0.5:
+            candidate[i], candidate[j] = candidate[j], candidate[i]
+        else:
+            candidate.insert(i, candidate.pop(j))
+        outcome, candidate_checkpoints = _evaluate(candidate, task, checkpoints, changed=i)
+        delta = outcome[0] - current[0]
+        if delta <= 0 or rng.random() < math.exp(-delta / temperature):
+            order, current, checkpoints = candidate, outcome, candidate_checkpoints
+            if current[0] < best[0]:
+                best = current
+    return best
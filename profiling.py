@@ -0,0 +1,52 @@
+"""処理の段階ごとの時間（と必要ならピークメモリ）の計測
+
+アプリでは再実行 1 回分の段階ごとの時間を表示するのに使い、
+ベンチマーク（benchmarks.bench_suite）では設備数ごとの時間とピークメモリを測るのに使う。
+ピークメモリは tracemalloc で測るので、PIL の画像の画素のように Python の外で確保したメモリは含まない。
+"""
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+class StageTimer:
+    """with timer.stage("描画"): ... で段階ごとの経過時間を記録する"""
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.started = time.perf_counter()
+        self.records = []  # (段階名, 秒, ピークメモリのバイト数 または None)
+
+    @contextmanager
+    def stage(self, name):
+        tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        elif self.trace_memory:
+            tracemalloc.reset_peak()
+        start_memory = tracemalloc.get_traced_memory()[0] if self.trace_memory else 0
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            peak = None
+            if self.trace_memory:
+                peak = max(tracemalloc.get_traced_memory()[1] - start_memory, 0)
+                if tracing:
+                    tracemalloc.stop()
+            self.records.append((name, elapsed, peak))
+
+    def elapsed(self):
+        """作ってからの経過時間（秒）"""
+        return time.perf_counter() - self.started
+
+    def summary(self):
+        """段階名ごとに時間とピークメモリをまとめた辞書（同じ名前は時間を足し、メモリは最大を取る）"""
+        totals = {}
+        for name, seconds, peak in self.records:
+            total = totals.setdefault(name, {"seconds": 0.0, "peak_bytes": None})
+            total["seconds"] += seconds
+            if peak is not None:
+                total["peak_bytes"] = max(total["peak_bytes"] or 0, peak)
+        return totals
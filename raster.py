@@ -0,0 +1,165 @@
+"""NumPy による描画バックエンド
+
+グリッドは画像バッファへの行・列の代入で、設備の回転矩形は
+全設備の各行の塗り区間をまとめて求めて塗る。描画時間は Python の呼び出し
+回数ではなく画素数に比例する。
+
+バッファは shape (高さ, 幅, 3) の uint8 配列。PIL の画像へは to_image() で変換する。
+"""
+import numpy as np
+from PIL import Image, ImageColor
+
+from geometry import rectangle_corners
+
+# 一度に展開する画素数の上限（メモリ使用量の目安）
+CHUNK_PIXELS = 1 << 22
+# 標本点のずらし量 (px)
+SAMPLE_OFFSET = 1e-7
+
+
+def hex_to_rgb(colors):
+    """色文字列のリストを shape (n, 3) の uint8 配列に変換する"""
+    return np.array([ImageColor.getrgb(color)[:3] for color in colors],
+                    dtype=np.uint8).reshape(-1, 3)
+
+
+def new_buffer(width, height, color):
+    """color で塗りつぶしたバッファを作る"""
+    buffer = np.empty((height, width, 3), dtype=np.uint8)
+    buffer[:] = hex_to_rgb([color])[0]
+    return buffer
+
+
+def to_image(buffer):
+    """バッファを PIL 画像に変換する（画素はコピーされる）"""
+    return Image.fromarray(buffer)
+
+
+def paint_grid(buffer, spacing, color, origin=(0, 0)):
+    """spacing 画素ごとのグリッド線を buffer に描く（origin は buffer 左上の画素座標）
+
+    spacing は小数でもよく、k 本目の線は floor(k * spacing) 画素目に引く。
+    """
+    ox, oy = origin
+    height, width = buffer.shape[:2]
+    rgb = hex_to_rgb([color])[0]
+    buffer[:, _grid_lines(ox, width, spacing)] = rgb
+    buffer[_grid_lines(oy, height, spacing), :] = rgb
+
+
+def paint_rectangles(buffer, x, y, width, length, rotation, fill_rgb, outline_rgb,
+                     origin=(0, 0)):
+    """回転矩形を index 順に buffer へ塗る（後の設備が上に重なる）
+
+    座標はすべて画素単位。PIL の polygon に合わせて頂点を整数に切り捨て、
+    辺に沿った太さ 1 画素の帯（辺の主軸方向に ±0.5 画素）を縁取りとして、
+    その内側を塗る。各設備の各行について塗る区間を一括で求め、
+    区間を画素に展開して書き込む。
+    """
+    n = len(x)
+    if n == 0:
+        return
+    ox, oy = origin
+    height, buffer_width = buffer.shape[:2]
+
+    # 全設備の頂点を一括で求め、buffer 内の行範囲を決める
+    corners = np.floor(rectangle_corners(x, y, width, length, rotation))
+    y0 = np.clip(corners[:, :, 1].min(axis=1), oy, oy + height).astype(np.int64)
+    y1 = np.clip(corners[:, :, 1].max(axis=1) + 1, oy, oy + height).astype(np.int64)
+    row_counts = np.maximum(y1 - y0, 0)
+    box_width = corners[:, :, 0].max(axis=1) - corners[:, :, 0].min(axis=1) + 1
+    pixel_counts = row_counts * box_width
+
+    # 辺ごとの方向と主軸方向の長さ
+    directions = np.roll(corners, -1, axis=1) - corners
+    major = np.maximum(np.abs(directions).max(axis=2), 1.0)
+
+    # 縁取りと塗りの色。色番号 = 設備番号 * 2 + 縁取りかどうか
+    palette = np.empty((2 * n, 3), dtype=np.uint8)
+    palette[0::2] = fill_rgb
+    palette[1::2] = outline_rgb
+    # 1 画素 (3 バイト) を 1 要素として書き込めるように見方を変える
+    pixels = buffer.reshape(-1, 3).view("V3").reshape(-1)
+    palette = palette.view("V3").reshape(-1)
+
+    # 画素数が上限を超えないように設備を順番のまま区切って処理
+    cumulative = np.cumsum(pixel_counts)
+    start = 0
+    while start < n:
+        limit = (cumulative[start - 1] if start else 0) + CHUNK_PIXELS
+        stop = max(int(np.searchsorted(cumulative, limit, side="right")), start + 1)
+        items = np.arange(start, stop)
+        _paint_rows(pixels, palette, origin, buffer_width, items, row_counts[items],
+                    y0[items], corners[items], directions[items], major[items])
+        start = stop
+
+
+def _paint_rows(pixels, palette, origin, buffer_width, items, row_counts, y0,
+                corners, directions, major):
+    total_rows = int(row_counts.sum())
+    if total_rows == 0:
+        return
+    ox, oy = origin
+    local_item = np.repeat(np.arange(len(items)), row_counts)
+    starts = np.cumsum(row_counts) - row_counts
+    gy = y0[local_item] + np.arange(total_rows) - starts[local_item]
+    # 辺からちょうど 0.5 画素の画素は片側だけを選ぶよう、標本点をわずかにずらす
+    sy = gy + SAMPLE_OFFSET
+
+    # 各辺からの距離 (dx * (sy - ay) - dy * (sx - ax)) / major >= -0.5 を
+    # 満たす sx の区間が塗る範囲、> 0.5 を満たす区間が縁取りを除いた内側
+    lower = np.full(total_rows, -np.inf)
+    upper = np.full(total_rows, np.inf)
+    inner_lower = np.full(total_rows, -np.inf)
+    inner_upper = np.full(total_rows, np.inf)
+    row_ok = np.ones(total_rows, dtype=bool)
+    inner_ok = np.ones(total_rows, dtype=bool)
+    for k in range(4):
+        ax, ay = corners[local_item, k, 0], corners[local_item, k, 1]
+        dx, dy = directions[local_item, k, 0], directions[local_item, k, 1]
+        m = major[local_item, k]
+        offset = dx * (sy - ay) + dy * ax
+        with np.errstate(divide="ignore", invalid="ignore"):
+            bound = (offset + 0.5 * m) / dy
+            inner_bound = (offset - 0.5 * m) / dy
+        upper = np.where(dy > 0, np.minimum(upper, bound), upper)
+        lower = np.where(dy < 0, np.maximum(lower, bound), lower)
+        inner_upper = np.where(dy > 0, np.minimum(inner_upper, inner_bound), inner_upper)
+        inner_lower = np.where(dy < 0, np.maximum(inner_lower, inner_bound), inner_lower)
+        row_ok &= (dy != 0) | (offset + 0.5 * m >= 0)
+        inner_ok &= (dy != 0) | (offset - 0.5 * m > 0)
+
+    # 画素 x の標本点は x + SAMPLE_OFFSET。buffer の列範囲に切り詰める
+    left = np.maximum(np.ceil(lower - SAMPLE_OFFSET), ox)
+    right = np.minimum(np.floor(upper - SAMPLE_OFFSET), ox + buffer_width - 1)
+    right = np.where(row_ok, right, left - 1)
+    inner_left = np.floor(inner_lower - SAMPLE_OFFSET) + 1
+    inner_right = np.ceil(inner_upper - SAMPLE_OFFSET) - 1
+    inner_right = np.where(inner_ok, inner_right, inner_left - 1)
+    # 縁取りを除いた区間は塗る区間の中に収める
+    inner_left = np.clip(inner_left, left, right + 1)
+    inner_right = np.clip(inner_right, inner_left - 1, right)
+
+    # 各行を 左の縁取り・内側・右の縁取り の 3 区間に分ける
+    run_start = np.stack([left, inner_left, inner_right + 1], axis=1)
+    run_stop = np.stack([inner_left, inner_right + 1, right + 1], axis=1)
+    run_length = np.maximum(run_stop - run_start, 0).astype(np.int64).reshape(-1)
+    total = int(run_length.sum())
+    if total == 0:
+        return
+    color = 2 * items[local_item][:, None] + np.array([1, 0, 1])
+    row_offset = (gy - oy)[:, None] * buffer_width - ox + run_start.astype(np.int64)
+
+    # 区間を画素に展開して、index 順（後の設備が上）に書き込む
+    # np.put は添字の順に書き込むので、同じ画素では後の設備が残る
+    run_offset = row_offset.reshape(-1) - (np.cumsum(run_length) - run_length)
+    flat = np.repeat(run_offset, run_length) + np.arange(total)
+    np.put(pixels, flat, np.repeat(palette[color.reshape(-1)], run_length))
+
+
+def _grid_lines(start, size, spacing):
+    """[start, start + size) に入るグリッド線の buffer 内の位置"""
+    first = int(np.ceil(start / spacing))
+    last = int(np.ceil((start + size) / spacing))
+    lines = np.floor(np.arange(first, last) * spacing).astype(np.int64) - start
+    return lines[(lines >= 0) & (lines < size)]
@@ -0,0 +1,88 @@
+"""レイアウト図の描画に使う共通の部品
+
+設備の描画範囲の見積もり、NumPy での多角形の一括塗り、ラベルと枠線の描画をまとめる。
+工場全体の図はタイル単位（tiles.TileRenderer）で描き、書き出し（export.py）も同じ部品を使う。
+"""
+import numpy as np
+
+from geometry import rectangle_corners
+from raster import hex_to_rgb, paint_rectangles
+
+SCALE_FACTOR = 20  # 1mあたりのピクセル数
+GRID_COLOR = "#AAAAAA"
+
+# ラベル表示の推定サイズ（render_layout の従来の推定式）
+FONT_SIZE = 12
+# 描画範囲の見積もりに余白として広げるピクセル数
+DIRTY_PADDING = 3
+
+
+def item_pixel_bounds(store, px, show_equipment_info):
+    """各設備の描画範囲（多角形とラベル）のピクセル外接矩形 (4, n)"""
+    x_eq, y_eq, width_eq, length_eq = px
+    corners = rectangle_corners(x_eq, y_eq, width_eq, length_eq, store.rotation)
+    xmin = corners[:, :, 0].min(axis=1)
+    ymin = corners[:, :, 1].min(axis=1)
+    xmax = corners[:, :, 0].max(axis=1)
+    ymax = corners[:, :, 1].max(axis=1)
+
+    if show_equipment_info and len(store):
+        # ラベル文字数から背景矩形・文字の範囲を大きめに見積もる
+        label_lengths = np.array([len(label) for label in store.table("label")],
+                                 dtype=np.float64)[store.codes("label")]
+        digits = np.floor(np.log10(np.arange(1, len(store) + 1))) + 1
+        text_width = (digits + 2 + label_lengths) * FONT_SIZE * 0.6
+        fits = (text_width < width_eq - 10) & (FONT_SIZE < length_eq - 10)
+        glyph_width = np.where(fits, text_width, digits * FONT_SIZE)
+        text_x = np.where(fits, x_eq - text_width / 2, x_eq - 5)
+        text_y = np.where(fits, y_eq - FONT_SIZE / 2, y_eq - 5)
+        xmin = np.minimum(xmin, text_x - 2)
+        ymin = np.minimum(ymin, text_y - 2)
+        xmax = np.maximum(xmax, text_x + glyph_width + FONT_SIZE)
+        ymax = np.maximum(ymax, text_y + FONT_SIZE * 1.5)
+    return np.stack([xmin - DIRTY_PADDING, ymin - DIRTY_PADDING,
+                     xmax + DIRTY_PADDING, ymax + DIRTY_PADDING])
+
+
+def draw_labels(draw, store, indices, px, origin=(0, 0)):
+    """indices の設備のラベルだけを描く（NumPy バックエンド用）
+
+    origin は描画先の画像の左上の画素座標（タイル描画用）。
+    """
+    ox, oy = origin
+    labels = store.table("label")
+    label_codes = store.codes("label")
+    for i in np.asarray(indices).tolist():
+        x_eq, y_eq, width_eq, length_eq = px[:, i]
+        cx = int(x_eq) - ox
+        cy = int(y_eq) - oy
+        label = f"{i+1}: {labels[label_codes[i]]}"
+        text_width = len(label) * FONT_SIZE * 0.6
+        text_height = FONT_SIZE
+        if text_width < width_eq - 10 and text_height < length_eq - 10:
+            text_x = cx - text_width/2
+            text_y = cy - text_height/2
+            text_bg = [(text_x-2, text_y-2), (text_x+text_width+2, text_y+text_height+2)]
+            draw.rectangle(text_bg, fill="#FFFFFFAA")
+            draw.text((text_x, text_y), label, fill="#000000")
+        else:
+            draw.text((cx - 5, cy - 5), str(i+1), fill="#000000")
+
+
+def paint_equipment(buffer, store, indices, px, colliding_mask, origin=(0, 0)):
+    """indices の設備の多角形を NumPy で buffer に一括で塗る"""
+    indices = np.asarray(indices)
+    if len(indices) == 0:
+        return
+    fill_rgb = hex_to_rgb(store.table("color"))[store.codes("color")[indices]]
+    outline_rgb = np.where(colliding_mask[indices, None],
+                           hex_to_rgb(["#FF0000"]), hex_to_rgb(["#000000"]))
+    x_eq, y_eq, width_eq, length_eq = px[:, indices]
+    paint_rectangles(buffer, x_eq, y_eq, width_eq, length_eq, store.rotation[indices],
+                     fill_rgb, outline_rgb, origin=origin)
+
+
+def draw_frame(draw, width_px, length_px, origin=(0, 0)):
+    """工場エリアの枠線"""
+    ox, oy = origin
+    draw.rectangle([-ox, -oy, width_px-1-ox, length_px-1-oy], fill=None, outline="#000000", width=2)
@@ -0,0 +1,348 @@
+"""複数のセッションで同じレイアウトを編集する共有レイアウト（SQLite）
+
+共有レイアウトは設備ごとの行と、変更の記録（1 変更ごとに通し番号の版を振る）を持つ。
+各セッション（SharedLayoutSession）は最後に同期した版とそのときの設備リストを覚えておき、
+同期のたびに次の 2 つを 1 つのトランザクションでやり取りする。
+
+- 送る: 最後に同期したときから変わった設備だけ（変わった項目・追加した設備・削除した設備の id）
+- 受け取る: その後に他のセッションが書いた変更だけ
+
+設備は id で見分ける。id は共有レイアウトが振り、並び順（上に描く順）は id の小さい順とする。
+同じ設備の同じ項目を他のセッションが先に変えていたときは先に書いた方を残し（こちらの変更は
+衝突として返す）、違う項目なら両方の変更を合わせる。削除された設備への変更は捨てる。
+"""
+import json
+import os
+import sqlite3
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+
+from equipment_store import FIELDS, NUMERIC_FIELDS, STRING_FIELDS, EquipmentStore
+
+DEFAULT_PATH = os.environ.get("SHARED_LAYOUT_DB_PATH", "shared_layouts.sqlite3")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS shared_layouts (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    next_id INTEGER NOT NULL,
+    factory_width REAL NOT NULL,
+    factory_length REAL NOT NULL,
+    floor_color TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS shared_items (
+    layout TEXT NOT NULL,
+    item_id INTEGER NOT NULL,
+    record TEXT NOT NULL,
+    PRIMARY KEY (layout, item_id)
+);
+CREATE TABLE IF NOT EXISTS shared_changes (
+    layout TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    client TEXT NOT NULL,
+    item_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    data TEXT,
+    PRIMARY KEY (layout, version)
+);
+"""
+
+
+class SharedLayoutService:
+    """共有レイアウトの置き場所（同じファイルを開けば別のプロセスからも使える）"""
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        # Streamlit は再実行ごとにスレッドが変わるので、同じ接続を別スレッドからも使う
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=10.0)
+        self._connection.executescript(_SCHEMA)
+
+    def close(self):
+        self._connection.close()
+
+    def names(self):
+        """共有レイアウトの (名前, 版, 設備の数) の一覧"""
+        return self._connection.execute(
+            "SELECT name, version, (SELECT COUNT(*) FROM shared_items WHERE layout = name) "
+            "FROM shared_layouts ORDER BY name").fetchall()
+
+    def create(self, name, equipment_list, factory_width, factory_length, floor_color):
+        """レイアウトを共有する。設備に振った id の配列（リストの順）を返す"""
+        store = _as_store(equipment_list)
+        ids = store.ids
+        if len(ids) and not np.all(np.diff(ids) > 0):
+            ids = np.arange(len(store), dtype=np.int64)
+        records = [view.to_dict() for view in store]
+        with self._transaction():
+            if self._layout(name) is not None:
+                raise ValueError(f"共有レイアウト '{name}' はすでにあります")
+            self._connection.execute(
+                "INSERT INTO shared_layouts VALUES (?, 0, ?, ?, ?, ?)",
+                (name, int(ids[-1]) + 1 if len(ids) else 0, factory_width, factory_length, floor_color))
+            self._connection.executemany(
+                "INSERT INTO shared_items VALUES (?, ?, ?)",
+                [(name, item_id, json.dumps(dict(record, id=item_id)))
+                 for item_id, record in zip(ids.tolist(), records)])
+        return ids
+
+    def snapshot(self, name):
+        """今の共有レイアウト全体（参加するときに 1 回だけ読む）"""
+        layout = self._layout(name)
+        if layout is None:
+            raise KeyError(name)
+        version, _, factory_width, factory_length, floor_color = layout
+        rows = self._connection.execute(
+            "SELECT record FROM shared_items WHERE layout = ? ORDER BY item_id", (name,)).fetchall()
+        return {
+            "equipment_list": EquipmentStore.from_records([json.loads(record) for record, in rows]),
+            "factory_width": factory_width,
+            "factory_length": factory_length,
+            "floor_color": floor_color,
+            "version": version,
+        }
+
+    def exchange(self, name, client, base_version, changes):
+        """base_version 以降の変更 changes を書き、他のセッションの変更を受け取る
+
+        changes は ("set", id, {項目: 値}) / ("insert", 仮の番号, 設備) / ("delete", id, None) のリスト。
+        戻り値は {"version", "ids": {仮の番号: 振った id}, "incoming": 他のセッションの変更（版の順）,
+        "conflicts": [(id, 項目のリストまたは "deleted")]}
+        """
+        with self._transaction():
+            layout = self._layout(name)
+            if layout is None:
+                raise KeyError(name)
+            version, next_id = layout[:2]
+            incoming = [(kind, item_id, json.loads(data) if data else None)
+                        for kind, item_id, data in self._connection.execute(
+                            "SELECT kind, item_id, data FROM shared_changes "
+                            "WHERE layout = ? AND version > ? AND client != ? ORDER BY version",
+                            (name, base_version, client))]
+            # 他のセッションが変えた項目（削除は None）
+            taken = {}
+            for kind, item_id, data in incoming:
+                if kind == "set":
+                    fields = taken.setdefault(item_id, set())
+                    if fields is not None:
+                        fields.update(data)
+                elif kind == "delete":
+                    taken[item_id] = None
+
+            ids = {}
+            conflicts = []
+            written = []
+            for kind, key, data in changes:
+                if kind == "insert":
+                    item_id = next_id
+                    next_id += 1
+                    ids[key] = item_id
+                    record = dict(data, id=item_id)
+                    self._connection.execute("INSERT INTO shared_items VALUES (?, ?, ?)",
+                                             (name, item_id, json.dumps(record)))
+                    written.append((item_id, kind, record))
+                    continue
+                row = self._connection.execute(
+                    "SELECT record FROM shared_items WHERE layout = ? AND item_id = ?", (name, key)).fetchone()
+                if row is None:
+                    if kind == "set":
+                        conflicts.append((key, "deleted"))
+                    continue
+                if kind == "delete":
+                    self._connection.execute("DELETE FROM shared_items WHERE layout = ? AND item_id = ?",
+                                             (name, key))
+                    written.append((key, kind, None))
+                    continue
+                fields = taken.get(key) or set()
+                accepted = {field: value for field, value in data.items() if field not in fields}
+                if len(accepted) < len(data):
+                    conflicts.append((key, sorted(set(data) - set(accepted))))
+                if accepted:
+                    record = dict(json.loads(row[0]), **accepted)
+                    self._connection.execute(
+                        "UPDATE shared_items SET record = ? WHERE layout = ? AND item_id = ?",
+                        (json.dumps(record), name, key))
+                    written.append((key, kind, accepted))
+
+            self._connection.executemany(
+                "INSERT INTO shared_changes VALUES (?, ?, ?, ?, ?, ?)",
+                [(name, version + k + 1, client, item_id, kind, None if data is None else json.dumps(data))
+                 for k, (item_id, kind, data) in enumerate(written)])
+            version += len(written)
+            self._connection.execute("UPDATE shared_layouts SET version = ?, next_id = ? WHERE name = ?",
+                                     (version, next_id, name))
+        return {"version": version, "ids": ids, "incoming": incoming, "conflicts": conflicts}
+
+    # 内部処理
+    def _layout(self, name):
+        return self._connection.execute(
+            "SELECT version, next_id, factory_width, factory_length, floor_color FROM shared_layouts "
+            "WHERE name = ?", (name,)).fetchone()
+
+    @contextmanager
+    def _transaction(self):
+        # 読んでから書くまでの間に他のセッションが書かないよう、最初に書き込みのロックを取る
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._connection.rollback()
+            raise
+        self._connection.commit()
+
+
+class SharedLayoutSession:
+    """共有レイアウトに参加している 1 つのセッション"""
+
+    def __init__(self, service, name, client=None):
+        self.service = service
+        self.name = name
+        self.client = client or uuid.uuid4().hex
+        self.version = 0
+        self._base = EquipmentStore()
+
+    def share(self, store, factory_width, factory_length, floor_color):
+        """今のレイアウトを新しい共有レイアウトにして参加する（store の id は振り直されることがある）"""
+        ids = self.service.create(self.name, store, factory_width, factory_length, floor_color)
+        for index, item_id in enumerate(ids.tolist()):
+            store.set_field(index, "id", item_id)
+        self.version = 0
+        self._base = store.copy()
+
+    def attach(self):
+        """共有レイアウトに参加する。戻り値は SharedLayoutService.snapshot() と同じ"""
+        layout = self.service.snapshot(self.name)
+        self.version = layout["version"]
+        self._base = layout["equipment_list"].copy()
+        return layout
+
+    def sync(self, store, collision_state=None):
+        """変わった設備だけを送り、他のセッションの変更を store に反映する
+
+        collision_state を渡すと、変わった設備だけ衝突状態を更新する。戻り値は
+        {"sent", "received", "conflicts", "version", "renumbered"（設備の番号がずれたか）}
+        """
+        changes, inserted = _local_changes(self._base, store)
+        result = self.service.exchange(self.name, self.client, self.version, changes)
+        for key, index in inserted.items():
+            store.set_field(index, "id", result["ids"][key])
+
+        inserts, updates, deletes = _collapse(result["incoming"])
+        index_of = {item_id: index for index, item_id in enumerate(store.ids.tolist())}
+        for item_id, fields in updates.items():
+            index = index_of.get(item_id)
+            if index is not None:
+                store[index] = fields
+                if collision_state is not None:
+                    collision_state.update(index, store[index])
+        # 後ろから消すと、まだ消していない設備の番号はずれない
+        removed = sorted((index_of[item_id] for item_id in deletes if item_id in index_of), reverse=True)
+        for index in removed:
+            store.pop(index)
+            if collision_state is not None:
+                collision_state.remove(index)
+        for item_id in sorted(set(inserts) - set(index_of)):
+            store.append(inserts[item_id])
+            if collision_state is not None:
+                collision_state.add(store[-1])
+        moved = _sort_tail(store, collision_state)
+
+        self.version = result["version"]
+        self._base = store.copy()
+        return {"sent": len(changes), "received": len(result["incoming"]), "conflicts": result["conflicts"],
+                "version": self.version, "renumbered": bool(removed) or moved}
+
+
+def _sort_tail(store, collision_state):
+    """並び順（上に描く順）を共有レイアウトと同じ id の順に揃える
+
+    ずれるのはたいてい末尾（こちらの追加より前に他のセッションの追加が入ったとき）なので、
+    順番が崩れている最初の位置から後ろだけを取り出して並べ直す。並べ直したら True
+    """
+    ids = store.ids
+    if len(ids) < 2 or np.all(np.diff(ids) > 0):
+        return False
+    suffix_min = np.minimum.accumulate(ids[::-1])[::-1]
+    start = int(np.flatnonzero(ids > suffix_min)[0])
+    records = sorted((store[index].to_dict() for index in range(start, len(store))),
+                     key=lambda record: record["id"])
+    for index in range(len(store) - 1, start - 1, -1):
+        store.pop(index)
+        if collision_state is not None:
+            collision_state.remove(index)
+    for record in records:
+        store.append(record)
+        if collision_state is not None:
+            collision_state.add(record)
+    return True
+
+
+def _local_changes(base, store):
+    """base から store への変更のリストと、追加した設備の {仮の番号: store の index}"""
+    base_ids = base.ids
+    ids = store.ids
+    order = np.argsort(base_ids, kind="stable")
+    position = np.minimum(np.searchsorted(base_ids[order], ids), max(len(base) - 1, 0))
+    matched = np.zeros(len(store), dtype=bool)
+    if len(base):
+        matched = base_ids[order][position] == ids
+        # 同じ id が 2 台以上あるときは最初の 1 台だけを元の設備とみなす（コピーされた設備は追加）
+        first = np.zeros(len(store), dtype=bool)
+        first[np.unique(ids, return_index=True)[1]] = True
+        matched &= first
+    current = np.flatnonzero(matched)
+    previous = order[position[current]]
+
+    changed = np.zeros((len(FIELDS), len(current)), dtype=bool)
+    for row, field in enumerate(FIELDS):
+        if field in NUMERIC_FIELDS:
+            changed[row] = getattr(base, field)[previous] != getattr(store, field)[current]
+        elif field in STRING_FIELDS:
+            # 同期した後は文字列のテーブルに追加されるだけなので、先頭が同じならコードで比べられる
+            table = base.table(field)
+            if store.table(field)[:len(table)] == table:
+                changed[row] = base.codes(field)[previous] != store.codes(field)[current]
+            else:
+                changed[row] = base.strings(field)[previous] != store.strings(field)[current]
+
+    changes = []
+    for k in np.flatnonzero(changed.any(axis=0)).tolist():
+        index = int(current[k])
+        fields = {FIELDS[row]: store.get_field(index, FIELDS[row]) for row in np.flatnonzero(changed[:, k]).tolist()}
+        changes.append(("set", int(ids[index]), fields))
+    deleted = np.ones(len(base), dtype=bool)
+    deleted[previous] = False
+    for item_id in base_ids[deleted].tolist():
+        changes.append(("delete", item_id, None))
+    inserted = {}
+    for key, index in enumerate(np.flatnonzero(~matched).tolist()):
+        record = store[index].to_dict()
+        del record["id"]
+        changes.append(("insert", key, record))
+        inserted[key] = index
+    return changes, inserted
+
+
+def _collapse(incoming):
+    """受け取った変更を設備ごとにまとめる: ({id: 追加する設備}, {id: 変わった項目}, {削除する id})"""
+    inserts, updates, deletes = {}, {}, set()
+    for kind, item_id, data in incoming:
+        if kind == "insert":
+            inserts[item_id] = data
+        elif kind == "delete":
+            # 同じ同期の中で追加されて削除された設備は何もしない
+            if inserts.pop(item_id, None) is None:
+                deletes.add(item_id)
+            updates.pop(item_id, None)
+        elif item_id in inserts:
+            inserts[item_id] = dict(inserts[item_id], **data)
+        else:
+            updates.setdefault(item_id, {}).update(data)
+    return inserts, updates, deletes
+
+
+def _as_store(equipment_list):
+    if isinstance(equipment_list, EquipmentStore):
+        return equipment_list
+    return EquipmentStore.from_records(equipment_list)
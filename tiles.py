@@ -0,0 +1,171 @@
+"""広い工場向けのタイル描画
+
+工場全体を 1 枚の画像にせず、TILE_SIZE 四方の固定サイズのタイルに分けて描く。
+ズームレベル 0 が SCALE_FACTOR (20 px/m) で、レベルが 1 上がるごとに縮尺は半分になる。
+表示範囲に掛かるタイルだけを描き、描いたタイルは LRU でキャッシュするので、
+メモリ使用量は工場の広さではなく max_tiles と表示範囲の大きさで決まる。
+
+タイルのキーにはそのタイルに掛かる設備の内容のハッシュを含めるので、
+設備を動かしても影響のないタイルはそのまま再利用される。
+設備の塗りは平行移動で結果が変わらない NumPy バックエンドを使い、タイルの境目をずらさない。
+"""
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from equipment_store import EquipmentStore
+from raster import hex_to_rgb, new_buffer, paint_grid, to_image
+from rendering import (GRID_COLOR, SCALE_FACTOR, draw_frame, draw_labels, item_pixel_bounds,
+                       paint_equipment)
+
+TILE_SIZE = 256
+MAX_TILES = 256  # 256 x 256 x 3 バイト x 256 枚 = 約 48 MB
+MAX_LEVEL = 8
+# 表示範囲の既定サイズ (px)
+VIEW_SIZE = (1024, 768)
+# ラベルを描く最小の縮尺 (px/m)。これより縮小するとラベルは潰れて読めない
+MIN_LABEL_SCALE = 10
+# グリッド線の間隔の候補 (m)。縮小表示では線が潰れないよう間隔を広げる
+GRID_STEPS = (1, 5, 10, 50, 100, 500)
+MIN_GRID_PIXELS = 8
+# 工場の外側の色
+OUTSIDE_COLOR = "#FFFFFF"
+
+
+def level_scale(level, scale_factor=SCALE_FACTOR):
+    """ズームレベルの縮尺 (px/m)"""
+    return scale_factor / 2 ** level
+
+
+def fit_level(factory_width, factory_length, view_size=VIEW_SIZE, scale_factor=SCALE_FACTOR):
+    """工場全体が表示範囲に収まる最も拡大したズームレベル"""
+    for level in range(MAX_LEVEL + 1):
+        scale = level_scale(level, scale_factor)
+        if factory_width * scale <= view_size[0] and factory_length * scale <= view_size[1]:
+            return level
+    return MAX_LEVEL
+
+
+def grid_step(scale):
+    """縮尺 scale (px/m) で描くグリッド線の間隔 (m)"""
+    for step in GRID_STEPS:
+        if step * scale >= MIN_GRID_PIXELS:
+            return step
+    return GRID_STEPS[-1]
+
+
+def view_around(center_x, center_y, level, view_size=VIEW_SIZE, scale_factor=SCALE_FACTOR):
+    """中心 (m) とズームレベルから表示範囲 (left, top, width, height) [px] を求める"""
+    scale = level_scale(level, scale_factor)
+    width, height = view_size
+    left = int(round(center_x * scale - width / 2))
+    top = int(round(center_y * scale - height / 2))
+    return left, top, width, height
+
+
+def tiles_in_view(view, tile_size=TILE_SIZE):
+    """表示範囲に掛かるタイルの番号 (tx, ty) のリスト"""
+    left, top, width, height = view
+    xs = range(left // tile_size, -(-(left + width) // tile_size))
+    ys = range(top // tile_size, -(-(top + height) // tile_size))
+    return [(tx, ty) for ty in ys for tx in xs]
+
+
+class TileRenderer:
+    """タイル単位の描画キャッシュ（セッションごとに 1 つ持つ）"""
+
+    def __init__(self, tile_size=TILE_SIZE, max_tiles=MAX_TILES, scale_factor=SCALE_FACTOR):
+        self.tile_size = tile_size
+        self.max_tiles = max_tiles
+        self.scale_factor = scale_factor
+        self._tiles = OrderedDict()  # キー -> タイル画像
+        self.hits = 0
+        self.misses = 0
+
+    def nbytes(self):
+        """キャッシュしているタイルのおおよそのバイト数"""
+        return len(self._tiles) * self.tile_size * self.tile_size * 3
+
+    def render_view(self, equipment_list, factory_width, factory_length, floor_color,
+                    view, level, colliding=(), show_grid=True, show_equipment_info=True):
+        """表示範囲 view (left, top, width, height) [px] の画像を描く"""
+        store = equipment_list
+        if not isinstance(store, EquipmentStore):
+            store = EquipmentStore.from_records(equipment_list)
+        scale = level_scale(level, self.scale_factor)
+        show_labels = bool(show_equipment_info) and scale >= MIN_LABEL_SCALE
+        floor = (int(factory_width * scale), int(factory_length * scale))
+        options = (level, floor, floor_color, bool(show_grid), show_labels)
+
+        colliding_mask = np.zeros(len(store), dtype=bool)
+        if len(colliding):
+            colliding_mask[np.fromiter(colliding, dtype=np.int64)] = True
+
+        x, y, w, l, _ = store.arrays()
+        px = np.trunc(np.stack([x, y, w, l]) * scale)
+        bounds = item_pixel_bounds(store, px, show_labels)
+
+        left, top, width, height = view
+        image = Image.new("RGB", (width, height), OUTSIDE_COLOR)
+        size = self.tile_size
+        for tx, ty in tiles_in_view(view, size):
+            x0, y0 = tx * size, ty * size
+            indices = np.flatnonzero((bounds[0] < x0 + size) & (bounds[2] > x0) &
+                                     (bounds[1] < y0 + size) & (bounds[3] > y0))
+            key = _tile_key(store, indices, px, colliding_mask, options, tx, ty)
+            tile = self._tiles.get(key)
+            if tile is None:
+                self.misses += 1
+                tile = self._draw_tile(store, indices, px, colliding_mask, (x0, y0),
+                                       floor, floor_color, scale, show_grid, show_labels)
+                self._tiles[key] = tile
+                while len(self._tiles) > self.max_tiles:
+                    self._tiles.popitem(last=False)
+            else:
+                self.hits += 1
+                self._tiles.move_to_end(key)
+            image.paste(tile, (x0 - left, y0 - top))
+        return image
+
+    def _draw_tile(self, store, indices, px, colliding_mask, origin, floor, floor_color,
+                   scale, show_grid, show_labels):
+        """1 枚のタイルを描く（origin はタイル左上のレベル内の画素座標）"""
+        size = self.tile_size
+        ox, oy = origin
+        buffer = new_buffer(size, size, OUTSIDE_COLOR)
+
+        # 工場の床の部分だけを塗ってグリッドを描く
+        fx0, fy0 = max(-ox, 0), max(-oy, 0)
+        fx1, fy1 = min(floor[0] - ox, size), min(floor[1] - oy, size)
+        if fx0 < fx1 and fy0 < fy1:
+            region = buffer[fy0:fy1, fx0:fx1]
+            region[:] = hex_to_rgb([floor_color])[0]
+            if show_grid:
+                paint_grid(region, grid_step(scale) * scale, GRID_COLOR,
+                           origin=(ox + fx0, oy + fy0))
+
+        paint_equipment(buffer, store, indices, px, colliding_mask, origin=origin)
+        image = to_image(buffer)
+        draw = ImageDraw.Draw(image)
+        if show_labels and len(indices):
+            draw_labels(draw, store, indices, px, origin=origin)
+        draw_frame(draw, floor[0], floor[1], origin=origin)
+        return image
+
+
+def _tile_key(store, indices, px, colliding_mask, options, tx, ty):
+    """タイルの描画結果を決める内容（タイルに掛かる設備だけ）のハッシュ"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((options, tx, ty)).encode())
+    digest.update(indices.tobytes())
+    digest.update(np.ascontiguousarray(px[:, indices]).tobytes())
+    digest.update(store.rotation[indices].tobytes())
+    digest.update(colliding_mask[indices].tobytes())
+    colors = store.table("color")
+    digest.update("\0".join(colors[code] for code in store.codes("color")[indices].tolist()).encode())
+    if options[4]:
+        labels = store.table("label")
+        digest.update("\0".join(labels[code] for code in store.codes("label")[indices].tolist()).encode())
+    return digest.hexdigest()